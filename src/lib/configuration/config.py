@@ -9,10 +9,22 @@ def print_metric_ingest_input():
     return os.environ.get("PRINT_METRIC_INGEST_INPUT", "FALSE").upper() in ["TRUE", "YES"]
 
 
+def metric_ingest_streaming_enabled():
+    return os.environ.get("METRIC_INGEST_STREAMING_ENABLED", "FALSE").upper() in ["TRUE", "YES"]
+
+
+def metric_ingest_gzip_enabled():
+    return os.environ.get("METRIC_INGEST_GZIP_ENABLED", "FALSE").upper() in ["TRUE", "YES"]
+
+
 def scoping_project_support_enabled():
     return os.environ.get("SCOPING_PROJECT_SUPPORT_ENABLED", "FALSE").upper() in ["TRUE", "YES"]
 
 
+def metrics_scope_query_enabled():
+    return os.environ.get("METRICS_SCOPE_QUERY_ENABLED", "FALSE").upper() in ["TRUE", "YES"]
+
+
 def excluded_projects():
     return os.environ.get("EXCLUDED_PROJECTS", "")
 
@@ -21,6 +33,10 @@ def project_id():
     return os.environ.get("GCP_PROJECT")
 
 
+def metric_watermark_file():
+    return os.environ.get("METRIC_WATERMARK_FILE", "")
+
+
 def credentials_path():
     return os.environ['GOOGLE_APPLICATION_CREDENTIALS'] if 'GOOGLE_APPLICATION_CREDENTIALS' in os.environ.keys() else ""
 
@@ -12,7 +12,9 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
+import asyncio
 import os
+import time
 import traceback
 from datetime import datetime, timedelta
 from queue import Queue
@@ -20,6 +22,9 @@ from typing import Optional, Dict
 
 import aiohttp
 
+from lib.configuration import config
+from lib.fetch_scheduler import FetchScheduler
+from lib.ingest_retry import RetryBudget
 from lib.sfm.for_logs.log_sfm_metric_descriptor import LOG_SELF_MONITORING_METRIC_MAP
 from lib.sfm.for_logs.log_sfm_metrics import LogSelfMonitoring
 from lib.sfm.for_metrics.metric_descriptor import SELF_MONITORING_METRIC_MAP
@@ -305,6 +310,9 @@ class MetricsContext(SfmContext):
             SfmKeys.fetch_gcp_data_execution_time: SFMMetricFetchGCPDataExecutionTime(),
             SfmKeys.push_to_dynatrace_execution_time: SFMMetricPushToDynatraceExecutionTime(),
             SfmKeys.dynatrace_request_count: SFMMetricDynatraceRequestCount(),
+            SfmKeys.fetch_queue_wait_time: SFMMetricFetchQueueWaitTime(),
+            SfmKeys.fetch_in_flight_requests: SFMMetricFetchInFlightRequests(),
+            SfmKeys.dynatrace_ingest_compression_ratio: SFMMetricDynatraceIngestCompressionRatio(),
         }
         self.dynatrace_connectivity = None
         self.dt_session = dt_session
@@ -313,7 +321,23 @@ class MetricsContext(SfmContext):
         self.print_metric_ingest_input = print_metric_ingest_input
         self.self_monitoring_enabled = self_monitoring_enabled
         self.metric_ingest_batch_size = get_int_environment_value("METRIC_INGEST_BATCH_SIZE", 1000)
+        self.metrics_scope_query_partitions = get_int_environment_value("METRICS_SCOPE_QUERY_PARTITIONS", 1)
+        self.metric_ingest_streaming_queue_size = get_int_environment_value("METRIC_INGEST_STREAMING_QUEUE_SIZE", 10)
+        self.metric_ingest_max_concurrent_requests = get_int_environment_value("METRIC_INGEST_MAX_CONCURRENT_REQUESTS", 50)
+        self.metric_ingest_gzip_enabled = config.metric_ingest_gzip_enabled()
+        self.metric_ingest_max_retries = get_int_environment_value("METRIC_INGEST_MAX_RETRIES", 3)
+        # retries must not overrun the polling interval
+        self.ingest_retry_budget = RetryBudget(
+            max_retries=get_int_environment_value("METRIC_INGEST_RETRY_BUDGET", 100),
+            deadline=time.time() + execution_interval_seconds
+        )
+        self._ingest_semaphore: Optional[asyncio.Semaphore] = None
         self.use_x_goog_user_project_header = {project_id_owner: False}
+        self.fetch_scheduler = FetchScheduler(
+            global_limit=get_int_environment_value("GCP_MAX_CONCURRENT_REQUESTS", 100),
+            project_limit=get_int_environment_value("GCP_MAX_CONCURRENT_REQUESTS_PER_PROJECT", 20),
+            api_limit=get_int_environment_value("GCP_MAX_CONCURRENT_REQUESTS_PER_API", 50)
+        )
 
         self.update_dt_connectivity_status(DynatraceConnectivity.Ok)
         self.start_processing_timestamp = 0
@@ -323,6 +347,12 @@ class MetricsContext(SfmContext):
         self.sfm[SfmKeys.dynatrace_connectivity].update(status)
         self.dynatrace_connectivity = status
 
+    def ingest_semaphore(self) -> asyncio.Semaphore:
+        # created lazily, so it is bound to the event loop running the polling
+        if self._ingest_semaphore is None:
+            self._ingest_semaphore = asyncio.Semaphore(max(1, self.metric_ingest_max_concurrent_requests))
+        return self._ingest_semaphore
+
     def create_gcp_request_headers(self, project_id: str) -> Dict:
         headers = {
             "Accept": "application/json",
@@ -12,16 +12,19 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
+import asyncio
 import base64
 import json
 import os
 import time
+from typing import Optional, Tuple, Callable, Awaitable, Dict
 
 import jwt
 from aiohttp import ClientSession
 
+from lib.clientsession_provider import init_gcp_client_session
 from lib.configuration import config
-from lib.context import LoggingContext
+from lib.context import LoggingContext, get_int_environment_value
 
 
 _METADATA_ROOT = config.gcp_metadata_url()
@@ -36,13 +39,30 @@ _DYNATRACE_ACCESS_KEY_SECRET_NAME = config.dynatrace_access_key_secret_name()
 _DYNATRACE_URL_SECRET_NAME = config.dynatrace_url_secret_name()
 _DYNATRACE_LOG_INGEST_URL_SECRET_NAME = config.dynatrace_log_ingest_url_secret_name()
 
+TOKEN_DEFAULT_LIFETIME_SECONDS = 60 * 60
+TOKEN_REFRESH_BEFORE_EXPIRY_SECONDS = 5 * 60
+
 
 async def fetch_dynatrace_api_key(gcp_session: ClientSession, project_id: str, token: str, ):
-    return await fetch_secret(gcp_session, project_id, token, _DYNATRACE_ACCESS_KEY_SECRET_NAME)
+    return await _secret_cache.get(gcp_session, project_id, token, _DYNATRACE_ACCESS_KEY_SECRET_NAME)
 
 
 async def fetch_dynatrace_url(gcp_session: ClientSession, project_id: str, token: str, ):
-    return await fetch_secret(gcp_session, project_id, token, _DYNATRACE_URL_SECRET_NAME)
+    return await _secret_cache.get(gcp_session, project_id, token, _DYNATRACE_URL_SECRET_NAME)
+
+
+def invalidate_dynatrace_secrets():
+    """
+    Cached Dynatrace URL and API key are fetched again on next use, e.g. after Dynatrace rejected the API key
+    """
+    _secret_cache.invalidate()
+
+
+def invalidate_gcp_token():
+    """
+    Cached access token is fetched again on next use, e.g. after GCP API rejected it with 401
+    """
+    _token_provider.invalidate()
 
 
 def get_dynatrace_api_key_from_env():
@@ -75,24 +95,76 @@ async def fetch_secret(session: ClientSession, project_id: str, token: str, secr
                         .format(name=secret_name, response_json=response_json))
 
 
+class SecretCache:
+    """
+    Caches secret values for ttl_seconds. Concurrent callers share single in-flight fetch of the secret.
+    When the secret can't be fetched after ttl passed (e.g. Secret Manager outage), last known value is used.
+    """
+
+    def __init__(self, fetch: Callable[[ClientSession, str, str, str], Awaitable[str]], ttl_seconds: int):
+        self._fetch = fetch
+        self.ttl_seconds = ttl_seconds
+        self._values: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._in_flight_fetches: Dict[Tuple[str, str], asyncio.Task] = {}
+
+    async def get(self, session: ClientSession, project_id: str, token: str, secret_name: str) -> str:
+        key = (project_id, secret_name)
+        cached = self._values.get(key, None)
+        if cached is not None and time.time() - cached[1] < self.ttl_seconds:
+            return cached[0]
+
+        fetch_task = self._in_flight_fetches.get(key, None)
+        # tasks are bound to event loop, fetch started by other (e.g. already finished) loop can't be awaited
+        if fetch_task is None or fetch_task.done() or fetch_task.get_loop() is not asyncio.get_event_loop():
+            fetch_task = asyncio.ensure_future(self._fetch_and_store(key, session, token))
+            self._in_flight_fetches[key] = fetch_task
+
+        try:
+            # shielded, so cancellation of single caller does not cancel fetch awaited by other callers
+            return await asyncio.shield(fetch_task)
+        except Exception as e:
+            if cached is None:
+                raise
+            _secrets_logging_context.error(f"Failed to refresh secret {secret_name}, will use last known value; {e}")
+            return cached[0]
+
+    def invalidate(self):
+        self._values.clear()
+
+    async def _fetch_and_store(self, key: Tuple[str, str], session: ClientSession, token: str) -> str:
+        project_id, secret_name = key
+        value = await self._fetch(session, project_id, token, secret_name)
+        self._values[key] = (value, time.time())
+        return value
+
+
+_secrets_logging_context = LoggingContext("SECRETS")
+_secret_cache = SecretCache(fetch_secret, get_int_environment_value("SECRET_CACHE_TTL_SECONDS", 300))
+
+
 async def create_default_service_account_token(context: LoggingContext, session: ClientSession):
     """
     For reference check out https://github.com/googleapis/google-auth-library-python/tree/master/google/auth/compute_engine
     :param session:
     :return:
     """
+    token, _ = await _fetch_default_service_account_token(context, session)
+    return token
+
+
+async def _fetch_default_service_account_token(context: LoggingContext, session: ClientSession) -> Tuple[Optional[str], float]:
     url = _METADATA_ROOT + "/instance/service-accounts/{0}/token".format("default")
     try:
         response = await session.get(url, headers=_METADATA_HEADERS)
         if response.status >= 300:
             body = await response.text()
             context.log(f"Failed to authorize with Service Account from Metadata Service, response is {response.status} => {body}")
-            return None
+            return None, 0
         response_json = await response.json()
-        return response_json["access_token"]
+        return response_json["access_token"], response_json.get("expires_in", TOKEN_DEFAULT_LIFETIME_SECONDS)
     except Exception as e:
         context.log(f"Failed to authorize with Service Account from Metadata Service due to '{e}'")
-        return None
+        return None, 0
 
 
 def get_project_id_from_environment():
@@ -100,6 +172,13 @@ def get_project_id_from_environment():
 
 
 async def create_token(context: LoggingContext, session: ClientSession):
+    """
+    Returns access token cached for the whole process, new token is requested only when cached one expires
+    """
+    return await _token_provider.get_token(context, session)
+
+
+async def _fetch_token(context: LoggingContext, session: ClientSession) -> Tuple[Optional[str], float]:
     credentials_path = config.credentials_path()
 
     if credentials_path:
@@ -107,7 +186,7 @@ async def create_token(context: LoggingContext, session: ClientSession):
         with open(credentials_path) as key_file:
             credentials_data = json.load(key_file)
 
-        return await get_token(
+        return await _get_token_with_expiry(
             key=credentials_data['private_key'],
             service=credentials_data['client_email'],
             uri=credentials_data['token_uri'],
@@ -115,10 +194,15 @@ async def create_token(context: LoggingContext, session: ClientSession):
         )
     else:
         context.log("Trying to use default service account")
-        return await create_default_service_account_token(context, session)
+        return await _fetch_default_service_account_token(context, session)
 
 
 async def get_token(key: str, service: str, uri: str, session: ClientSession):
+    token, _ = await _get_token_with_expiry(key, service, uri, session)
+    return token
+
+
+async def _get_token_with_expiry(key: str, service: str, uri: str, session: ClientSession) -> Tuple[str, float]:
     now = int(time.time())
 
     assertion = {
@@ -132,7 +216,65 @@ async def get_token(key: str, service: str, uri: str, session: ClientSession):
     request = {'grant_type': 'urn:ietf:params:oauth:grant-type:jwt-bearer', 'assertion': assertion_signed}
     async with session.post(uri, data=request) as resp:
         response = await resp.json()
-        return response["access_token"]
+        return response["access_token"], response.get("expires_in", TOKEN_DEFAULT_LIFETIME_SECONDS)
+
+
+class TokenProvider:
+    """
+    Caches access token until its expiry. Shortly before the expiry cached token is still returned
+    and new one is requested in background. Concurrent callers share single in-flight request.
+    """
+
+    def __init__(self, fetch_token: Callable[[LoggingContext, ClientSession], Awaitable[Tuple[Optional[str], float]]]):
+        self._fetch_token = fetch_token
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    async def get_token(self, context: LoggingContext, session: ClientSession) -> Optional[str]:
+        now = time.time()
+        if self._token and now < self._expires_at - TOKEN_REFRESH_BEFORE_EXPIRY_SECONDS:
+            return self._token
+        if self._token and now < self._expires_at:
+            if self._in_flight_refresh() is None:
+                self._refresh_task = asyncio.ensure_future(self._refresh_in_background(context))
+            return self._token
+
+        refresh_task = self._in_flight_refresh()
+        if refresh_task is None:
+            refresh_task = asyncio.ensure_future(self._refresh(context, session))
+            self._refresh_task = refresh_task
+        # shielded, so cancellation of single caller does not cancel refresh awaited by other callers
+        return await asyncio.shield(refresh_task)
+
+    def invalidate(self):
+        self._token = None
+        self._expires_at = 0.0
+
+    def _in_flight_refresh(self) -> Optional[asyncio.Task]:
+        # tasks are bound to event loop, refresh started by other (e.g. already finished) loop can't be awaited
+        if self._refresh_task is not None and not self._refresh_task.done() \
+                and self._refresh_task.get_loop() is asyncio.get_event_loop():
+            return self._refresh_task
+        return None
+
+    async def _refresh(self, context: LoggingContext, session: ClientSession) -> Optional[str]:
+        token, expires_in = await self._fetch_token(context, session)
+        if token:
+            self._token = token
+            self._expires_at = time.time() + float(expires_in)
+        return token
+
+    async def _refresh_in_background(self, context: LoggingContext):
+        # session of the caller can be closed before background refresh finishes
+        try:
+            async with init_gcp_client_session() as session:
+                await self._refresh(context, session)
+        except Exception as e:
+            context.log(f"Failed to refresh access token in background, cached token will be used until expiry; {e}")
+
+
+_token_provider = TokenProvider(_fetch_token)
 
 
 async def get_all_accessible_projects(context: LoggingContext, session: ClientSession, token: str):
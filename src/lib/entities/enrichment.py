@@ -0,0 +1,61 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import os
+from typing import Any
+
+from lib.context import LoggingContext
+from lib.entities.model import Entity
+from lib.metrics import DimensionValue, EntityEnrichment
+
+MAX_DIMENSION_NAME_LENGTH = os.environ.get("MAX_DIMENSION_NAME_LENGTH", 100)
+MAX_DIMENSION_VALUE_LENGTH = os.environ.get("MAX_DIMENSION_VALUE_LENGTH", 250)
+
+
+def create_dimension(name: str, value: Any, context: LoggingContext = LoggingContext(None)) -> DimensionValue:
+    string_value = str(value)
+
+    if len(name) > MAX_DIMENSION_NAME_LENGTH:
+        context.log(f'MINT rejects dimension names longer that {MAX_DIMENSION_NAME_LENGTH} chars. Dimension name \"{name}\" "has been truncated')
+        name = name[:MAX_DIMENSION_NAME_LENGTH]
+    if len(string_value) > MAX_DIMENSION_VALUE_LENGTH:
+        context.log(f'MINT rejects dimension values longer that {MAX_DIMENSION_VALUE_LENGTH} chars. Dimension value \"{string_value}\" has been truncated')
+        string_value = string_value[:MAX_DIMENSION_VALUE_LENGTH]
+
+    return DimensionValue(name, string_value)
+
+
+def create_entity_enrichment(entity: Entity, context: LoggingContext = LoggingContext(None)) -> EntityEnrichment:
+    entity_dimension_prefix = "entity."
+    dimension_values = []
+    if entity.dns_names:
+        dimension_values.append(create_dimension(
+            name=entity_dimension_prefix + "dns_name",
+            value=entity.dns_names[0],
+            context=context
+        ))
+
+    if entity.ip_addresses:
+        dimension_values.append(create_dimension(
+            name=entity_dimension_prefix + "ip_address",
+            value=entity.ip_addresses[0],
+            context=context
+        ))
+
+    for cd_property in entity.properties:
+        dimension_values.append(create_dimension(
+            name=entity_dimension_prefix + cd_property.key.replace(" ", "_").lower(),
+            value=cd_property.value,
+            context=context
+        ))
+    return EntityEnrichment.of(dimension_values)
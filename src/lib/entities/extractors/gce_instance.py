@@ -12,14 +12,13 @@
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
 
-import asyncio
 import re
 from functools import partial
 from typing import Any, Dict, Iterable, Text
 
 from lib.context import MetricsContext
 from lib.entities.decorator import entity_extractor
-from lib.entities.google_api import generic_paging, fetch_zones
+from lib.entities.google_api import generic_paging
 from lib.entities.ids import get_func_create_entity_id, LabelToApiRspMapping
 from lib.entities.model import CdProperty, Entity
 from lib.metrics import GCPService
@@ -68,18 +67,20 @@ def _get_properties(rsp: Dict[Text, Any]) -> Iterable[CdProperty]:
     ]
 
 
-def _cloud_function_resp_to_monitored_entities(page: Dict[Text, Any], svc_def: GCPService):
-    """ Create CustomDevice instanace from google api response."""
-    items = page.get("items", [])
-    if not items:
-        return []
+def _aggregated_list_resp_to_monitored_entities(page: Dict[Text, Any], project_id: str, svc_def: GCPService):
+    """ Create CustomDevice instances from single page of instances/aggregatedList response."""
+    entities = []
+    # items are keyed by scope, e.g. zones/europe-north1-a; scopes without instances contain only warning
+    for scope, scoped_list in page.get("items", {}).items():
+        instances = scoped_list.get("instances", [])
+        if instances:
+            zone_id = scope.split("/")[-1]
+            entities.extend(_instances_to_monitored_entities(instances, project_id, zone_id, svc_def))
+    return entities
 
-    page_id = page.get("id", None)
-    if page_id is None:
-        return []
-    project_id = _extract_label(page_id, 1)
-    zone_id = _extract_label(page_id, 2)
 
+def _instances_to_monitored_entities(instances: Iterable[Dict[Text, Any]], project_id: str, zone_id: str,
+                                     svc_def: GCPService):
     mappings = {
         "resource.labels.instance_id": lambda x: x.get("id", ""),
         "resource.labels.zone": lambda x: zone_id,
@@ -87,7 +88,7 @@ def _cloud_function_resp_to_monitored_entities(page: Dict[Text, Any], svc_def: G
     }
 
     entities = []
-    for cd in items:
+    for cd in instances:
         ips = [
             interface.get("networkIP", "")
             for interface
@@ -112,18 +113,7 @@ def _cloud_function_resp_to_monitored_entities(page: Dict[Text, Any], svc_def: G
 
 @entity_extractor("gce_instance", "compute.googleapis.com")
 async def get_gce_instance_entity(ctx: MetricsContext, project_id: str, svc_def: GCPService) -> Iterable[Entity]:
-    """ Retrieve entity info on GCP cloud functions from google api. """
-    zones = await fetch_zones(ctx, project_id)
-
-    tasks = []
-    for zone in zones:
-        url = f"{_GCP_COMPUTE_ENDPOINT}/compute/v1/projects/{project_id}/zones/{zone}/instances"
-        mapper_func = partial(_cloud_function_resp_to_monitored_entities, svc_def=svc_def)
-        tasks.append(generic_paging(project_id, url, ctx, mapper_func))
-    results = await asyncio.gather(*tasks, return_exceptions=True)
-
-    all_results = []
-    for result in results:
-        all_results.extend(result)
-
-    return all_results
+    """ Retrieve entity info on GCE instances of all zones from google api. """
+    url = f"{_GCP_COMPUTE_ENDPOINT}/compute/v1/projects/{project_id}/aggregated/instances"
+    mapper_func = partial(_aggregated_list_resp_to_monitored_entities, project_id=project_id, svc_def=svc_def)
+    return await generic_paging(project_id, url, ctx, mapper_func)
@@ -16,10 +16,9 @@
 from typing import Any, Callable, Dict, List, Text, Optional
 
 from lib.context import MetricsContext
+from lib.credentials import invalidate_gcp_token
 from lib.entities.model import Entity
 
-_GCP_COMPUTE_ENDPOINT = "https://compute.googleapis.com"
-
 
 async def generic_paging(
         project_id: str,
@@ -50,6 +49,8 @@ async def generic_paging(
             return entities
 
         if resp.status >= 400:
+            if resp.status == 401:
+                invalidate_gcp_token()
             ctx.log(project_id, f'Failed to retrieve information from googleapis. {url} {page}')
             return entities
 
@@ -64,25 +65,3 @@ async def generic_paging(
             params["pageToken"] = page.get("nextPageToken", None)
 
     return entities
-
-
-async def fetch_zones(
-        context: MetricsContext,
-        project_id: str
-) -> List[str]:
-    headers = context.create_gcp_request_headers(project_id)
-
-    resp = await context.gcp_session.request(
-        "GET",
-        params={},
-        url=f"{_GCP_COMPUTE_ENDPOINT}/compute/v1/projects/{project_id}/zones",
-        headers=headers,
-        raise_for_status=True
-    )
-
-    response_json = await resp.json()
-    if resp.status != 200:
-        raise Exception(f"Failed to fetch available zones, response is {response_json}")
-
-    zone_items = response_json.get("items", [])
-    return [zone["name"] for zone in zone_items]
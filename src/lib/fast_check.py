@@ -24,15 +24,29 @@ from aiohttp import ClientSession
 
 from lib.context import LoggingContext, get_should_require_valid_certificate
 from lib.instance_metadata import InstanceMetadata
-from lib.logs.dynatrace_client import send_logs
-from lib.logs.log_forwarder import create_logs_context
+from lib.logs.dynatrace_client import send_logs, create_logs_context
 
 service_name_pattern = re.compile(r"^projects\/([\w,-]*)\/services\/([\w,-.]*)$")
 
 METRICS_CONFIGURATION_FLAGS = [
     "PRINT_METRIC_INGEST_INPUT",
     "GOOGLE_APPLICATION_CREDENTIALS",
+    "SECRET_CACHE_TTL_SECONDS",
     "METRIC_INGEST_BATCH_SIZE",
+    "METRIC_INGEST_STREAMING_ENABLED",
+    "METRIC_INGEST_STREAMING_QUEUE_SIZE",
+    "METRIC_INGEST_MAX_CONCURRENT_REQUESTS",
+    "METRIC_INGEST_GZIP_ENABLED",
+    "METRIC_INGEST_MAX_RETRIES",
+    "METRIC_INGEST_RETRY_BUDGET",
+    "METRIC_INGEST_SPILL_QUEUE_MAX_LINES",
+    "METRICS_SCOPE_QUERY_ENABLED",
+    "METRICS_SCOPE_QUERY_PARTITIONS",
+    "SHARDING_REPLICA_COUNT",
+    "SHARDING_REPLICA_INDEX",
+    "METRICS_POLLING_SPREAD_PERCENT",
+    "METRIC_WATERMARK_FILE",
+    "METRIC_WATERMARK_MAX_CATCH_UP_MIN",
     "GCP_PROJECT",
     "REQUIRE_VALID_CERTIFICATE",
     "SERVICE_USAGE_BOOKING",
@@ -40,7 +54,12 @@ METRICS_CONFIGURATION_FLAGS = [
     "SELF_MONITORING_ENABLED",
     "QUERY_INTERVAL_MIN",
     "SCOPING_PROJECT_SUPPORT_ENABLED",
+    "PROJECT_DISCOVERY_REFRESH_INTERVAL_MIN",
+    "TOPOLOGY_CACHE_TTL_MIN",
     "KEEP_REFRESHING_EXTENSIONS_CONFIG",
+    "GCP_MAX_CONCURRENT_REQUESTS",
+    "GCP_MAX_CONCURRENT_REQUESTS_PER_PROJECT",
+    "GCP_MAX_CONCURRENT_REQUESTS_PER_API",
 ]
 
 LOGS_CONFIGURATION_FLAGS = [
@@ -56,7 +75,18 @@ LOGS_CONFIGURATION_FLAGS = [
     "LOGS_SUBSCRIPTION_ID",
     "DYNATRACE_LOG_INGEST_SENDING_WORKER_EXECUTION_PERIOD",
     "SELF_MONITORING_ENABLED",
-    "USE_PROXY"
+    "USE_PROXY",
+    "LOGS_STREAMING_PULL_ENABLED",
+    "LOGS_STREAMING_PULL_MAX_OUTSTANDING_MESSAGES",
+    "LOGS_STREAMING_PULL_MAX_OUTSTANDING_BYTES",
+    "LOGS_STREAMING_PULL_SENDING_QUEUE_SIZE",
+    "LOGS_STREAMING_PULL_SENDING_WORKERS",
+    "LOGS_PROCESSING_PROCESSES",
+    "DYNATRACE_LOG_INGEST_CONNECTION_POOL_SIZE",
+    "LOGS_SENDING_WORKERS",
+    "LOGS_SENDING_MAX_IN_FLIGHT_BATCHES",
+    "LOGS_SUBSCRIPTION_ACK_DEADLINE_SECONDS",
+    "LOGS_ACK_LEASE_EXTENSION_SECONDS"
 ]
 
 REQUIRED_SERVICES = [
@@ -0,0 +1,73 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+
+class FetchScheduler:
+    """
+    Bounds the number of concurrent GCP Monitoring API requests issued during single polling.
+
+    Request has to acquire slot of its project, then slot of its API and finally global slot.
+    Project slots are acquired first, so single project can never queue more than its per project limit
+    for the global slots - waiting queue for global slots is shared fairly between all projects.
+    """
+
+    def __init__(self, global_limit: int, project_limit: int, api_limit: int):
+        self.global_limit = max(1, global_limit)
+        self.project_limit = max(1, project_limit)
+        self.api_limit = max(1, api_limit)
+        self.in_flight = 0
+        # semaphores are created lazily, so they are bound to the event loop running the polling
+        self._global_semaphore: Optional[asyncio.Semaphore] = None
+        self._project_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._api_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def request_slot(self, project_id: str, api: str):
+        """
+        Waits for free slot for single request, yields time [s] spent waiting in the queue
+        """
+        wait_start = time.time()
+        async with self._project_semaphore(project_id), self._api_semaphore(api), self._get_global_semaphore():
+            self.in_flight += 1
+            try:
+                yield time.time() - wait_start
+            finally:
+                self.in_flight -= 1
+
+    def _get_global_semaphore(self) -> asyncio.Semaphore:
+        if self._global_semaphore is None:
+            self._global_semaphore = asyncio.Semaphore(self.global_limit)
+        return self._global_semaphore
+
+    def _project_semaphore(self, project_id: str) -> asyncio.Semaphore:
+        if project_id not in self._project_semaphores:
+            self._project_semaphores[project_id] = asyncio.Semaphore(self.project_limit)
+        return self._project_semaphores[project_id]
+
+    def _api_semaphore(self, api: str) -> asyncio.Semaphore:
+        if api not in self._api_semaphores:
+            self._api_semaphores[api] = asyncio.Semaphore(self.api_limit)
+        return self._api_semaphores[api]
+
+
+def extract_api_name(google_metric: str) -> str:
+    """
+    e.g. compute.googleapis.com/instance/cpu/usage_time > compute.googleapis.com
+    """
+    gcp_api_last_index = google_metric.find("/")
+    return google_metric[:gcp_api_last_index]
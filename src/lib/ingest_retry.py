@@ -0,0 +1,104 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import random
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, List, Tuple, Deque
+
+from lib.metrics import IngestLine
+
+BACKOFF_BASE_SECONDS = 1
+BACKOFF_MAX_SECONDS = 30
+RETRY_AFTER_MAX_SECONDS = 60
+
+
+class RetryableIngestException(Exception):
+    def __init__(self, status: int, retry_after: Optional[float]):
+        super().__init__(f"Dynatrace responded with retryable status {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+def parse_retry_after(retry_after: Optional[str]) -> Optional[float]:
+    """
+    Retry-After header can contain either number of seconds or HTTP date
+    """
+    if not retry_after:
+        return None
+    try:
+        if retry_after.strip().isdigit():
+            seconds = float(retry_after)
+        else:
+            seconds = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+    except (TypeError, ValueError):
+        return None
+    return min(max(seconds, 0), RETRY_AFTER_MAX_SECONDS)
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Exponential backoff with full jitter
+    """
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt)))
+
+
+class RetryBudget:
+    """
+    Limits retries of single polling: total number of retries for the tenant and
+    the deadline after which retry would overrun the polling interval
+    """
+
+    def __init__(self, max_retries: int, deadline: float):
+        self.remaining_retries = max_retries
+        self.deadline = deadline
+
+    def try_acquire(self, delay: float) -> bool:
+        if self.remaining_retries <= 0 or time.time() + delay > self.deadline:
+            return False
+        self.remaining_retries -= 1
+        return True
+
+
+class IngestSpillQueue:
+    """
+    Keeps batches which could not be pushed in current polling, so they can be pushed in the next one.
+    When max number of lines is exceeded, the oldest batches are dropped.
+    """
+
+    def __init__(self, max_lines: int):
+        self.max_lines = max_lines
+        self.lines_count = 0
+        self._batches: Deque[Tuple[str, List[IngestLine]]] = deque()
+
+    def put(self, project_id: str, lines_batch: List[IngestLine]) -> List[Tuple[str, int]]:
+        """
+        Returns number of lines dropped per project
+        """
+        self._batches.append((project_id, lines_batch))
+        self.lines_count += len(lines_batch)
+
+        dropped = []
+        while self.lines_count > self.max_lines and self._batches:
+            dropped_project_id, dropped_batch = self._batches.popleft()
+            self.lines_count -= len(dropped_batch)
+            dropped.append((dropped_project_id, len(dropped_batch)))
+        return dropped
+
+    def drain(self) -> List[Tuple[str, List[IngestLine]]]:
+        batches = list(self._batches)
+        self._batches.clear()
+        self.lines_count = 0
+        return batches
@@ -0,0 +1,137 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, NamedTuple, Tuple, Optional
+
+from google.cloud.pubsub_v1 import SubscriberClient
+
+from lib.context import LoggingContext
+from lib.logs.log_forwarder_variables import ACK_LEASE_EXTENSION_SECONDS, SUBSCRIPTION_ACK_DEADLINE_SECONDS
+from lib.utilities import chunks
+
+# request size limit is 524288, but we are not able to easily control size of created protobuf
+# empiric test indicates that ack_ids have around 200-220 chars. We can safely assume that ack id is never longer
+# than 256 chars, we split ack ids into chunks with no more than 2048 ack_id's
+ACK_IDS_CHUNK_SIZE = 2048
+
+# max ack deadline accepted by Pub/Sub
+MAX_ACK_DEADLINE_SECONDS = 600
+LEASE_CHECK_PERIOD_SECONDS = 10
+# leases expiring sooner are extended, it has to be longer than check period
+LEASE_RENEWAL_MARGIN_SECONDS = 30
+# messages leased for longer are not extended anymore and get redelivered, in case they were never released
+LEASE_MAX_DURATION_SECONDS = 3600
+
+
+def chunk_ack_ids(ack_ids: List[str]) -> List[List[str]]:
+    if len(ack_ids) < ACK_IDS_CHUNK_SIZE:
+        return [ack_ids]
+    return chunks(ack_ids, ACK_IDS_CHUNK_SIZE)
+
+
+class _Lease(NamedTuple):
+    subscriber_client: SubscriberClient
+    subscription_path: str
+    leased_since: float
+    expires_at: float
+
+
+class AckLeaseManager:
+    """
+    Keeps ack deadline of pulled messages which are not acked yet (waiting in worker batch or being sent)
+    from expiring, so Pub/Sub doesn't redeliver them to be processed and sent again.
+
+    Leases of pulled messages are tracked from the pull until their batch is flushed. Leases which are about to expire
+    are extended in background with batched modify_ack_deadline requests.
+    """
+
+    def __init__(self, extension_seconds: int, subscription_ack_deadline_seconds: int):
+        if 0 < extension_seconds <= LEASE_RENEWAL_MARGIN_SECONDS:
+            # lease would expire before next check, so it would be extended again on every check
+            raise ValueError(f"Ack lease extension has to be longer than {LEASE_RENEWAL_MARGIN_SECONDS} seconds, "
+                             f"got {extension_seconds}")
+        self.extension_seconds = min(extension_seconds, MAX_ACK_DEADLINE_SECONDS)
+        self.subscription_ack_deadline_seconds = subscription_ack_deadline_seconds
+        self._leases: Dict[str, _Lease] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._logging_context = LoggingContext("AckLeases")
+
+    @property
+    def enabled(self) -> bool:
+        return self.extension_seconds > 0
+
+    def lease(self, subscriber_client: SubscriberClient, subscription_path: str, ack_ids: List[str]):
+        if not self.enabled or not ack_ids:
+            return
+        now = time.monotonic()
+        lease = _Lease(subscriber_client, subscription_path, now, now + self.subscription_ack_deadline_seconds)
+        with self._lock:
+            for ack_id in ack_ids:
+                self._leases[ack_id] = lease
+            self._start_extending()
+
+    def release(self, ack_ids: List[str]):
+        """
+        Messages were acked or their batch failed, in which case Pub/Sub redelivers them after the lease expires
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            for ack_id in ack_ids:
+                self._leases.pop(ack_id, None)
+
+    @property
+    def outstanding(self) -> int:
+        with self._lock:
+            return len(self._leases)
+
+    def extend_expiring(self, now: float):
+        to_extend: Dict[Tuple[SubscriberClient, str], List[str]] = defaultdict(list)
+        with self._lock:
+            for ack_id, lease in list(self._leases.items()):
+                if now - lease.leased_since > LEASE_MAX_DURATION_SECONDS:
+                    del self._leases[ack_id]
+                elif lease.expires_at - now < LEASE_RENEWAL_MARGIN_SECONDS:
+                    to_extend[(lease.subscriber_client, lease.subscription_path)].append(ack_id)
+                    self._leases[ack_id] = lease._replace(expires_at=now + self.extension_seconds)
+
+        for (subscriber_client, subscription_path), ack_ids in to_extend.items():
+            for ack_ids_chunk in chunk_ack_ids(ack_ids):
+                try:
+                    subscriber_client.modify_ack_deadline(request={
+                        "subscription": subscription_path,
+                        "ack_ids": ack_ids_chunk,
+                        "ack_deadline_seconds": self.extension_seconds
+                    })
+                except Exception:
+                    self._logging_context.exception(f"Failed to extend ack deadline of {len(ack_ids_chunk)} messages")
+
+    def _start_extending(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ack-leases", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(LEASE_CHECK_PERIOD_SECONDS)
+            try:
+                self.extend_expiring(time.monotonic())
+            except Exception:
+                self._logging_context.exception("Failed to extend ack leases")
+
+
+ack_lease_manager = AckLeaseManager(ACK_LEASE_EXTENSION_SECONDS, SUBSCRIPTION_ACK_DEADLINE_SECONDS)
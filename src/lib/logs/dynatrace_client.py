@@ -12,17 +12,19 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-import json
 import ssl
 import time
-import urllib
-from typing import List, Dict, Tuple
+from queue import Queue
+from typing import List
 from urllib.error import HTTPError
 from urllib.parse import urlparse
-from urllib.request import Request
 
 from lib.context import get_should_require_valid_certificate, get_int_environment_value, \
     DynatraceConnectivity, LogsContext
+from lib.credentials import get_dynatrace_api_key_from_env, get_dynatrace_log_ingest_url_from_env, \
+    get_project_id_from_environment
+from lib.logs.http_connection_pool import HttpConnectionPool
+from lib.logs.log_forwarder_variables import CONNECTION_POOL_SIZE
 from lib.logs.log_self_monitoring import LogSelfMonitoring, aggregate_self_monitoring_metrics, put_sfm_into_queue
 from lib.logs.logs_processor import LogProcessingJob
 
@@ -33,6 +35,23 @@ if not get_should_require_valid_certificate():
 
 _TIMEOUT = get_int_environment_value("DYNATRACE_TIMEOUT_SECONDS", 30)
 
+# shared by all sending workers, so they reuse keep-alive connections instead of TCP/TLS handshake per request
+connection_pool = HttpConnectionPool(CONNECTION_POOL_SIZE, _TIMEOUT, ssl_context)
+
+
+def create_logs_context(sfm_queue: Queue):
+    dynatrace_api_key = get_dynatrace_api_key_from_env()
+    dynatrace_url = get_dynatrace_log_ingest_url_from_env()
+    project_id_owner = get_project_id_from_environment()
+
+    return LogsContext(
+        project_id_owner=project_id_owner,
+        dynatrace_api_key=dynatrace_api_key,
+        dynatrace_url=dynatrace_url,
+        scheduled_execution_id=str(int(time.time()))[-8:],
+        sfm_queue=sfm_queue
+    )
+
 
 def send_logs(context: LogsContext, logs: List[LogProcessingJob], batch: str):
     # pylint: disable=R0912
@@ -43,15 +62,19 @@ def send_logs(context: LogsContext, logs: List[LogProcessingJob], batch: str):
     try:
         encoded_body_bytes = batch.encode("UTF-8")
         context.self_monitoring.all_requests += 1
-        status, reason, response = _perform_http_request(
+        status, reason, response, reused_connection = connection_pool.request(
             method="POST",
             url=log_ingest_url,
-            encoded_body_bytes=encoded_body_bytes,
+            body=encoded_body_bytes,
             headers={
                 "Authorization": f"Api-Token {context.dynatrace_api_key}",
                 "Content-Type": "application/json; charset=utf-8"
             }
         )
+        if reused_connection:
+            context.self_monitoring.reused_connections += 1
+        else:
+            context.self_monitoring.new_connections += 1
         if status > 299:
             context.t_error(f'Log ingest error: {status}, reason: {reason}, url: {log_ingest_url}, body: "{response}"')
             if status == 400:
@@ -79,22 +102,3 @@ def send_logs(context: LogsContext, logs: List[LogProcessingJob], batch: str):
         context.self_monitoring.calculate_sending_time()
         put_sfm_into_queue(context)
 
-
-def _perform_http_request(
-        method: str,
-        url: str,
-        encoded_body_bytes: bytes,
-        headers: Dict
-) -> Tuple[int, str, str]:
-    req = Request(
-        url,
-        encoded_body_bytes,
-        headers,
-        method=method
-    )
-    try:
-        response = urllib.request.urlopen(req, context=ssl_context, timeout=_TIMEOUT)
-        return response.code, response.reason, response.read().decode("utf-8")
-    except HTTPError as e:
-        response_body = e.read().decode("utf-8")
-        return e.code, e.reason, response_body
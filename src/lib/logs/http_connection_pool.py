@@ -0,0 +1,198 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import base64
+import http.client
+import queue
+import select
+import ssl
+import threading
+import time
+import urllib.request
+from typing import Dict, Tuple, Optional, NamedTuple
+from urllib.parse import urlsplit, unquote
+
+# connections idle for longer are closed instead of reused, as server may have closed them already
+IDLE_CONNECTION_MAX_AGE_SECONDS = 30
+
+# errors of sending request through reused connection closed by the server in the meantime,
+# request is sent again with new connection. Failures after the request was sent are not repeated,
+# as the server could have already processed it
+STALE_CONNECTION_ERRORS = (BrokenPipeError, ConnectionResetError, ConnectionAbortedError)
+
+HttpConnection = http.client.HTTPConnection
+
+
+class HttpResponse(NamedTuple):
+    status: int
+    reason: str
+    body: str
+    reused_connection: bool
+
+
+class _Proxy(NamedTuple):
+    host: str
+    port: int
+    headers: Dict
+
+
+class _IdleConnection(NamedTuple):
+    connection: HttpConnection
+    idle_since: float
+
+
+class HttpConnectionPool:
+    """
+    Thread-safe pool of keep-alive connections, so sending workers reuse TCP and TLS sessions
+    instead of opening new connection for every log ingest request.
+
+    Up to pool_size idle connections are kept per origin, connections opened above that
+    (more workers sending at the same time) are closed after their request.
+    Proxy from environment (HTTP_PROXY/HTTPS_PROXY/NO_PROXY) is used the same way urllib does.
+    """
+
+    def __init__(self, pool_size: int, timeout: float, ssl_context: ssl.SSLContext):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.ssl_context = ssl_context
+        self._idle: Dict[Tuple[str, str, int], queue.LifoQueue] = {}
+        self._lock = threading.Lock()
+
+    def request(self, method: str, url: str, body: bytes, headers: Dict) -> HttpResponse:
+        split_url = urlsplit(url)
+        origin = (split_url.scheme, split_url.hostname, split_url.port or _default_port(split_url.scheme))
+        proxy = _proxy_for(split_url.scheme, split_url.hostname)
+        # plain http through proxy is sent with absolute url, https is tunneled to the origin
+        if proxy and split_url.scheme == "http":
+            target = url
+            headers = {**proxy.headers, **headers}
+        else:
+            target = _path_with_query(split_url.path, split_url.query)
+
+        connection = self._take_idle(origin)
+        reused_connection = connection is not None
+        if connection is not None:
+            try:
+                self._send_request(connection, method, target, body, headers)
+            except STALE_CONNECTION_ERRORS:
+                connection = None
+        if connection is None:
+            connection = self._connect(origin, proxy)
+            reused_connection = False
+            self._send_request(connection, method, target, body, headers)
+        return self._read_response(origin, connection, reused_connection)
+
+    def close(self):
+        with self._lock:
+            idle_queues = list(self._idle.values())
+            self._idle = {}
+        for idle_queue in idle_queues:
+            while True:
+                try:
+                    idle_queue.get_nowait().connection.close()
+                except queue.Empty:
+                    break
+
+    @staticmethod
+    def _send_request(connection: HttpConnection, method: str, target: str, body: bytes, headers: Dict):
+        try:
+            connection.request(method, target, body, headers)
+        except Exception:
+            connection.close()
+            raise
+
+    def _read_response(self, origin: Tuple[str, str, int], connection: HttpConnection,
+                       reused_connection: bool) -> HttpResponse:
+        try:
+            response = connection.getresponse()
+            response_body = response.read().decode("utf-8")
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            self._put_idle(origin, connection)
+        return HttpResponse(response.status, response.reason, response_body, reused_connection)
+
+    def _connect(self, origin: Tuple[str, str, int], proxy: Optional[_Proxy]) -> HttpConnection:
+        scheme, host, port = origin
+        connect_host, connect_port = (proxy.host, proxy.port) if proxy else (host, port)
+        if scheme == "https":
+            connection = http.client.HTTPSConnection(connect_host, connect_port, timeout=self.timeout,
+                                                     context=self.ssl_context)
+            if proxy:
+                connection.set_tunnel(host, port, proxy.headers)
+        else:
+            connection = http.client.HTTPConnection(connect_host, connect_port, timeout=self.timeout)
+        return connection
+
+    def _idle_queue(self, origin: Tuple[str, str, int]) -> queue.LifoQueue:
+        with self._lock:
+            if origin not in self._idle:
+                self._idle[origin] = queue.LifoQueue(maxsize=self.pool_size)
+            return self._idle[origin]
+
+    def _take_idle(self, origin: Tuple[str, str, int]) -> Optional[HttpConnection]:
+        idle_queue = self._idle_queue(origin)
+        while True:
+            try:
+                idle_connection = idle_queue.get_nowait()
+            except queue.Empty:
+                return None
+            if time.monotonic() - idle_connection.idle_since <= IDLE_CONNECTION_MAX_AGE_SECONDS \
+                    and not _is_dropped(idle_connection.connection):
+                return idle_connection.connection
+            idle_connection.connection.close()
+
+    def _put_idle(self, origin: Tuple[str, str, int], connection: HttpConnection):
+        try:
+            self._idle_queue(origin).put_nowait(_IdleConnection(connection, time.monotonic()))
+        except queue.Full:
+            connection.close()
+
+
+def _is_dropped(connection: HttpConnection) -> bool:
+    """
+    Idle connection is readable only if the server closed it (or sent unexpected data), either way it can't be reused
+    """
+    if connection.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([connection.sock], [], [], 0)
+    except (OSError, ValueError):
+        return True
+    return bool(readable)
+
+
+def _default_port(scheme: str) -> int:
+    return http.client.HTTPS_PORT if scheme == "https" else http.client.HTTP_PORT
+
+
+def _path_with_query(path: str, query: str) -> str:
+    path = path or "/"
+    return f"{path}?{query}" if query else path
+
+
+def _proxy_for(scheme: str, host: str) -> Optional[_Proxy]:
+    proxy_url = urllib.request.getproxies().get(scheme, None)
+    if not proxy_url or urllib.request.proxy_bypass(host):
+        return None
+    if "://" not in proxy_url:
+        proxy_url = f"http://{proxy_url}"
+    split_proxy_url = urlsplit(proxy_url)
+    headers = {}
+    if split_proxy_url.username:
+        credentials = f"{unquote(split_proxy_url.username)}:{unquote(split_proxy_url.password or '')}"
+        headers["Proxy-Authorization"] = "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+    return _Proxy(split_proxy_url.hostname, split_proxy_url.port or _default_port(split_proxy_url.scheme), headers)
@@ -17,39 +17,26 @@ import time
 from asyncio import AbstractEventLoop
 from functools import partial
 from queue import Queue
-from typing import List
+from typing import List, Iterable, Optional
 
 from google.api_core.exceptions import Forbidden
 from google.cloud import pubsub
 from google.cloud.pubsub_v1 import SubscriberClient
-from google.pubsub_v1 import PullRequest, PullResponse
+from google.pubsub_v1 import PullRequest, PullResponse, ReceivedMessage
 
-from lib.context import LoggingContext, LogsContext
-from lib.credentials import get_dynatrace_api_key_from_env, get_dynatrace_log_ingest_url_from_env, \
-    get_project_id_from_environment
+from lib.context import LoggingContext
 from lib.instance_metadata import InstanceMetadata
-from lib.logs.dynatrace_client import send_logs
+from lib.logs.ack_leases import ack_lease_manager, chunk_ack_ids
+from lib.logs.dynatrace_client import send_logs, create_logs_context
 from lib.logs.log_forwarder_variables import MAX_SFM_MESSAGES_PROCESSED, LOGS_SUBSCRIPTION_PROJECT, \
     LOGS_SUBSCRIPTION_ID, \
-    PROCESSING_WORKERS, PROCESSING_WORKER_PULL_REQUEST_MAX_MESSAGES, REQUEST_BODY_MAX_SIZE
+    PROCESSING_WORKERS, PROCESSING_WORKER_PULL_REQUEST_MAX_MESSAGES, REQUEST_BODY_MAX_SIZE, STREAMING_PULL_ENABLED
 from lib.logs.log_self_monitoring import create_sfm_worker_loop
-from lib.logs.logs_processor import _process_message
-from lib.logs.worker_state import WorkerState
-from lib.utilities import chunks
-
-
-def create_logs_context(sfm_queue: Queue):
-    dynatrace_api_key = get_dynatrace_api_key_from_env()
-    dynatrace_url = get_dynatrace_log_ingest_url_from_env()
-    project_id_owner = get_project_id_from_environment()
-
-    return LogsContext(
-        project_id_owner=project_id_owner,
-        dynatrace_api_key=dynatrace_api_key,
-        dynatrace_url=dynatrace_url,
-        scheduled_execution_id=str(int(time.time()))[-8:],
-        sfm_queue=sfm_queue
-    )
+from lib.logs.logs_processor import _process_message, LogProcessingJob
+from lib.logs.processing_pool import log_processing_pool
+from lib.logs.streaming_pull import run_streaming_pull_logs
+from lib.logs.sender_pool import log_sender_pool
+from lib.logs.worker_state import WorkerState, LogBatch
 
 
 def run_logs(logging_context: LoggingContext, instance_metadata: InstanceMetadata, asyncio_loop: AbstractEventLoop):
@@ -61,6 +48,10 @@ def run_logs(logging_context: LoggingContext, instance_metadata: InstanceMetadat
     asyncio.run_coroutine_threadsafe(create_sfm_worker_loop(sfm_queue, logging_context, instance_metadata),
                                      asyncio_loop)
 
+    if STREAMING_PULL_ENABLED:
+        run_streaming_pull_logs(sfm_queue)
+        return
+
     for i in range(0, PROCESSING_WORKERS):
         threading.Thread(target=partial(run_ack_logs, f"Worker-{i}", sfm_queue), name=f"worker-{i}").start()
 
@@ -92,67 +83,93 @@ def perform_pull(worker_state: WorkerState,
     pull_request.max_messages = PROCESSING_WORKER_PULL_REQUEST_MAX_MESSAGES
     pull_request.subscription = subscription_path
     response: PullResponse = subscriber_client.pull(pull_request)
+    ack_ids = [received_message.ack_id for received_message in response.received_messages]
+    ack_lease_manager.lease(subscriber_client, subscription_path, ack_ids)
 
-    for received_message in response.received_messages:
-        # print(f"Received: {received_message.message.data}.")
-        message_job = _process_message(sfm_queue, received_message)
-
-        if not message_job or message_job.bytes_size > REQUEST_BODY_MAX_SIZE - 2:
-            worker_state.ack_ids.append(received_message.ack_id)
-            continue
+    # leases of messages handed over to worker state are released when their batch is flushed
+    handed_over = 0
+    try:
+        for received_message, message_job in zip(response.received_messages,
+                                                 process_received_messages(sfm_queue, response.received_messages)):
+            # print(f"Received: {received_message.message.data}.")
 
-        if worker_state.should_flush(message_job):
-            perform_flush(worker_state, sfm_queue, subscriber_client, subscription_path)
+            if not message_job or message_job.bytes_size > REQUEST_BODY_MAX_SIZE - 2:
+                worker_state.ack_ids.append(received_message.ack_id)
+            else:
+                if worker_state.should_flush(message_job):
+                    perform_flush(worker_state, sfm_queue, subscriber_client, subscription_path)
 
-        worker_state.add_job(message_job, received_message.ack_id)
+                worker_state.add_job(message_job, received_message.ack_id)
+            handed_over += 1
+    except Exception:
+        # remaining messages are redelivered by Pub/Sub once their ack deadline expires
+        ack_lease_manager.release(ack_ids[handed_over:])
+        raise
 
     # check if should flush because of time
     if worker_state.should_flush():
         perform_flush(worker_state, sfm_queue, subscriber_client, subscription_path)
 
 
+def process_received_messages(sfm_queue: Queue, received_messages: List[ReceivedMessage]) \
+        -> Iterable[Optional[LogProcessingJob]]:
+    if log_processing_pool.enabled:
+        return log_processing_pool.process_messages(sfm_queue, [
+            (received_message.ack_id, received_message.message.publish_time, received_message.message.data)
+            for received_message in received_messages
+        ])
+    return (_process_message(sfm_queue, received_message) for received_message in received_messages)
+
+
 def perform_flush(worker_state: WorkerState,
                   sfm_queue: Queue,
                   subscriber_client: SubscriberClient,
                   subscription_path: str):
+    # state is reset even if we fail to flush, to AVOID getting stuck in processing the same messages
+    # over and over again and letting their acknowledgement deadline expire
+    log_batch = worker_state.take_batch()
+    if not log_batch.ack_ids:
+        return
+    if log_sender_pool.enabled:
+        # messages are acked by sender after sending, worker continues pulling in the meantime
+        log_sender_pool.submit(partial(flush_batch, log_batch, sfm_queue, subscriber_client, subscription_path))
+    else:
+        flush_batch(log_batch, sfm_queue, subscriber_client, subscription_path)
+
+
+def flush_batch(log_batch: LogBatch,
+                sfm_queue: Queue,
+                subscriber_client: SubscriberClient,
+                subscription_path: str):
 
     context = create_logs_context(sfm_queue)
     try:
-        if worker_state.jobs:
+        if log_batch.jobs:
             sent = False
-            display_payload_size = round((worker_state.finished_batch_bytes_size / 1024), 3)
+            display_payload_size = round((log_batch.finished_batch_bytes_size / 1024), 3)
             try:
-                context.log(worker_state.worker_name, f'Log ingest payload size: {display_payload_size} kB')
-                send_logs(context, worker_state.jobs, worker_state.finished_batch)
-                context.log(worker_state.worker_name, "Log ingest payload pushed successfully")
+                context.log(log_batch.worker_name, f'Log ingest payload size: {display_payload_size} kB')
+                send_logs(context, log_batch.jobs, log_batch.finished_batch)
+                context.log(log_batch.worker_name, "Log ingest payload pushed successfully")
                 sent = True
             except Exception:
-                context.exception(worker_state.worker_name, "Failed to ingest logs")
+                context.exception(log_batch.worker_name, "Failed to ingest logs")
             if sent:
-                context.self_monitoring.sent_logs_entries += len(worker_state.jobs)
+                context.self_monitoring.sent_logs_entries += len(log_batch.jobs)
                 context.self_monitoring.log_ingest_payload_size += display_payload_size
-                send_batched_acks(subscriber_client, subscription_path, worker_state.ack_ids)
-        elif worker_state.ack_ids:
+                send_batched_acks(subscriber_client, subscription_path, log_batch.ack_ids)
+        elif log_batch.ack_ids:
             # Send ACKs if processing all messages has failed
-            send_batched_acks(subscriber_client, subscription_path, worker_state.ack_ids)
+            send_batched_acks(subscriber_client, subscription_path, log_batch.ack_ids)
     except Exception:
-        context.exception(worker_state.worker_name, "Failed to perform flush")
+        context.exception(log_batch.worker_name, "Failed to perform flush")
     finally:
-        # reset state event if we failed to flush, to AVOID getting stuck in processing the same messages
-        # over and over again and letting their acknowledgement deadline expire
-        worker_state.reset()
+        ack_lease_manager.release(log_batch.ack_ids)
 
 
 def send_batched_acks(subscriber_client: SubscriberClient, subscription_path: str, acks_ids: List[str]):
-    # request size limit is 524288, but we are not able to easily control size of created protobuf
-    # empiric test indicates that ack_ids have around 200-220 chars. We can safely assume that ack id is never longer
-    # than 256 chars, we split ack ids into chunks with no more than 2048 ack_id's
-    chunk_size = 2048
-    if len(acks_ids) < chunk_size:
-        send_acks(subscriber_client, subscription_path, acks_ids)
-    else:
-        for chunk in chunks(acks_ids, chunk_size):
-            send_acks(subscriber_client, subscription_path, chunk)
+    for chunk in chunk_ack_ids(acks_ids):
+        send_acks(subscriber_client, subscription_path, chunk)
 
 
 def send_acks(subscriber_client: SubscriberClient, subscription_path: str, acks_ids: List[str]):
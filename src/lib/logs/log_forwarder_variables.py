@@ -19,6 +19,11 @@ from lib.context import get_int_environment_value
 
 PROCESSING_WORKER_PULL_REQUEST_MAX_MESSAGES = 10_000
 PROCESSING_WORKERS = 4
+LOGS_PROCESSING_PROCESSES = get_int_environment_value("LOGS_PROCESSING_PROCESSES", 0)
+LOGS_SENDING_WORKERS = get_int_environment_value("LOGS_SENDING_WORKERS", 0)
+LOGS_SENDING_MAX_IN_FLIGHT_BATCHES = get_int_environment_value("LOGS_SENDING_MAX_IN_FLIGHT_BATCHES", 8)
+SUBSCRIPTION_ACK_DEADLINE_SECONDS = get_int_environment_value("LOGS_SUBSCRIPTION_ACK_DEADLINE_SECONDS", 120)
+ACK_LEASE_EXTENSION_SECONDS = get_int_environment_value("LOGS_ACK_LEASE_EXTENSION_SECONDS", 0)
 MAX_SFM_MESSAGES_PROCESSED = 10_000
 LOGS_SUBSCRIPTION_PROJECT = os.environ.get("GCP_PROJECT", os.environ.get("LOGS_SUBSCRIPTION_PROJECT", None))
 LOGS_SUBSCRIPTION_ID = os.environ.get('LOGS_SUBSCRIPTION_ID', None)
@@ -29,6 +34,12 @@ SENDING_WORKER_EXECUTION_PERIOD_SECONDS = get_int_environment_value("DYNATRACE_L
 SFM_WORKER_EXECUTION_PERIOD_SECONDS = get_int_environment_value("DYNATRACE_LOG_INGEST_SFM_WORKER_EXECUTION_PERIOD", 60)
 REQUEST_BODY_MAX_SIZE = get_int_environment_value("DYNATRACE_LOG_INGEST_REQUEST_MAX_SIZE", 1048576)
 REQUEST_MAX_EVENTS = get_int_environment_value("DYNATRACE_LOG_INGEST_REQUEST_MAX_EVENTS", 5000)
+CONNECTION_POOL_SIZE = get_int_environment_value("DYNATRACE_LOG_INGEST_CONNECTION_POOL_SIZE", 10)
+STREAMING_PULL_ENABLED = os.environ.get("LOGS_STREAMING_PULL_ENABLED", "FALSE").upper() in ["TRUE", "YES"]
+STREAMING_PULL_MAX_OUTSTANDING_MESSAGES = get_int_environment_value("LOGS_STREAMING_PULL_MAX_OUTSTANDING_MESSAGES", 20_000)
+STREAMING_PULL_MAX_OUTSTANDING_BYTES = get_int_environment_value("LOGS_STREAMING_PULL_MAX_OUTSTANDING_BYTES", 100 * 1024 * 1024)
+STREAMING_PULL_SENDING_QUEUE_SIZE = get_int_environment_value("LOGS_STREAMING_PULL_SENDING_QUEUE_SIZE", 10_000)
+STREAMING_PULL_SENDING_WORKERS = get_int_environment_value("LOGS_STREAMING_PULL_SENDING_WORKERS", 4)
 BATCH_MAX_MESSAGES = get_int_environment_value("DYNATRACE_LOG_INGEST_BATCH_MAX_MESSAGES", 10_000)
 DYNATRACE_LOG_INGEST_CONTENT_MARK_TRIMMED = "[TRUNCATED]"
 CLOUD_LOG_FORWARDER = os.environ.get("CLOUD_LOG_FORWARDER", "")
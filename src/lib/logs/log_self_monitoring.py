@@ -32,7 +32,8 @@ from lib.sfm.for_logs.log_sfm_metric_descriptor import LOG_SELF_MONITORING_CONNE
     LOG_SELF_MONITORING_TOO_OLD_RECORDS_METRIC_TYPE, LOG_SELF_MONITORING_PARSING_ERRORS_METRIC_TYPE, \
     LOG_SELF_MONITORING_PROCESSING_TIME_METRIC_TYPE, LOG_SELF_MONITORING_SENDING_TIME_SIZE_METRIC_TYPE, \
     LOG_SELF_MONITORING_TOO_LONG_CONTENT_METRIC_TYPE, LOG_SELF_MONITORING_LOG_INGEST_PAYLOAD_SIZE_METRIC_TYPE, \
-    LOG_SELF_MONITORING_SENT_LOGS_ENTRIES_METRIC_TYPE, LOG_SELF_MONITORING_PUBLISH_TIME_FALLBACK_METRIC_TYPE
+    LOG_SELF_MONITORING_SENT_LOGS_ENTRIES_METRIC_TYPE, LOG_SELF_MONITORING_PUBLISH_TIME_FALLBACK_METRIC_TYPE, \
+    LOG_SELF_MONITORING_CONNECTIONS_METRIC_TYPE
 from lib.sfm.for_logs.log_sfm_metrics import LogSelfMonitoring
 from lib.self_monitoring import push_self_monitoring_time_series
 
@@ -49,6 +50,8 @@ def aggregate_self_monitoring_metrics(aggregated_sfm: LogSelfMonitoring, sfm_lis
         aggregated_sfm.sending_time += sfm.sending_time
         aggregated_sfm.log_ingest_payload_size += sfm.log_ingest_payload_size
         aggregated_sfm.sent_logs_entries += sfm.sent_logs_entries
+        aggregated_sfm.new_connections += sfm.new_connections
+        aggregated_sfm.reused_connections += sfm.reused_connections
     return aggregated_sfm
 
 
@@ -142,6 +145,8 @@ def _log_self_monitoring_data(self_monitoring: LogSelfMonitoring, logging_contex
     logging_context.log("SFM", f"Total logs sending time [s]: {self_monitoring.sending_time}")
     logging_context.log("SFM", f"Log ingest payload size [kB]: {self_monitoring.log_ingest_payload_size}")
     logging_context.log("SFM", f"Number of sent logs entries: {self_monitoring.sent_logs_entries}")
+    logging_context.log("SFM", f"Log ingest requests sent over new connection: {self_monitoring.new_connections}, "
+                               f"over reused connection: {self_monitoring.reused_connections}")
 
 
 def create_time_serie(
@@ -325,6 +330,23 @@ def create_self_monitoring_time_series(sfm: LogSelfMonitoring, context: LogsSfmC
             }]
         ))
 
+    for connection_type, connections in (("new", sfm.new_connections), ("reused", sfm.reused_connections)):
+        if connections:
+            time_series.append(create_time_serie(
+                context,
+                LOG_SELF_MONITORING_CONNECTIONS_METRIC_TYPE,
+                {
+                    "dynatrace_tenant_url": context.dynatrace_url,
+                    "logs_subscription_id": context.logs_subscription_id,
+                    "container_name": context.container_name,
+                    "connection_type": connection_type
+                },
+                [{
+                    "interval": interval,
+                    "value": {"int64Value": connections}
+                }]
+            ))
+
     return {"timeSeries": time_series}
 
 
@@ -17,10 +17,10 @@ import queue
 import time
 from datetime import datetime, timezone
 from queue import Queue
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 
 from dateutil.parser import *
-from google.pubsub_v1 import ReceivedMessage, PubsubMessage
+from google.pubsub_v1 import ReceivedMessage
 
 from lib.context import LogsProcessingContext
 from lib.logs.log_forwarder_variables import EVENT_AGE_LIMIT_SECONDS, CONTENT_LENGTH_LIMIT, \
@@ -43,14 +43,18 @@ class LogProcessingJob:
 
 
 def _process_message(sfm_queue: Queue, message: ReceivedMessage) -> Optional[LogProcessingJob]:
+    return _process_message_data(sfm_queue, message.ack_id, message.message.publish_time, message.message.data)
+
+
+def _process_message_data(sfm_queue: Queue, ack_id: str, publish_time: datetime, data: bytes) -> Optional[LogProcessingJob]:
     context = None
     try:
         context = LogsProcessingContext(
-            scheduled_execution_id=str(message.ack_id.__hash__())[-8:],
-            message_publish_time=message.message.publish_time,
+            scheduled_execution_id=str(ack_id.__hash__())[-8:],
+            message_publish_time=publish_time,
             sfm_queue=sfm_queue
         )
-        return _do_process_message(context, message.message)
+        return _do_process_message(context, data)
     except Exception as exception:
         if not context:
             context = LogsProcessingContext(None, None, sfm_queue)
@@ -67,9 +71,9 @@ def _process_message(sfm_queue: Queue, message: ReceivedMessage) -> Optional[Log
         return None
 
 
-def _do_process_message(context: LogsProcessingContext, message: PubsubMessage) -> Optional[LogProcessingJob]:
+def _do_process_message(context: LogsProcessingContext, message_data: bytes) -> Optional[LogProcessingJob]:
     context.self_monitoring.processing_time_start = time.perf_counter()
-    data = message.data.decode("UTF-8")
+    data = message_data.decode("UTF-8")
     # context.log(f"Data: {data}")
 
     payload = _create_dt_log_payload(context, data)
@@ -84,6 +88,20 @@ def _do_process_message(context: LogsProcessingContext, message: PubsubMessage)
         return job
 
 
+def process_message_in_worker_process(ack_id: str, publish_time: datetime, data: bytes) \
+        -> Tuple[Optional[LogProcessingJob], List[LogSelfMonitoring]]:
+    """
+    Processes message in process of the processing pool (see lib.logs.processing_pool), self monitoring
+    put into the queue during processing is returned with the job, so parent process can put it into its own queue
+    """
+    worker_sfm_queue = Queue()
+    job = _process_message_data(worker_sfm_queue, ack_id, publish_time, data)
+    self_monitoring = []
+    while not worker_sfm_queue.empty():
+        self_monitoring.append(worker_sfm_queue.get_nowait())
+    return job, self_monitoring
+
+
 def _create_dt_log_payload(context: LogsProcessingContext, message_data: str) -> Optional[Dict]:
     if not message_data:
         context.log("Skipping empty message")
@@ -0,0 +1,93 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import multiprocessing
+import queue
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from queue import Queue
+from typing import List, Optional, Tuple
+
+from lib.logs.log_forwarder_variables import LOGS_PROCESSING_PROCESSES
+from lib.logs.logs_processor import LogProcessingJob, process_message_in_worker_process
+
+# every process gets a few chunks of the messages, so processes which finish earlier can take next ones
+CHUNKS_PER_PROCESS = 4
+
+
+class LogProcessingPool:
+    """
+    Processes pulled messages (JSON parsing, metadata extraction, payload serialization - all CPU bound)
+    in separate processes, so processing is not limited to single core by GIL.
+
+    Only message data goes to the processes, they return payloads with self monitoring collected
+    during processing. Messages and their ack ids stay in the parent process.
+    """
+
+    def __init__(self, processes: int):
+        self.processes = processes
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.processes > 0
+
+    def process_messages(self, sfm_queue: Queue, messages: List[Tuple[str, datetime, bytes]]) \
+            -> List[Optional[LogProcessingJob]]:
+        """
+        Takes (ack id, publish time, data) of the messages, returns jobs in the same order as messages
+        """
+        if not messages:
+            return []
+        ack_ids, publish_times, messages_data = zip(*messages)
+        # publish time of pulled message keeps nanoseconds in datetime subclass, which is not needed for processing
+        publish_times = [datetime.fromisoformat(publish_time.isoformat()) for publish_time in publish_times]
+        chunk_size = max(1, len(messages) // (self.processes * CHUNKS_PER_PROCESS))
+
+        try:
+            results = list(self._get_executor().map(process_message_in_worker_process, ack_ids, publish_times,
+                                                    messages_data, chunksize=chunk_size))
+        except BrokenProcessPool:
+            # process was killed (e.g. out of memory), new pool is created for next messages
+            self._reset_executor()
+            raise
+
+        jobs = []
+        for job, self_monitoring in results:
+            for single_self_monitoring in self_monitoring:
+                try:
+                    sfm_queue.put_nowait(single_self_monitoring)
+                except queue.Full:
+                    pass
+            jobs.append(job)
+        return jobs
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawned processes don't inherit threads (and locks) of pulling clients, unlike forked ones
+                self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+
+log_processing_pool = LogProcessingPool(LOGS_PROCESSING_PROCESSES)
@@ -0,0 +1,60 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Callable, Optional
+
+from lib.logs.log_forwarder_variables import LOGS_SENDING_WORKERS, LOGS_SENDING_MAX_IN_FLIGHT_BATCHES
+
+
+class LogSenderPool:
+    """
+    Sends batches of pulling workers in separate threads, so pulling and processing of next messages
+    overlaps with waiting for Dynatrace response. Number of batches in flight (queued or being sent) is bounded,
+    pulling worker handing over a batch above the limit waits until one of them is finished,
+    so memory and number of leased messages stay limited when Dynatrace is slow.
+    """
+
+    def __init__(self, workers: int, max_in_flight_batches: int):
+        self.workers = workers
+        self.max_in_flight_batches = max(max_in_flight_batches, workers)
+        self._in_flight = threading.BoundedSemaphore(self.max_in_flight_batches)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.workers > 0
+
+    def submit(self, send_batch: Callable[[], None]) -> Future:
+        """
+        send_batch is responsible for handling its errors and acking messages of successfully sent batch
+        """
+        self._in_flight.acquire()
+        try:
+            future = self._get_executor().submit(send_batch)
+        except Exception:
+            self._in_flight.release()
+            raise
+        future.add_done_callback(lambda _: self._in_flight.release())
+        return future
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="log-sender")
+            return self._executor
+
+
+log_sender_pool = LogSenderPool(LOGS_SENDING_WORKERS, LOGS_SENDING_MAX_IN_FLIGHT_BATCHES)
@@ -0,0 +1,187 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import queue
+import threading
+import time
+from functools import partial
+from queue import Queue
+from typing import List
+
+from google.api_core.exceptions import Forbidden
+from google.cloud import pubsub
+from google.cloud.pubsub_v1.subscriber.message import Message
+from google.cloud.pubsub_v1.types import FlowControl
+
+from lib.context import LoggingContext
+from lib.logs.dynatrace_client import send_logs, create_logs_context
+from lib.logs.log_forwarder_variables import LOGS_SUBSCRIPTION_PROJECT, LOGS_SUBSCRIPTION_ID, PROCESSING_WORKERS, \
+    REQUEST_BODY_MAX_SIZE, STREAMING_PULL_MAX_OUTSTANDING_MESSAGES, STREAMING_PULL_MAX_OUTSTANDING_BYTES, \
+    STREAMING_PULL_SENDING_QUEUE_SIZE, STREAMING_PULL_SENDING_WORKERS
+from lib.logs.logs_processor import _process_message_data, LogProcessingJob
+from lib.logs.processing_pool import log_processing_pool
+from lib.logs.worker_state import WorkerState
+
+# max number of messages processed by processing pool at once in streaming mode
+PROCESSING_POOL_MAX_MESSAGES = 1000
+# how long sending worker waits for next job before checking if batch should be flushed because of time
+SENDING_WORKER_POLL_TIMEOUT_SECONDS = 1
+# how long sending worker holds messages of failed batch before they are redelivered, like unary pull backoff
+SENDING_FAILURE_BACKOFF_SECONDS = 60
+
+
+class StreamingWorkerState(WorkerState):
+    """
+    Batch of sending worker, keeps received messages of the batch, so they can be acked (or nacked) after sending
+    """
+    messages: List[Message]
+
+    def reset(self):
+        super().reset()
+        self.messages = []
+
+    def add_message_job(self, log_processing_job: LogProcessingJob, message: Message):
+        self.add_job(log_processing_job, message.ack_id)
+        self.messages.append(message)
+
+
+def run_streaming_pull_logs(sfm_queue: Queue):
+    """
+    Receiving, processing and sending of logs are separate stages connected with bounded queues:
+    - streaming pull subscriber receives messages, number and size of outstanding (not acked) messages is limited
+      by flow control, so receiving pauses when later stages can't keep up
+    - processing workers transform messages into log ingest jobs
+    - sending workers batch jobs, send them to Dynatrace and ack their messages
+    so pulling doesn't wait for Dynatrace responses.
+    """
+    received_queue: Queue = Queue(STREAMING_PULL_MAX_OUTSTANDING_MESSAGES)
+    jobs_queue: Queue = Queue(STREAMING_PULL_SENDING_QUEUE_SIZE)
+
+    for i in range(0, PROCESSING_WORKERS):
+        threading.Thread(target=partial(run_processing_worker, sfm_queue, received_queue, jobs_queue),
+                         name=f"processing-worker-{i}", daemon=True).start()
+    for i in range(0, STREAMING_PULL_SENDING_WORKERS):
+        threading.Thread(target=partial(run_sending_worker, f"Sender-{i}", sfm_queue, jobs_queue),
+                         name=f"sending-worker-{i}", daemon=True).start()
+
+    threading.Thread(target=partial(run_streaming_pull, received_queue), name="streaming-pull").start()
+
+
+def run_streaming_pull(received_queue: Queue):
+    logging_context = LoggingContext("StreamingPull")
+    subscriber_client = pubsub.SubscriberClient()
+    subscription_path = subscriber_client.subscription_path(LOGS_SUBSCRIPTION_PROJECT, LOGS_SUBSCRIPTION_ID)
+    flow_control = FlowControl(max_messages=STREAMING_PULL_MAX_OUTSTANDING_MESSAGES,
+                               max_bytes=STREAMING_PULL_MAX_OUTSTANDING_BYTES)
+    logging_context.log(f"Starting streaming pull, max outstanding messages: {flow_control.max_messages}, "
+                        f"max outstanding bytes: {flow_control.max_bytes}")
+
+    while True:
+        # queue has room for all outstanding messages, so callback never blocks subscriber threads
+        streaming_pull_future = subscriber_client.subscribe(subscription_path, callback=received_queue.put,
+                                                            flow_control=flow_control)
+        try:
+            streaming_pull_future.result()
+        except Exception as e:
+            streaming_pull_future.cancel()
+            if isinstance(e, Forbidden):
+                logging_context.error(f"{e} Please check whether assigned service account has permission to fetch Pub/Sub messages.")
+            else:
+                logging_context.exception("Streaming pull failed")
+            # Backoff for 1 minute to avoid spamming requests and logs
+            time.sleep(60)
+
+
+def run_processing_worker(sfm_queue: Queue, received_queue: Queue, jobs_queue: Queue):
+    logging_context = LoggingContext(threading.current_thread().name)
+    while True:
+        messages = [received_queue.get()]
+        # processing pool gets messages in bigger portions, to amortize transfer to its processes
+        if log_processing_pool.enabled:
+            while len(messages) < PROCESSING_POOL_MAX_MESSAGES:
+                try:
+                    messages.append(received_queue.get_nowait())
+                except queue.Empty:
+                    break
+        try:
+            process_received_messages(sfm_queue, messages, jobs_queue)
+        except Exception:
+            # e.g. broken processing pool, messages are redelivered instead of holding flow control forever
+            logging_context.exception(f"Failed to process {len(messages)} messages")
+            for message in messages:
+                message.nack()
+
+
+def process_received_messages(sfm_queue: Queue, messages: List[Message], jobs_queue: Queue):
+    if log_processing_pool.enabled:
+        message_jobs = log_processing_pool.process_messages(
+            sfm_queue, [(message.ack_id, message.publish_time, message.data) for message in messages])
+    else:
+        message_jobs = (_process_message_data(sfm_queue, message.ack_id, message.publish_time, message.data)
+                        for message in messages)
+
+    for message, message_job in zip(messages, message_jobs):
+        if not message_job or message_job.bytes_size > REQUEST_BODY_MAX_SIZE - 2:
+            message.ack()
+            continue
+
+        jobs_queue.put((message_job, message))
+
+
+def run_sending_worker(worker_name: str, sfm_queue: Queue, jobs_queue: Queue):
+    logging_context = LoggingContext(worker_name)
+    logging_context.log("Starting sending")
+
+    worker_state = StreamingWorkerState(worker_name)
+    while True:
+        try:
+            message_job, message = jobs_queue.get(timeout=SENDING_WORKER_POLL_TIMEOUT_SECONDS)
+        except queue.Empty:
+            if worker_state.should_flush():
+                perform_streaming_flush(worker_state, sfm_queue)
+            continue
+
+        add_to_batch(worker_state, sfm_queue, message_job, message)
+
+
+def add_to_batch(worker_state: StreamingWorkerState, sfm_queue: Queue, message_job: LogProcessingJob, message: Message):
+    if worker_state.should_flush(message_job):
+        perform_streaming_flush(worker_state, sfm_queue)
+    worker_state.add_message_job(message_job, message)
+
+
+def perform_streaming_flush(worker_state: StreamingWorkerState, sfm_queue: Queue):
+    context = create_logs_context(sfm_queue)
+    try:
+        if worker_state.jobs:
+            display_payload_size = round((worker_state.finished_batch_bytes_size / 1024), 3)
+            try:
+                context.log(worker_state.worker_name, f'Log ingest payload size: {display_payload_size} kB')
+                send_logs(context, worker_state.jobs, worker_state.finished_batch)
+                context.log(worker_state.worker_name, "Log ingest payload pushed successfully")
+            except Exception:
+                context.exception(worker_state.worker_name, "Failed to ingest logs")
+                # backoff to avoid spamming Dynatrace and logs with redelivered messages when it's unavailable,
+                # outstanding messages keep flow control blocked in the meantime, so receiving pauses too
+                time.sleep(SENDING_FAILURE_BACKOFF_SECONDS)
+                for message in worker_state.messages:
+                    message.nack()
+                return
+            context.self_monitoring.sent_logs_entries += len(worker_state.jobs)
+            context.self_monitoring.log_ingest_payload_size += display_payload_size
+            for message in worker_state.messages:
+                message.ack()
+    except Exception:
+        context.exception(worker_state.worker_name, "Failed to perform flush")
+    finally:
+        worker_state.reset()
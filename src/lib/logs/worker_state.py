@@ -19,6 +19,25 @@ from lib.logs.log_forwarder_variables import REQUEST_MAX_EVENTS, REQUEST_BODY_MA
 from lib.logs.logs_processor import LogProcessingJob
 
 
+class LogBatch:
+    """
+    Batch taken from WorkerState for sending, so the worker can collect next messages in the meantime
+    """
+    worker_name: str
+    ack_ids: List[str]
+    jobs: List[LogProcessingJob]
+    finished_batch: str
+    finished_batch_bytes_size: int
+
+    def __init__(self, worker_name: str, ack_ids: List[str], jobs: List[LogProcessingJob], finished_batch: str,
+                 finished_batch_bytes_size: int):
+        self.worker_name = worker_name
+        self.ack_ids = ack_ids
+        self.jobs = jobs
+        self.finished_batch = finished_batch
+        self.finished_batch_bytes_size = finished_batch_bytes_size
+
+
 class WorkerState:
     worker_name: str
     ack_ids: List[str]  # May be greater than jobs, worker is ACKing failed (too old or too big) messages too
@@ -68,3 +87,9 @@ class WorkerState:
     @property
     def finished_batch_bytes_size(self):
         return self.batch_bytes_size + 1
+
+    def take_batch(self) -> LogBatch:
+        log_batch = LogBatch(self.worker_name, self.ack_ids, self.jobs, self.finished_batch,
+                             self.finished_batch_bytes_size)
+        self.reset()
+        return log_batch
@@ -11,53 +11,196 @@
 #     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #     See the License for the specific language governing permissions and
 #     limitations under the License.
-import os
+import asyncio
+import calendar
+import gzip
 import time
 from datetime import timezone, datetime
+from functools import partial, lru_cache
 from http.client import InvalidURL
-from typing import Dict, List, Any
+from typing import Dict, List, AsyncIterator, Optional, Iterable, Callable
 
-from lib.context import MetricsContext, LoggingContext, DynatraceConnectivity
+from lib.context import MetricsContext, DynatraceConnectivity, get_int_environment_value
+from lib.credentials import invalidate_dynatrace_secrets, invalidate_gcp_token
+from lib.entities.enrichment import create_dimension
 from lib.entities.ids import _create_mmh3_hash
-from lib.entities.model import Entity
+from lib.ingest_retry import IngestSpillQueue, RetryableIngestException, backoff_delay, parse_retry_after
+from lib.polling_checkpoint import polling_checkpoint
+from lib.query_plan import DtDimensionsMap, QueryPlanCache
 from lib.metrics import DISTRIBUTION_VALUE_KEY, Metric, TYPED_VALUE_KEY_MAPPING, GCPService, \
-    DimensionValue, IngestLine
+    DimensionValue, IngestLine, IngestSeries, EntityEnrichment
 from lib.sfm.for_metrics.metrics_definitions import SfmKeys
 from lib.configuration import config
+from lib.utilities import chunks
 
 UNIT_10TO2PERCENT = "10^2.%"
-MAX_DIMENSION_NAME_LENGTH = os.environ.get("MAX_DIMENSION_NAME_LENGTH", 100)
-MAX_DIMENSION_VALUE_LENGTH = os.environ.get("MAX_DIMENSION_VALUE_LENGTH", 250)
 
 GCP_MONITORING_URL = config.gcp_monitoring_url()
 
+TIMESTAMP_CACHE_SIZE = 4096
 
-async def push_ingest_lines(context: MetricsContext, project_id: str, fetch_metric_results: List[IngestLine]):
+GZIP_COMPRESS_LEVEL = 6
+GZIP_IN_EXECUTOR_MIN_BYTES = 64 * 1024
+
+# plans of metrics queries, invalidated when services configuration is refreshed
+query_plans = QueryPlanCache()
+
+_spill_queue = IngestSpillQueue(get_int_environment_value("METRIC_INGEST_SPILL_QUEUE_MAX_LINES", 100_000))
+
+
+async def push_ingest_lines(context: MetricsContext, project_id: str, fetch_metric_results: List[IngestLine]) -> bool:
+    """
+    Returns True if all lines were pushed (or spilled to be pushed in next polling)
+    """
     if context.dynatrace_connectivity != DynatraceConnectivity.Ok:
         context.log(project_id, f"Skipping push due to detected connectivity error")
-        return
+        return False
 
     if not fetch_metric_results:
         context.log(project_id, "Skipping push due to no data to push")
 
+    lines_batches = list(chunks(fetch_metric_results, context.metric_ingest_batch_size))
+    for lines_batch in lines_batches:
+        polling_checkpoint.start_push(project_id, lines_batch)
+
+    async def batches():
+        for lines_batch in lines_batches:
+            yield lines_batch
+
+    return await _push_ingest_lines_batches(context, project_id, batches())
+
+
+async def push_ingest_lines_from_queue(context: MetricsContext, project_id: str, batches_queue: asyncio.Queue) -> bool:
+    """
+    Pushes batches put into the queue by producers until None is received.
+    Queue is always drained, even if pushing fails, so producers are never blocked.
+    Returns True if all lines were pushed (or spilled to be pushed in next polling)
+    """
+    async def queued_batches():
+        while True:
+            lines_batch = await batches_queue.get()
+            if lines_batch is None:
+                return
+            yield lines_batch
+
+    batches = queued_batches()
+    pushed = False
+    if context.dynatrace_connectivity != DynatraceConnectivity.Ok:
+        context.log(project_id, f"Skipping push due to detected connectivity error")
+    else:
+        pushed = await _push_ingest_lines_batches(context, project_id, batches)
+
+    async for lines_batch in batches:
+        pushed = False
+        polling_checkpoint.finish_push(lines_batch)
+    return pushed
+
+
+async def _push_ingest_lines_batches(context: MetricsContext, project_id: str,
+                                     batches: AsyncIterator[List[IngestLine]]) -> bool:
+    """
+    Keeps up to METRIC_INGEST_MAX_CONCURRENT_REQUESTS batches (shared by all projects of the tenant) in flight.
+    Next batch is taken from the source only when a slot is free, so the source is not drained ahead of the upload.
+    """
     start_time = time.time()
+    ingest_semaphore = context.ingest_semaphore()
+    push_tasks = []
+    try:
+        async for lines_batch in batches:
+            await ingest_semaphore.acquire()
+            push_tasks.append(asyncio.create_task(_push_single_batch(context, project_id, lines_batch)))
+    finally:
+        push_results = await asyncio.gather(*push_tasks, return_exceptions=True)
+        push_data_time = time.time() - start_time
+        context.sfm[SfmKeys.push_to_dynatrace_execution_time].update(project_id, push_data_time)
+        context.log(project_id, f"Finished uploading metric ingest lines to Dynatrace in {push_data_time} s")
+    return all(push_result is True for push_result in push_results)
+
+
+async def _push_single_batch(context: MetricsContext, project_id: str, lines_batch: List[IngestLine]) -> bool:
+    pushed = await _push_single_batch_with_retries(context, project_id, lines_batch)
+    # batch is done (pushed, spilled or dropped), push cancelled on polling timeout stays in the checkpoint
+    polling_checkpoint.finish_push(lines_batch)
+    return pushed
+
+
+async def _push_single_batch_with_retries(context: MetricsContext, project_id: str,
+                                          lines_batch: List[IngestLine]) -> bool:
+    """
+    Caller holds a slot of the ingest semaphore, it is released for the time of waiting before retry,
+    so other batches can be pushed in the meantime. Returns False if lines were dropped
+    """
+    ingest_semaphore = context.ingest_semaphore()
+    holds_slot = True
     try:
-        lines_batch = []
-        for result in fetch_metric_results:
-            lines_batch.append(result)
-            if len(lines_batch) >= context.metric_ingest_batch_size:
+        attempt = 0
+        while True:
+            if context.dynatrace_connectivity != DynatraceConnectivity.Ok:
+                context.t_error(project_id, "Skipping push of ingest lines batch due to detected connectivity error")
+                context.sfm[SfmKeys.dynatrace_ingest_lines_dropped_count].update(project_id, len(lines_batch))
+                return False
+            # request cancelled on polling timeout may have been ingested, so the batch is not pushed again
+            polling_checkpoint.start_sending(lines_batch)
+            try:
                 await _push_to_dynatrace(context, project_id, lines_batch)
-                lines_batch = []
-        if lines_batch:
-            await _push_to_dynatrace(context, project_id, lines_batch)
+                return True
+            except RetryableIngestException as e:
+                polling_checkpoint.finish_sending(lines_batch)
+                delay = e.retry_after if e.retry_after is not None else backoff_delay(attempt)
+                if attempt >= context.metric_ingest_max_retries or not context.ingest_retry_budget.try_acquire(delay):
+                    context.log(project_id, f"{e}, retries exhausted, ingest lines will be pushed in next polling")
+                    _spill_ingest_lines(context, project_id, lines_batch)
+                    return True
+                attempt += 1
+                context.t_error(project_id, f"{e}, retrying push of ingest lines batch")
+                ingest_semaphore.release()
+                holds_slot = False
+                await asyncio.sleep(delay)
+                await ingest_semaphore.acquire()
+                holds_slot = True
     except Exception as e:
         if isinstance(e, InvalidURL):
             context.update_dt_connectivity_status(DynatraceConnectivity.WrongURL)
         context.log(project_id, f"Failed to push ingest lines to Dynatrace due to {type(e).__name__} {e}")
+        return False
     finally:
-        push_data_time = time.time() - start_time
-        context.sfm[SfmKeys.push_to_dynatrace_execution_time].update(project_id, push_data_time)
-        context.log(project_id, f"Finished uploading metric ingest lines to Dynatrace in {push_data_time} s")
+        if holds_slot:
+            ingest_semaphore.release()
+
+
+def _spill_ingest_lines(context: MetricsContext, project_id: str, lines_batch: List[IngestLine]):
+    for dropped_project_id, dropped_lines in _spill_queue.put(project_id, lines_batch):
+        context.sfm[SfmKeys.dynatrace_ingest_lines_dropped_count].update(dropped_project_id, dropped_lines)
+        context.log(dropped_project_id, f"Spill queue is full, dropped {dropped_lines} ingest lines")
+
+
+async def push_spilled_ingest_lines(context: MetricsContext):
+    """
+    Pushes ingest lines which could not be pushed in previous polling due to throttling or server errors
+    """
+    if context.dynatrace_connectivity != DynatraceConnectivity.Ok:
+        # lines stay in the spill queue for next polling
+        context.log("Skipping push of ingest lines left from previous polling due to detected connectivity error")
+        return
+
+    spilled_batches = _spill_queue.drain()
+    if not spilled_batches:
+        return
+
+    context.log(f"Pushing {sum(len(batch) for _, batch in spilled_batches)} ingest lines left from previous polling")
+    # lines left by interrupted polling are not split into batches yet
+    lines_batches = [(project_id, lines_batch)
+                     for project_id, lines in spilled_batches
+                     for lines_batch in chunks(lines, context.metric_ingest_batch_size)]
+    for project_id, lines_batch in lines_batches:
+        polling_checkpoint.start_push(project_id, lines_batch)
+
+    ingest_semaphore = context.ingest_semaphore()
+    push_tasks = []
+    for project_id, lines_batch in lines_batches:
+        await ingest_semaphore.acquire()
+        push_tasks.append(asyncio.create_task(_push_single_batch(context, project_id, lines_batch)))
+    await asyncio.gather(*push_tasks, return_exceptions=True)
 
 
 async def _push_to_dynatrace(context: MetricsContext, project_id: str, lines_batch: List[IngestLine]):
@@ -66,27 +209,38 @@ async def _push_to_dynatrace(context: MetricsContext, project_id: str, lines_bat
         context.log("Ingest input is: ")
         context.log(ingest_input)
     dt_url = f"{context.dynatrace_url.rstrip('/')}/api/v2/metrics/ingest"
+    headers = {
+        "Authorization": f"Api-Token {context.dynatrace_api_key}",
+        "Content-Type": "text/plain; charset=utf-8"
+    }
+    data = ingest_input
+    if context.metric_ingest_gzip_enabled:
+        data = await _compress_ingest_input(context, ingest_input.encode("UTF-8"))
+        headers["Content-Encoding"] = "gzip"
+
     ingest_response = await context.dt_session.post(
         url=dt_url,
-        headers={
-            "Authorization": f"Api-Token {context.dynatrace_api_key}",
-            "Content-Type": "text/plain; charset=utf-8"
-        },
-        data=ingest_input,
+        headers=headers,
+        data=data,
         verify_ssl=context.require_valid_certificate
     )
 
     if ingest_response.status == 401:
         context.update_dt_connectivity_status(DynatraceConnectivity.ExpiredToken)
+        # API key could have been rotated in Secret Manager, next polling has to fetch it again
+        invalidate_dynatrace_secrets()
         raise Exception("Expired token")
     elif ingest_response.status == 403:
         context.update_dt_connectivity_status(DynatraceConnectivity.WrongToken)
+        invalidate_dynatrace_secrets()
         raise Exception("Wrong token - missing 'Ingest metrics using API V2' permission")
     elif ingest_response.status == 404 or ingest_response.status == 405:
         context.update_dt_connectivity_status(DynatraceConnectivity.WrongURL)
         raise Exception(f"Wrong URL {dt_url}")
-    elif ingest_response.status == 429:
-        context.sfm[SfmKeys.dynatrace_ingest_lines_dropped_count].update(project_id, len(lines_batch))
+    elif ingest_response.status == 429 or ingest_response.status >= 500:
+        context.sfm[SfmKeys.dynatrace_request_count].increment(ingest_response.status)
+        raise RetryableIngestException(ingest_response.status,
+                                       parse_retry_after(ingest_response.headers.get("Retry-After")))
 
     ingest_response_json = await ingest_response.json()
 
@@ -101,6 +255,17 @@ async def _push_to_dynatrace(context: MetricsContext, project_id: str, lines_bat
     await log_invalid_lines(context, ingest_response_json, lines_batch)
 
 
+async def _compress_ingest_input(context: MetricsContext, ingest_input: bytes) -> bytes:
+    # compressing big batch would block the event loop for several milliseconds, stalling all other fetches
+    if len(ingest_input) >= GZIP_IN_EXECUTOR_MIN_BYTES:
+        loop = asyncio.get_running_loop()
+        compressed = await loop.run_in_executor(None, partial(gzip.compress, ingest_input, GZIP_COMPRESS_LEVEL))
+    else:
+        compressed = gzip.compress(ingest_input, GZIP_COMPRESS_LEVEL)
+    context.sfm[SfmKeys.dynatrace_ingest_compression_ratio].update(len(ingest_input), len(compressed))
+    return compressed
+
+
 async def log_invalid_lines(context: MetricsContext, ingest_response_json: Dict, lines_batch: List[IngestLine]):
     error = ingest_response_json.get("error", None)
     if error is None:
@@ -114,94 +279,90 @@ async def log_invalid_lines(context: MetricsContext, ingest_response_json: Dict,
                 invalid_line_error_message = invalid_line_error_message.get("error", "")
                 context.log(f"INVALID LINE: '{lines_batch[line_index].to_string()}', reason: '{invalid_line_error_message}'")
 
-class DtDimensionsMap:
-    def __init__(self) -> None:
-            self.dt_dimensions_set_by_source_dimension = {}
-
-    def add_label_mapping(self, source_dimension, dt_target_dimension):
-        all_dt_dims_for_source_dim = self.dt_dimensions_set_by_source_dimension.get(source_dimension, set())
-        all_dt_dims_for_source_dim.add(dt_target_dimension)
-        self.dt_dimensions_set_by_source_dimension[source_dimension] = all_dt_dims_for_source_dim
-
-    def get_dt_dimensions(self, source_dimension, dt_dimension_if_unmapped) -> List:
-        # dt_label_if_unmapped - shouldn't happen, but if we get dimension back that we didn't query for (=not defined in map), it would be unsafe to discard it
-        # (could result in duplicate metric entries for remaining dim label+value set):
-        # report it to Dt under dt_label_if_unmapped - this is expected to be last part for full source dimension label, e.g.:
-        # resource.label.unrequestedDimensionLabel > unrequestedDimensionLabel
-        dt_dimensions_set = self.dt_dimensions_set_by_source_dimension.get(source_dimension, {dt_dimension_if_unmapped})
-        dt_dimension_sorted_list = sorted(dt_dimensions_set)
-        return dt_dimension_sorted_list
-
-
 async def fetch_metric(
         context: MetricsContext,
         project_id: str,
         service: GCPService,
-        metric: Metric
+        metric: Metric,
+        project_filter: str = "",
+        execution_time: Optional[datetime] = None,
+        start_time: Optional[datetime] = None
 ) -> List[IngestLine]:
-    end_time = (context.execution_time - metric.ingest_delay)
-    start_time = (end_time - context.execution_interval)
-
-    reducer = 'REDUCE_SUM'
-    aligner = 'ALIGN_SUM'
-
-    if metric.value_type.lower() == 'bool':
-        aligner = 'ALIGN_COUNT_TRUE'
-    elif metric.google_metric_kind.lower().startswith('cumulative'):
-        aligner = 'ALIGN_DELTA'
-
-    params = [
-        ('filter', f'metric.type = "{metric.google_metric}" {service.monitoring_filter}'.strip()),
-        ('interval.startTime', start_time.isoformat() + "Z"),
-        ('interval.endTime', end_time.isoformat() + "Z"),
-        ('aggregation.alignmentPeriod', f"{metric.sample_period_seconds.total_seconds()}s"),
-        ('aggregation.perSeriesAligner', aligner),
-        ('aggregation.crossSeriesReducer', reducer)
-    ]
-
-    all_dimensions = (service.dimensions + metric.dimensions)
-    dt_dimensions_mapping = DtDimensionsMap()
-    for dimension in all_dimensions:
-        if dimension.key_for_send_to_dynatrace:
-            dt_dimensions_mapping.add_label_mapping(dimension.key_for_fetch_metric, dimension.key_for_send_to_dynatrace)
-
-        params.append(('aggregation.groupByFields', dimension.key_for_fetch_metric))
+    lines = []
+    async for page_lines in fetch_metric_pages(context, project_id, service, metric, project_filter, execution_time,
+                                               start_time):
+        lines.extend(page_lines)
+    return lines
+
+
+async def fetch_metric_pages(
+        context: MetricsContext,
+        project_id: str,
+        service: GCPService,
+        metric: Metric,
+        project_filter: str = "",
+        execution_time: Optional[datetime] = None,
+        start_time: Optional[datetime] = None,
+        page_token: Optional[str] = None,
+        on_page: Optional[Callable[[Optional[str]], None]] = None
+) -> AsyncIterator[List[IngestLine]]:
+    """
+    Yields ingest lines converted from single page of timeSeries.list response at a time, starting from page_token
+    if it's given. on_page is called with token of the next page (None after the last one) before the page is yielded
+    """
+    end_time = ((execution_time or context.execution_time) - metric.ingest_delay)
+    start_time = start_time or (end_time - context.execution_interval)
+
+    query_plan = query_plans.get(service, metric)
+    params = query_plan.params(start_time, end_time, project_filter)
+    if page_token:
+        update_params(page_token, params)
 
     headers = context.create_gcp_request_headers(project_id)
+    api = query_plan.api
 
     should_fetch = True
 
-    lines = []
     while should_fetch:
-        context.sfm[SfmKeys.gcp_metric_request_count].increment(project_id)
-
-        url = f"{GCP_MONITORING_URL}/projects/{project_id}/timeSeries"
-        resp = await context.gcp_session.request('GET', url=url, params=params, headers=headers)
-        page = await resp.json()
+        async with context.fetch_scheduler.request_slot(project_id, api) as queue_wait_time:
+            context.sfm[SfmKeys.fetch_queue_wait_time].update(project_id, queue_wait_time)
+            context.sfm[SfmKeys.fetch_in_flight_requests].update(context.fetch_scheduler.in_flight)
+            context.sfm[SfmKeys.gcp_metric_request_count].increment(project_id)
+
+            url = f"{GCP_MONITORING_URL}/projects/{project_id}/timeSeries"
+            resp = await context.gcp_session.request('GET', url=url, params=params, headers=headers)
+            if resp.status == 401:
+                # token could have been revoked before its expiry, next polling has to fetch new one
+                invalidate_gcp_token()
+            page = await resp.json()
         # response body is https://cloud.google.com/monitoring/api/ref_v3/rest/v3/projects.timeSeries/list#response-body
         if 'error' in page:
             raise Exception(str(page))
         if 'timeSeries' not in page:
             break
 
+        lines = []
         for single_time_series in page['timeSeries']:
             typed_value_key = extract_typed_value_key(single_time_series)
-            dimensions = create_dimensions(context, service.name, single_time_series, dt_dimensions_mapping)
-            entity_id = create_entity_id(service, single_time_series)
+            dimensions = create_dimensions(context, service.name, single_time_series, query_plan.dt_dimensions_mapping)
+            entity_id = create_entity_id(service, single_time_series, query_plan.entity_id_label_keys)
+            series = IngestSeries(entity_id, metric.dynatrace_name, metric.dynatrace_metric_type, dimensions)
 
             for point in single_time_series['points']:
-                line = convert_point_to_ingest_line(context, dimensions, metric, point, typed_value_key, entity_id)
+                line = convert_point_to_ingest_line(context, series, metric, point, typed_value_key)
                 if line:
                     lines.append(line)
 
         next_page_token = page.get('nextPageToken', None)
+        if on_page is not None:
+            on_page(next_page_token)
+        yield lines
+
         if next_page_token:
             update_params(next_page_token, params)
         else:
             should_fetch = False
 
-    return lines
-
 
 def update_params(next_page_token, params):
     replace_index = -1
@@ -224,19 +385,6 @@ def extract_typed_value_key(time_series):
     return typed_value_key
 
 
-def create_dimension(name: str, value: Any, context: LoggingContext = LoggingContext(None)) -> DimensionValue:
-    string_value = str(value)
-
-    if len(name) > MAX_DIMENSION_NAME_LENGTH:
-        context.log(f'MINT rejects dimension names longer that {MAX_DIMENSION_NAME_LENGTH} chars. Dimension name \"{name}\" "has been truncated')
-        name = name[:MAX_DIMENSION_NAME_LENGTH]
-    if len(string_value) > MAX_DIMENSION_VALUE_LENGTH:
-        context.log(f'MINT rejects dimension values longer that {MAX_DIMENSION_VALUE_LENGTH} chars. Dimension value \"{string_value}\" has been truncated')
-        string_value = string_value[:MAX_DIMENSION_VALUE_LENGTH]
-
-    return DimensionValue(name, string_value)
-
-
 def create_dimensions(context: MetricsContext, service_name: str, time_series: Dict, dt_dimensions_mapping: DtDimensionsMap) -> List[DimensionValue]:
     # "gcp.resource.type" is required to easily differentiate services with the same metric set
     # e.g. internal_tcp_lb_rule and internal_udp_lb_rule
@@ -266,51 +414,31 @@ def create_dimensions(context: MetricsContext, service_name: str, time_series: D
 def flatten_and_enrich_metric_results(
         context: MetricsContext,
         fetch_metric_results: List[List[IngestLine]],
-        entity_id_map: Dict[str, Entity]
+        entity_id_map: Dict[str, EntityEnrichment]
 ) -> List[IngestLine]:
     results = []
 
-    entity_dimension_prefix = "entity."
     for ingest_lines in fetch_metric_results:
         for ingest_line in ingest_lines:
-            entity = entity_id_map.get(ingest_line.entity_id, None)
-            if entity:
-                if entity.dns_names:
-                    dimension_value = create_dimension(
-                        name=entity_dimension_prefix + "dns_name",
-                        value=entity.dns_names[0],
-                        context=context
-                    )
-                    ingest_line.dimension_values.append(dimension_value)
-
-                if entity.ip_addresses:
-                    dimension_value = create_dimension(
-                        name=entity_dimension_prefix + "ip_address",
-                        value=entity.ip_addresses[0],
-                        context=context
-                    )
-                    ingest_line.dimension_values.append(dimension_value)
-
-                for cd_property in entity.properties:
-                    dimension_value = create_dimension(
-                        name=entity_dimension_prefix + cd_property.key.replace(" ", "_").lower(),
-                        value=cd_property.value,
-                        context=context
-                    )
-                    ingest_line.dimension_values.append(dimension_value)
+            series = ingest_line.series
+            # all lines of single time series share the same series, it is enough to enrich it once
+            if series.enrichment is None:
+                enrichment = entity_id_map.get(series.entity_id, None)
+                if enrichment:
+                    series.enrich(enrichment)
 
             results.append(ingest_line)
 
     return results
 
 
-def create_entity_id(service: GCPService, time_series):
+def create_entity_id(service: GCPService, time_series, entity_id_label_keys: Optional[Iterable[str]] = None):
     resource = time_series['resource']
     resource_labels = resource.get('labels', {})
     parts = [service.name]
-    for dimension in service.dimensions:
-        key = dimension.key_for_create_entity_id
-
+    if entity_id_label_keys is None:
+        entity_id_label_keys = [dimension.key_for_create_entity_id for dimension in service.dimensions]
+    for key in entity_id_label_keys:
         dimension_value = resource_labels.get(key)
         if dimension_value:
             parts.append(dimension_value)
@@ -320,22 +448,13 @@ def create_entity_id(service: GCPService, time_series):
 
 def convert_point_to_ingest_line(
         context: MetricsContext,
-        dimensions: List[DimensionValue],
+        series: IngestSeries,
         metric: Metric,
         point: Dict,
-        typed_value_key: str,
-        entity_id: str
+        typed_value_key: str
 ) -> IngestLine:
     # Why endtime? see https://cloud.google.com/monitoring/api/ref_v3/rest/v3/TimeInterval
-    timestamp_iso = point['interval']['endTime']
-
-    try:
-        timestamp_parsed = datetime.strptime(timestamp_iso, "%Y-%m-%dT%H:%M:%SZ")
-    except ValueError:
-        timestamp_parsed = datetime.strptime(timestamp_iso, "%Y-%m-%dT%H:%M:%S.%fZ")
-
-    timestamp_datetime = timestamp_parsed.replace(tzinfo=timezone.utc)
-    timestamp = int(timestamp_datetime.timestamp() * 1000)
+    timestamp = parse_timestamp_millis(point['interval']['endTime'])
 
     value = None
     line = None
@@ -346,16 +465,45 @@ def convert_point_to_ingest_line(
 
     if value:
         line = IngestLine(
-            entity_id=entity_id,
-            metric_name=metric.dynatrace_name,
-            metric_type=metric.dynatrace_metric_type,
+            series=series,
             value=value,
-            timestamp=timestamp,
-            dimension_values=dimensions.copy()
+            timestamp=timestamp
         )
     return line
 
 
+@lru_cache(maxsize=TIMESTAMP_CACHE_SIZE)
+def parse_timestamp_millis(timestamp_iso: str) -> int:
+    """
+    Converts RFC3339 UTC timestamp returned by GCP (e.g. 2023-01-01T10:00:00Z or 2023-01-01T10:00:00.123456Z)
+    to epoch millis. Points of single polling share just a few aligned end times, so results are cached.
+    """
+    if len(timestamp_iso) >= 20 and timestamp_iso[-1] == "Z" and timestamp_iso[4] == "-" and timestamp_iso[7] == "-" \
+            and timestamp_iso[10] == "T" and timestamp_iso[13] == ":" and timestamp_iso[16] == ":":
+        fraction = timestamp_iso[20:-1] if timestamp_iso[19] == "." else ""
+        fields = (timestamp_iso[0:4], timestamp_iso[5:7], timestamp_iso[8:10],
+                  timestamp_iso[11:13], timestamp_iso[14:16], timestamp_iso[17:19])
+        if (len(timestamp_iso) == 20 or (timestamp_iso[19] == "." and 0 < len(fraction) <= 6 and fraction.isdigit())) \
+                and "".join(fields).isdigit():
+            try:
+                # datetime rejects out of range fields (e.g. Feb 30) like strptime, timegm alone would normalize them
+                timestamp_parsed = datetime(*(int(field) for field in fields))
+            except ValueError:
+                return _parse_timestamp_millis_strptime(timestamp_iso)
+            return calendar.timegm(timestamp_parsed.utctimetuple()) * 1000 + int(fraction[:3].ljust(3, "0"))
+    return _parse_timestamp_millis_strptime(timestamp_iso)
+
+
+def _parse_timestamp_millis_strptime(timestamp_iso: str) -> int:
+    try:
+        timestamp_parsed = datetime.strptime(timestamp_iso, "%Y-%m-%dT%H:%M:%SZ")
+    except ValueError:
+        timestamp_parsed = datetime.strptime(timestamp_iso, "%Y-%m-%dT%H:%M:%S.%fZ")
+
+    timestamp_datetime = timestamp_parsed.replace(tzinfo=timezone.utc)
+    return int(timestamp_datetime.timestamp() * 1000)
+
+
 def gauge_line(min, max, count, sum) -> str:
     return f"min={min},max={max},count={count},sum={sum}"
 
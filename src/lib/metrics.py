@@ -17,7 +17,7 @@
 import re
 from dataclasses import dataclass
 from datetime import timedelta
-from typing import List, Text, Any, Dict
+from typing import List, Text, Any, Dict, Iterable, Optional, Tuple
 from lib.configuration import config
 
 VARIABLE_BRACKETS_PATTERN=re.compile("{{.*?}}")
@@ -33,29 +33,85 @@ class DimensionValue:
     value: Text
 
 
+def render_dimensions(dimension_values: Iterable[DimensionValue]) -> str:
+    rendered_dimension_values = [f'{dimension_value.name[0:ALLOWED_METRIC_DIMENSION_KEY_LENGTH]}="{dimension_value.value[0:ALLOWED_METRIC_DIMENSION_VALUE_LENGTH]}"'
+                                 for dimension_value
+                                 in dimension_values
+                                 if dimension_value.value != ""]  # MINT rejects line with empty dimension value
+    dimensions = ",".join(rendered_dimension_values)
+    if dimensions:
+        dimensions = "," + dimensions
+    return dimensions
+
+
+@dataclass(frozen=True)
+class EntityEnrichment:
+    """
+    Dimensions describing single entity (e.g. its ip address), shared by all time series of the entity.
+    They are created and rendered to string once, when entity id map is built.
+    """
+    dimension_values: Tuple[DimensionValue, ...]
+    dimensions_string: Text
+
+    @staticmethod
+    def of(dimension_values: Iterable[DimensionValue]) -> 'EntityEnrichment':
+        dimension_values = tuple(dimension_values)
+        return EntityEnrichment(dimension_values, render_dimensions(dimension_values))
+
+
+class IngestSeries:
+    """
+    Part of ingest line shared by all data points of single time series.
+    Metric key and dimensions are rendered to string only once, when first line of the series is serialized.
+    """
+
+    def __init__(self, entity_id: Text, metric_name: Text, metric_type: Text, dimension_values: List[DimensionValue]):
+        self.entity_id = entity_id
+        self.metric_name = metric_name
+        self.metric_type = metric_type
+        self.dimension_values = dimension_values
+        self.enrichment: Optional[EntityEnrichment] = None
+        self._prefix = None
+
+    def enrich(self, enrichment: EntityEnrichment):
+        self.enrichment = enrichment
+        self._prefix = None
+
+    def all_dimension_values(self) -> List[DimensionValue]:
+        if self.enrichment is None:
+            return self.dimension_values
+        return [*self.dimension_values, *self.enrichment.dimension_values]
+
+    def dimensions_string(self) -> str:
+        dimensions = render_dimensions(self.dimension_values)
+        if self.enrichment is not None:
+            dimensions += self.enrichment.dimensions_string
+        return dimensions
+
+    def prefix(self) -> str:
+        if self._prefix is None:
+            separator = ',' if self.metric_type == 'gauge' else '='
+            metric_type = self.metric_type if self.metric_type != 'count' else 'count,delta'
+            self._prefix = f"{self.metric_name[0:ALLOWED_METRIC_KEY_LENGTH]}{self.dimensions_string()} {metric_type}{separator}"
+        return self._prefix
+
+
 @dataclass(frozen=True)
 class IngestLine:
-    entity_id: Text
-    metric_name: Text
-    metric_type: Text
+    series: IngestSeries
     value: Any
     timestamp: int
-    dimension_values: List[DimensionValue]
 
-    def dimensions_string(self) -> str:
-        dimension_values = [f'{dimension_value.name[0:ALLOWED_METRIC_DIMENSION_KEY_LENGTH]}="{dimension_value.value[0:ALLOWED_METRIC_DIMENSION_VALUE_LENGTH]}"'
-                            for dimension_value
-                            in self.dimension_values
-                            if dimension_value.value != ""]  # MINT rejects line with empty dimension value
-        dimensions = ",".join(dimension_values)
-        if dimensions:
-            dimensions = "," + dimensions
-        return dimensions
+    @property
+    def entity_id(self) -> Text:
+        return self.series.entity_id
+
+    @property
+    def dimension_values(self) -> List[DimensionValue]:
+        return self.series.all_dimension_values()
 
     def to_string(self) -> str:
-        separator = ',' if self.metric_type == 'gauge' else '='
-        metric_type = self.metric_type if self.metric_type != 'count' else 'count,delta'
-        return f"{self.metric_name[0:ALLOWED_METRIC_KEY_LENGTH]}{self.dimensions_string()} {metric_type}{separator}{self.value} {self.timestamp}"
+        return f"{self.series.prefix()}{self.value} {self.timestamp}"
 
 
 @dataclass(frozen=True)
@@ -117,6 +173,9 @@ class Metric:
         else:
             object.__setattr__(self, "sample_period_seconds", timedelta(seconds=60))
 
+    def __hash__(self):
+        return hash((self.google_metric, self.dynatrace_name, self.google_metric_kind, self.value_type))
+
 
 @dataclass(frozen=True)
 class GCPService:
@@ -128,7 +187,7 @@ class GCPService:
     technology_name: Text
     feature_set: Text
     dimensions: List[Dimension]
-    metrics = List[Metric]
+    metrics: List[Metric]
     monitoring_filter: Text
     activation: Dict[Text, Any]
 
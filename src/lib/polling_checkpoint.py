@@ -0,0 +1,161 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import itertools
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple, Optional, Set
+
+from lib.metrics import GCPService, Metric, IngestLine
+
+CARRIED_FETCH_MAX_AGE = timedelta(hours=1)
+
+
+@dataclass(frozen=True)
+class PendingFetch:
+    project_id: str
+    service: GCPService
+    metric: Metric
+    project_filter: str
+    # end of the queried time window (before ingest delay of the metric is applied)
+    execution_time: datetime
+    # "<index>/<count>" of the project filter among partitions of metrics scope, empty without partitions
+    project_partition: str = ""
+    # set when the fetch is resumed: start of its original window and the next page to fetch
+    start_time: Optional[datetime] = None
+    page_token: Optional[str] = None
+
+
+@dataclass
+class InterruptedPolling:
+    # lines which were fetched, but were not sent to Dynatrace yet
+    unpushed_lines: List[Tuple[str, List[IngestLine]]]
+    # lines of batches which were being sent when the polling was cancelled, they may have been ingested already
+    maybe_sent_lines_count: int
+    # finished fetches of projects, whose push didn't finish
+    fetched: List[PendingFetch]
+    carried_fetches_count: int
+
+
+class PollingCheckpoint:
+    """
+    Progress of current polling, kept so it is not lost when the polling is cancelled on timeout:
+    ingest lines which were fetched but not pushed yet (pending lines and batches being pushed)
+    and fetches which didn't finish. After interruption unfinished fetches are carried into next polling,
+    so they can be repeated with their original time window. Fetch which already handed some of its pages over
+    for the push is resumed from the next page instead.
+    """
+
+    def __init__(self):
+        self.carried_fetches: List[PendingFetch] = []
+        self._fetch_ids = itertools.count()
+        self._unfinished_fetches: Dict[int, PendingFetch] = {}
+        # next page token of fetches which already delivered some pages
+        self._partially_delivered_fetches: Dict[int, Optional[str]] = {}
+        self._fetched: Dict[str, List[PendingFetch]] = {}
+        self._pending_lines: Dict[str, List[IngestLine]] = {}
+        self._pushing: Dict[int, Tuple[str, List[IngestLine]]] = {}
+        self._sending: Set[int] = set()
+
+    def start_polling(self, execution_time: datetime):
+        self._clear()
+        self.carried_fetches = [fetch for fetch in self.carried_fetches
+                                if execution_time - fetch.execution_time <= CARRIED_FETCH_MAX_AGE]
+
+    def take_carried_fetches(self, project_id: str) -> List[PendingFetch]:
+        project_fetches = [fetch for fetch in self.carried_fetches if fetch.project_id == project_id]
+        self.carried_fetches = [fetch for fetch in self.carried_fetches if fetch.project_id != project_id]
+        return project_fetches
+
+    def start_fetch(self, fetch: PendingFetch, start_time: datetime) -> int:
+        fetch_id = next(self._fetch_ids)
+        self._unfinished_fetches[fetch_id] = replace(fetch, start_time=start_time)
+        return fetch_id
+
+    def fetch_delivered_page(self, fetch_id: int, next_page_token: Optional[str]):
+        """
+        Lines of the fetch were already handed over for the push, repeating the whole fetch would duplicate them,
+        so it is resumed from next_page_token (None if there is no next page)
+        """
+        self._partially_delivered_fetches[fetch_id] = next_page_token
+
+    def finish_fetch(self, fetch_id: int):
+        self._unfinished_fetches.pop(fetch_id, None)
+        self._partially_delivered_fetches.pop(fetch_id, None)
+
+    def fetched(self, project_id: str) -> List[PendingFetch]:
+        """
+        Fetches of the project which finished successfully and wait for the push of their lines.
+        List is filled by the caller.
+        """
+        return self._fetched.setdefault(project_id, [])
+
+    def take_fetched(self, project_id: str) -> List[PendingFetch]:
+        return self._fetched.pop(project_id, [])
+
+    def pending_lines(self, project_id: str) -> List[IngestLine]:
+        """
+        Fetched lines of the project, which are not in any batch being pushed yet. List is filled by the caller.
+        """
+        return self._pending_lines.setdefault(project_id, [])
+
+    def take_pending_lines(self, project_id: str) -> List[IngestLine]:
+        return self._pending_lines.pop(project_id, [])
+
+    def start_push(self, project_id: str, lines_batch: List[IngestLine]):
+        self._pushing[id(lines_batch)] = (project_id, lines_batch)
+
+    def finish_push(self, lines_batch: List[IngestLine]):
+        self._pushing.pop(id(lines_batch), None)
+        self._sending.discard(id(lines_batch))
+
+    def start_sending(self, lines_batch: List[IngestLine]):
+        """
+        Ingest request with the batch is in flight, if it's cancelled, batch may have been ingested already
+        """
+        self._sending.add(id(lines_batch))
+
+    def finish_sending(self, lines_batch: List[IngestLine]):
+        self._sending.discard(id(lines_batch))
+
+    def interrupt(self) -> InterruptedPolling:
+        unpushed = [(project_id, lines) for project_id, lines in self._pending_lines.items() if lines]
+        unpushed.extend(project_lines for batch_id, project_lines in self._pushing.items()
+                        if batch_id not in self._sending)
+        maybe_sent_lines_count = sum(len(lines) for batch_id, (_, lines) in self._pushing.items()
+                                     if batch_id in self._sending)
+        fetched = [fetch for project_fetched in self._fetched.values() for fetch in project_fetched]
+
+        carried_fetches = []
+        for fetch_id, fetch in self._unfinished_fetches.items():
+            if fetch_id not in self._partially_delivered_fetches:
+                carried_fetches.append(fetch)
+                continue
+            next_page_token = self._partially_delivered_fetches[fetch_id]
+            if next_page_token:
+                carried_fetches.append(replace(fetch, page_token=next_page_token))
+        self.carried_fetches.extend(carried_fetches)
+
+        self._clear()
+        return InterruptedPolling(unpushed, maybe_sent_lines_count, fetched, len(carried_fetches))
+
+    def _clear(self):
+        self._unfinished_fetches.clear()
+        self._partially_delivered_fetches.clear()
+        self._fetched.clear()
+        self._pending_lines.clear()
+        self._pushing.clear()
+        self._sending.clear()
+
+
+polling_checkpoint = PollingCheckpoint()
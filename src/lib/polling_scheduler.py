@@ -0,0 +1,88 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import asyncio
+import time
+from typing import Dict, List, Tuple, Set, Awaitable, Callable
+
+from lib.context import get_int_environment_value
+
+DURATION_SMOOTHING_FACTOR = 0.3
+DEADLINE_SAFETY_MARGIN_SECONDS = 10
+
+
+class PollingSpreadScheduler:
+    """
+    Spreads start of projects processing over part of the polling interval, instead of starting all of them
+    at the beginning of the polling, to avoid CPU/network spikes and bursts of GCP API requests.
+
+    Start offsets are planned from recent processing durations of the projects (exponential moving average):
+    the longest projects start first, and no project starts later than its expected duration allows to finish
+    before the end of the polling interval. Projects which didn't finish in previous polling are behind
+    and start right away.
+    """
+
+    def __init__(self, spread_percent: int):
+        self.spread_percent = min(max(spread_percent, 0), 100)
+        self.durations: Dict[str, float] = {}
+        self._unfinished: Set[str] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.spread_percent > 0
+
+    def plan(self, projects_ids: List[str], interval_seconds: float) -> List[Tuple[str, float]]:
+        """
+        Returns projects with start offsets [s] from the beginning of the polling, in order of priority
+        """
+        behind = self._unfinished.intersection(projects_ids)
+        self._unfinished = set(projects_ids)
+        if not self.enabled:
+            return [(project_id, 0.0) for project_id in projects_ids]
+
+        default_duration = max(self.durations.values(), default=0.0)
+
+        def expected_duration(project_id: str) -> float:
+            return self.durations.get(project_id, default_duration)
+
+        ordered = sorted(projects_ids, key=lambda project_id: (project_id not in behind, -expected_duration(project_id)))
+        spread_window = interval_seconds * self.spread_percent / 100
+        step = spread_window / len(ordered) if ordered else 0
+
+        planned = []
+        for position, project_id in enumerate(ordered):
+            if project_id in behind:
+                offset = 0.0
+            else:
+                latest_start = interval_seconds - DEADLINE_SAFETY_MARGIN_SECONDS - expected_duration(project_id)
+                offset = max(0.0, min(position * step, latest_start))
+            planned.append((project_id, offset))
+        return planned
+
+    def record(self, project_id: str, duration: float):
+        self._unfinished.discard(project_id)
+        previous = self.durations.get(project_id, None)
+        if previous is None:
+            self.durations[project_id] = duration
+        else:
+            self.durations[project_id] = previous + DURATION_SMOOTHING_FACTOR * (duration - previous)
+
+    async def run(self, project_id: str, offset: float, create_task: Callable[[], Awaitable]):
+        if offset > 0:
+            await asyncio.sleep(offset)
+        start_time = time.time()
+        await create_task()
+        self.record(project_id, time.time() - start_time)
+
+
+polling_scheduler = PollingSpreadScheduler(get_int_environment_value("METRICS_POLLING_SPREAD_PERCENT", 0))
@@ -0,0 +1,133 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import asyncio
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import List, Set, Dict, Optional
+
+from lib.clientsession_provider import init_gcp_client_session
+from lib.configuration import config
+from lib.context import MetricsContext, LoggingContext, get_int_environment_value
+from lib.credentials import get_all_accessible_projects, create_token
+from lib.gcp_apis import get_disabled_projects_and_disabled_apis_by_project_id
+from lib.sharding import replica_shard, projects_are_sharded
+
+
+@dataclass
+class ProjectDiscoverySnapshot:
+    projects_ids: List[str]
+    disabled_projects: Set[str] = field(default_factory=set)
+    disabled_apis_by_project_id: Dict[str, Set[str]] = field(default_factory=dict)
+    use_x_goog_user_project_header: Dict[str, bool] = field(default_factory=dict)
+    refreshed_at: float = field(default_factory=time.time)
+
+
+class ProjectDiscoveryCache:
+    """
+    Keeps accessible projects and their disabled APIs between pollings.
+
+    Only the first polling waits for the discovery, later pollings use the last snapshot right away and the refresh
+    runs in background: full one (disabled APIs of all projects are checked again) after refresh interval passes,
+    otherwise incremental one - only the list of projects is fetched and just the new projects are checked.
+    """
+
+    def __init__(self, refresh_interval_seconds: int):
+        self.refresh_interval_seconds = refresh_interval_seconds
+        self.snapshot: Optional[ProjectDiscoverySnapshot] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._logging_context = LoggingContext("PROJECT_DISCOVERY")
+
+    async def get_snapshot(self, context: MetricsContext) -> ProjectDiscoverySnapshot:
+        if self.snapshot is None or self.refresh_interval_seconds <= 0:
+            self.snapshot = await discover_projects(context)
+        elif not self._refresh_in_progress():
+            full_refresh = time.time() - self.snapshot.refreshed_at >= self.refresh_interval_seconds
+            self._refresh_task = asyncio.ensure_future(self._refresh_in_background(context.project_id_owner, full_refresh))
+
+        context.use_x_goog_user_project_header.update(self.snapshot.use_x_goog_user_project_header)
+        return self.snapshot
+
+    def _refresh_in_progress(self) -> bool:
+        # tasks are bound to event loop, refresh started by other (e.g. already finished) loop won't finish
+        return self._refresh_task is not None and not self._refresh_task.done() \
+               and self._refresh_task.get_loop() is asyncio.get_event_loop()
+
+    async def _refresh_in_background(self, project_id_owner: str, full_refresh: bool):
+        # session of the polling is closed when the polling finishes, so refresh uses its own
+        try:
+            async with init_gcp_client_session() as gcp_session:
+                token = await create_token(self._logging_context, gcp_session)
+                context = MetricsContext(gcp_session, None, project_id_owner, token, datetime.utcnow(), 0, "", "",
+                                         False, False, None)
+                if full_refresh:
+                    snapshot = await discover_projects(context)
+                else:
+                    snapshot = await discover_new_projects(context, self.snapshot)
+            # listing projects returns no projects when it fails, losing access to all of them at once is unlikely
+            if not snapshot.projects_ids and self.snapshot.projects_ids:
+                self._logging_context.error("Refreshed projects discovery found no projects, will use previous one")
+                return
+            self.snapshot = snapshot
+        except Exception as e:
+            self._logging_context.error(f"Failed to refresh projects discovery, will use previous one; {e}")
+
+
+async def get_owned_accessible_projects(context: MetricsContext) -> List[str]:
+    """
+    With sharding by projects, replica discovers only projects it owns, so APIs of other projects are not checked
+    """
+    projects_ids = await get_all_accessible_projects(context, context.gcp_session, context.token)
+    if projects_are_sharded():
+        projects_ids = replica_shard.owned(projects_ids)
+        context.log(f"Sharding: {replica_shard} handles {len(projects_ids)} projects")
+    return projects_ids
+
+
+async def discover_projects(context: MetricsContext) -> ProjectDiscoverySnapshot:
+    projects_ids = await get_owned_accessible_projects(context)
+    snapshot = ProjectDiscoverySnapshot(projects_ids)
+
+    # Using metrics scope feature, checking disabled apis in every project is not needed
+    if not config.scoping_project_support_enabled():
+        snapshot.disabled_projects, snapshot.disabled_apis_by_project_id = \
+            await get_disabled_projects_and_disabled_apis_by_project_id(context, projects_ids)
+    snapshot.use_x_goog_user_project_header = dict(context.use_x_goog_user_project_header)
+    return snapshot
+
+
+async def discover_new_projects(context: MetricsContext, previous: ProjectDiscoverySnapshot) -> ProjectDiscoverySnapshot:
+    projects_ids = await get_owned_accessible_projects(context)
+    snapshot = ProjectDiscoverySnapshot(
+        projects_ids=projects_ids,
+        disabled_projects=previous.disabled_projects.intersection(projects_ids),
+        disabled_apis_by_project_id={project_id: disabled_apis
+                                     for project_id, disabled_apis in previous.disabled_apis_by_project_id.items()
+                                     if project_id in projects_ids},
+        use_x_goog_user_project_header=dict(previous.use_x_goog_user_project_header),
+        refreshed_at=previous.refreshed_at
+    )
+
+    new_projects_ids = [project_id for project_id in projects_ids if project_id not in previous.projects_ids]
+    if new_projects_ids and not config.scoping_project_support_enabled():
+        context.log("Checking disabled APIs of new projects: " + ", ".join(new_projects_ids))
+        new_disabled_projects, new_disabled_apis_by_project_id = \
+            await get_disabled_projects_and_disabled_apis_by_project_id(context, new_projects_ids)
+        snapshot.disabled_projects.update(new_disabled_projects)
+        snapshot.disabled_apis_by_project_id.update(new_disabled_apis_by_project_id)
+        snapshot.use_x_goog_user_project_header.update(context.use_x_goog_user_project_header)
+    return snapshot
+
+
+project_discovery_cache = ProjectDiscoveryCache(get_int_environment_value("PROJECT_DISCOVERY_REFRESH_INTERVAL_MIN", 15) * 60)
@@ -0,0 +1,146 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import math
+from datetime import datetime
+from typing import Dict, List, Tuple, Set
+
+from lib.fetch_scheduler import extract_api_name
+from lib.metrics import GCPService, Metric
+
+# keeps length of the project filter within limits of Cloud Monitoring API
+MAX_PROJECTS_PER_PARTITION = 100
+
+
+class DtDimensionsMap:
+    def __init__(self) -> None:
+        self.dt_dimensions_set_by_source_dimension: Dict[str, Set[str]] = {}
+        self._sorted_dt_dimensions_by_source_dimension: Dict[str, Tuple[str, ...]] = {}
+
+    def add_label_mapping(self, source_dimension, dt_target_dimension):
+        all_dt_dims_for_source_dim = self.dt_dimensions_set_by_source_dimension.get(source_dimension, set())
+        all_dt_dims_for_source_dim.add(dt_target_dimension)
+        self.dt_dimensions_set_by_source_dimension[source_dimension] = all_dt_dims_for_source_dim
+        self._sorted_dt_dimensions_by_source_dimension.pop(source_dimension, None)
+
+    def get_dt_dimensions(self, source_dimension, dt_dimension_if_unmapped) -> Tuple[str, ...]:
+        # dt_label_if_unmapped - shouldn't happen, but if we get dimension back that we didn't query for (=not defined in map), it would be unsafe to discard it
+        # (could result in duplicate metric entries for remaining dim label+value set):
+        # report it to Dt under dt_label_if_unmapped - this is expected to be last part for full source dimension label, e.g.:
+        # resource.label.unrequestedDimensionLabel > unrequestedDimensionLabel
+        # sorted result is remembered, the same labels come back in every time series of the metric
+        dt_dimension_sorted = self._sorted_dt_dimensions_by_source_dimension.get(source_dimension, None)
+        if dt_dimension_sorted is None:
+            dt_dimensions_set = self.dt_dimensions_set_by_source_dimension.get(source_dimension, {dt_dimension_if_unmapped})
+            dt_dimension_sorted = tuple(sorted(dt_dimensions_set))
+            self._sorted_dt_dimensions_by_source_dimension[source_dimension] = dt_dimension_sorted
+        return dt_dimension_sorted
+
+
+def with_project_filter(filter_param: Tuple[str, str], project_filter: str) -> Tuple[str, str]:
+    if not project_filter:
+        return filter_param
+    return filter_param[0], f"{filter_param[1]} {project_filter}"
+
+
+def project_partition_filters(projects_ids: List[str], partitions: int) -> List[str]:
+    """
+    Splits projects monitored by metrics scope into given number of partitions (at most one per project),
+    so single metric can be queried in scoping project with several parallel requests, e.g.:
+    resource.labels.project_id = one_of("project-a","project-c")
+    Single partition needs no filter, query of the scoping project returns time series of the whole metrics scope.
+    Partitions are added if needed, so no filter lists more than MAX_PROJECTS_PER_PARTITION projects.
+    """
+    if partitions <= 1:
+        return [""]
+    sorted_projects_ids = sorted(projects_ids)
+    partitions = max(partitions, math.ceil(len(sorted_projects_ids) / MAX_PROJECTS_PER_PARTITION))
+    partitions = max(1, min(partitions, len(sorted_projects_ids)))
+    project_filters = []
+    for partition in range(partitions):
+        partition_projects_ids = sorted_projects_ids[partition::partitions]
+        projects = ",".join(f'"{project_id}"' for project_id in partition_projects_ids)
+        project_filters.append(f'resource.labels.project_id = one_of({projects})')
+    return project_filters
+
+
+class MetricQueryPlan:
+    """
+    Everything needed to query timeSeries of single metric, which depends only on service and metric configuration
+    """
+
+    def __init__(self, service: GCPService, metric: Metric):
+        reducer = 'REDUCE_SUM'
+        aligner = 'ALIGN_SUM'
+
+        if metric.value_type.lower() == 'bool':
+            aligner = 'ALIGN_COUNT_TRUE'
+        elif metric.google_metric_kind.lower().startswith('cumulative'):
+            aligner = 'ALIGN_DELTA'
+
+        self.filter_param = ('filter', f'metric.type = "{metric.google_metric}" {service.monitoring_filter}'.strip())
+        aggregation_params = [
+            ('aggregation.alignmentPeriod', f"{metric.sample_period_seconds.total_seconds()}s"),
+            ('aggregation.perSeriesAligner', aligner),
+            ('aggregation.crossSeriesReducer', reducer)
+        ]
+
+        self.dt_dimensions_mapping = DtDimensionsMap()
+        for dimension in service.dimensions + metric.dimensions:
+            if dimension.key_for_send_to_dynatrace:
+                self.dt_dimensions_mapping.add_label_mapping(dimension.key_for_fetch_metric, dimension.key_for_send_to_dynatrace)
+
+            aggregation_params.append(('aggregation.groupByFields', dimension.key_for_fetch_metric))
+
+        self.aggregation_params = tuple(aggregation_params)
+        self.entity_id_label_keys = tuple(dimension.key_for_create_entity_id for dimension in service.dimensions)
+        self.api = extract_api_name(metric.google_metric)
+
+    def params(self, start_time: datetime, end_time: datetime, project_filter: str = "") -> List[Tuple[str, str]]:
+        return [
+            with_project_filter(self.filter_param, project_filter),
+            ('interval.startTime', start_time.isoformat() + "Z"),
+            ('interval.endTime', end_time.isoformat() + "Z"),
+            *self.aggregation_params
+        ]
+
+
+class QueryPlanCache:
+    """
+    Query plans are reused across pollings. Plans are keyed by value of service and metric configuration,
+    so they survive refresh of the configuration which re-parses it into new, but equal objects.
+    """
+
+    def __init__(self):
+        self._plans: Dict[Tuple[GCPService, Metric], MetricQueryPlan] = {}
+
+    def get(self, service: GCPService, metric: Metric) -> MetricQueryPlan:
+        key = (service, metric)
+        plan = self._plans.get(key, None)
+        if plan is None:
+            plan = MetricQueryPlan(service, metric)
+            self._plans[key] = plan
+        return plan
+
+    def refresh(self, services: List[GCPService], new_services: List[GCPService]):
+        """
+        Drops plans of the previous configuration, only if refreshed configuration differs from it
+        """
+        if new_services != services:
+            self.invalidate()
+
+    def invalidate(self):
+        self._plans.clear()
+
+    def __len__(self):
+        return len(self._plans)
@@ -23,6 +23,7 @@ LOG_SELF_MONITORING_PROCESSING_TIME_METRIC_TYPE = LOG_SELF_MONITORING_METRIC_PRE
 LOG_SELF_MONITORING_SENDING_TIME_SIZE_METRIC_TYPE = LOG_SELF_MONITORING_METRIC_PREFIX + "/sending_time"
 LOG_SELF_MONITORING_LOG_INGEST_PAYLOAD_SIZE_METRIC_TYPE = LOG_SELF_MONITORING_METRIC_PREFIX + "/log_ingest_payload_size"
 LOG_SELF_MONITORING_SENT_LOGS_ENTRIES_METRIC_TYPE = LOG_SELF_MONITORING_METRIC_PREFIX + "/sent_logs_entries"
+LOG_SELF_MONITORING_CONNECTIONS_METRIC_TYPE = LOG_SELF_MONITORING_METRIC_PREFIX + "/connections"
 
 DYNATRACE_TENANT_URL_LABEL_DESCRIPTOR = {
     "key": "dynatrace_tenant_url",
@@ -198,6 +199,26 @@ LOG_SELF_MONITORING_SENT_LOGS_ENTRIES_METRIC_DESCRIPTOR = {
     ]
 }
 
+LOG_SELF_MONITORING_CONNECTIONS_METRIC_DESCRIPTOR = {
+    "type": LOG_SELF_MONITORING_CONNECTIONS_METRIC_TYPE,
+    "valueType": "INT64",
+    "metricKind": "GAUGE",
+    "description": "Number of log ingest requests sent over new or reused keep-alive connection",
+    "displayName": "Dynatrace Log Integration connections",
+    "unit": "1",
+    "monitoredResourceTypes": ["generic_task"],
+    "labels": [
+        DYNATRACE_TENANT_URL_LABEL_DESCRIPTOR,
+        LOGS_SUBSCRIPTION_ID_LABEL_DESCRIPTOR,
+        CONTAINER_NAME,
+        {
+            "key": "connection_type",
+            "valueType": "STRING",
+            "description": "Whether request opened new connection or reused pooled one"
+        }
+    ]
+}
+
 LOG_SELF_MONITORING_METRIC_MAP = {
     LOG_SELF_MONITORING_ALL_REQUESTS_METRIC_TYPE: LOG_SELF_MONITORING_ALL_REQUESTS_METRIC_DESCRIPTOR,
     LOG_SELF_MONITORING_CONNECTIVITY_METRIC_TYPE: LOG_SELF_MONITORING_CONNECTIVITY_METRIC_DESCRIPTOR,
@@ -208,6 +229,7 @@ LOG_SELF_MONITORING_METRIC_MAP = {
     LOG_SELF_MONITORING_PROCESSING_TIME_METRIC_TYPE: LOG_SELF_MONITORING_PROCESSING_TIME_METRIC_DESCRIPTOR,
     LOG_SELF_MONITORING_SENDING_TIME_SIZE_METRIC_TYPE: LOG_SELF_MONITORING_SENDING_TIME_SIZE_METRIC_DESCRIPTOR,
     LOG_SELF_MONITORING_LOG_INGEST_PAYLOAD_SIZE_METRIC_TYPE: LOG_SELF_MONITORING_LOG_INGEST_PAYLOAD_SIZE_METRIC_DESCRIPTOR,
-    LOG_SELF_MONITORING_SENT_LOGS_ENTRIES_METRIC_TYPE: LOG_SELF_MONITORING_SENT_LOGS_ENTRIES_METRIC_DESCRIPTOR
+    LOG_SELF_MONITORING_SENT_LOGS_ENTRIES_METRIC_TYPE: LOG_SELF_MONITORING_SENT_LOGS_ENTRIES_METRIC_DESCRIPTOR,
+    LOG_SELF_MONITORING_CONNECTIONS_METRIC_TYPE: LOG_SELF_MONITORING_CONNECTIONS_METRIC_DESCRIPTOR
 }
 
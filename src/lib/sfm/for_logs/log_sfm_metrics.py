@@ -29,6 +29,8 @@ class LogSelfMonitoring:
         self.sending_time: float = 0
         self.log_ingest_payload_size: float = 0
         self.sent_logs_entries: int = 0
+        self.new_connections: int = 0
+        self.reused_connections: int = 0
 
     def calculate_processing_time(self):
         self.processing_time = (time.perf_counter() - self.processing_time_start)
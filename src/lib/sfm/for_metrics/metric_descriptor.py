@@ -17,6 +17,9 @@ SELF_MONITORING_CONNECTIVITY_METRIC_TYPE = SELF_MONITORING_METRIC_PREFIX + "/con
 SELF_MONITORING_INGEST_LINES_METRIC_TYPE = SELF_MONITORING_METRIC_PREFIX + "/ingest_lines"
 SELF_MONITORING_REQUEST_COUNT_METRIC_TYPE = SELF_MONITORING_METRIC_PREFIX + "/request_count"
 SELF_MONITORING_PHASE_EXECUTION_TIME_METRIC_TYPE = SELF_MONITORING_METRIC_PREFIX + "/phase_execution_time"
+SELF_MONITORING_FETCH_QUEUE_WAIT_TIME_METRIC_TYPE = SELF_MONITORING_METRIC_PREFIX + "/fetch_queue_wait_time"
+SELF_MONITORING_FETCH_IN_FLIGHT_REQUESTS_METRIC_TYPE = SELF_MONITORING_METRIC_PREFIX + "/fetch_in_flight_requests"
+SELF_MONITORING_INGEST_COMPRESSION_RATIO_METRIC_TYPE = SELF_MONITORING_METRIC_PREFIX + "/ingest_compression_ratio"
 
 DYNATRACE_TENANT_URL_LABEL_DESCRIPTOR = {
     "key": "dynatrace_tenant_url",
@@ -115,10 +118,56 @@ SELF_MONITORING_PHASE_EXECUTION_TIME_METRIC_DESCRIPTOR = {
     ]
 }
 
+SELF_MONITORING_FETCH_QUEUE_WAIT_TIME_METRIC_DESCRIPTOR = {
+    "type": SELF_MONITORING_FETCH_QUEUE_WAIT_TIME_METRIC_TYPE,
+    "valueType": "DOUBLE",
+    "metricKind": "GAUGE",
+    "description": "Dynatrace integration self monitoring metric",
+    "displayName": "Dynatrace Integration Fetch Queue Wait Time",
+    "unit": "s",
+    "monitoredResourceTypes": ["generic_task"],
+    "labels": [
+        FUNCTION_NAME_LABEL_DESCRIPTOR,
+        DYNATRACE_TENANT_URL_LABEL_DESCRIPTOR,
+        PROJECT_ID_LABEL_DESCRIPTOR,
+    ]
+}
+
+SELF_MONITORING_FETCH_IN_FLIGHT_REQUESTS_METRIC_DESCRIPTOR = {
+    "type": SELF_MONITORING_FETCH_IN_FLIGHT_REQUESTS_METRIC_TYPE,
+    "valueType": "INT64",
+    "metricKind": "GAUGE",
+    "description": "Dynatrace integration self monitoring metric",
+    "displayName": "Dynatrace Integration Fetch In Flight Requests",
+    "unit": "1",
+    "monitoredResourceTypes": ["generic_task"],
+    "labels": [
+        FUNCTION_NAME_LABEL_DESCRIPTOR,
+        DYNATRACE_TENANT_URL_LABEL_DESCRIPTOR,
+    ]
+}
+
+SELF_MONITORING_INGEST_COMPRESSION_RATIO_METRIC_DESCRIPTOR = {
+    "type": SELF_MONITORING_INGEST_COMPRESSION_RATIO_METRIC_TYPE,
+    "valueType": "DOUBLE",
+    "metricKind": "GAUGE",
+    "description": "Dynatrace integration self monitoring metric",
+    "displayName": "Dynatrace Integration Ingest Compression Ratio",
+    "unit": "1",
+    "monitoredResourceTypes": ["generic_task"],
+    "labels": [
+        FUNCTION_NAME_LABEL_DESCRIPTOR,
+        DYNATRACE_TENANT_URL_LABEL_DESCRIPTOR,
+    ]
+}
+
 SELF_MONITORING_METRIC_MAP = {
     SELF_MONITORING_CONNECTIVITY_METRIC_TYPE: SELF_MONITORING_CONNECTIVITY_METRIC_DESCRIPTOR,
     SELF_MONITORING_INGEST_LINES_METRIC_TYPE: SELF_MONITORING_INGEST_LINES_METRIC_DESCRIPTOR,
     SELF_MONITORING_REQUEST_COUNT_METRIC_TYPE: SELF_MONITORING_REQUEST_COUNT_METRIC_DESCRIPTOR,
     SELF_MONITORING_PHASE_EXECUTION_TIME_METRIC_TYPE: SELF_MONITORING_PHASE_EXECUTION_TIME_METRIC_DESCRIPTOR,
+    SELF_MONITORING_FETCH_QUEUE_WAIT_TIME_METRIC_TYPE: SELF_MONITORING_FETCH_QUEUE_WAIT_TIME_METRIC_DESCRIPTOR,
+    SELF_MONITORING_FETCH_IN_FLIGHT_REQUESTS_METRIC_TYPE: SELF_MONITORING_FETCH_IN_FLIGHT_REQUESTS_METRIC_DESCRIPTOR,
+    SELF_MONITORING_INGEST_COMPRESSION_RATIO_METRIC_TYPE: SELF_MONITORING_INGEST_COMPRESSION_RATIO_METRIC_DESCRIPTOR,
 }
 
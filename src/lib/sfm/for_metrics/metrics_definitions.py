@@ -16,6 +16,9 @@ class SfmKeys(enum.Enum):
     fetch_gcp_data_execution_time = 7
     push_to_dynatrace_execution_time = 8
     dynatrace_connectivity = 9
+    fetch_queue_wait_time = 10
+    fetch_in_flight_requests = 11
+    dynatrace_ingest_compression_ratio = 12
 
 
 class SfmMetric:
@@ -267,4 +270,89 @@ class SFMMetricDynatraceConnectivity(SfmMetric):
             [{
                 "interval": interval,
                 "value": {"int64Value": 1}
-            }])]
\ No newline at end of file
+            }])]
+
+
+class SFMMetricFetchQueueWaitTime(SfmMetric):
+    key = SELF_MONITORING_METRIC_PREFIX + "/fetch_queue_wait_time"
+    description = "Max GCP Monitoring API request wait time in fetch scheduler queue [per project]"
+
+    def __init__(self):
+        self.value = {}
+
+    def update(self, project, time):
+        self.value[project] = max(self.value.get(project, 0), time)
+
+    def generate_timeseries_datapoints(self, context, interval):
+        time_series = []
+        for project_id, time in self.value.items():
+            time_series.append(create_timeseries_datapoint(
+                context, self.key,
+                {
+                    "function_name": context.function_name,
+                    "dynatrace_tenant_url": context.dynatrace_url,
+                    "project_id": project_id,
+                },
+                [{
+                    "interval": interval,
+                    "value": {"doubleValue": time}
+                }],
+                "DOUBLE"))
+        return time_series
+
+
+class SFMMetricFetchInFlightRequests(SfmMetric):
+    key = SELF_MONITORING_METRIC_PREFIX + "/fetch_in_flight_requests"
+    description = "Max GCP Monitoring API requests in flight"
+
+    def __init__(self):
+        self.value = 0
+
+    def update(self, in_flight: int):
+        self.value = max(self.value, in_flight)
+
+    def generate_timeseries_datapoints(self, context, interval):
+        if not self.value:
+            return []
+        return [create_timeseries_datapoint(
+            context, self.key,
+            {
+                "function_name": context.function_name,
+                "dynatrace_tenant_url": context.dynatrace_url,
+            },
+            [{
+                "interval": interval,
+                "value": {"int64Value": self.value}
+            }])]
+
+
+class SFMMetricDynatraceIngestCompressionRatio(SfmMetric):
+    key = SELF_MONITORING_METRIC_PREFIX + "/ingest_compression_ratio"
+    description = "Dynatrace MINT ingest payload compression ratio"
+
+    def __init__(self):
+        self.uncompressed_bytes = 0
+        self.compressed_bytes = 0
+
+    @property
+    def value(self):
+        return self.uncompressed_bytes / self.compressed_bytes if self.compressed_bytes else 0
+
+    def update(self, uncompressed_bytes: int, compressed_bytes: int):
+        self.uncompressed_bytes += uncompressed_bytes
+        self.compressed_bytes += compressed_bytes
+
+    def generate_timeseries_datapoints(self, context, interval):
+        if not self.compressed_bytes:
+            return []
+        return [create_timeseries_datapoint(
+            context, self.key,
+            {
+                "function_name": context.function_name,
+                "dynatrace_tenant_url": context.dynatrace_url,
+            },
+            [{
+                "interval": interval,
+                "value": {"doubleValue": self.value}
+            }],
+            "DOUBLE")]
@@ -0,0 +1,109 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import hashlib
+import os
+import re
+from typing import List
+
+from lib.configuration import config
+from lib.context import get_int_environment_value
+
+# name of the StatefulSet deployed by helm chart, its pods are named <name>-<ordinal>
+STATEFUL_SET_NAME = "dynatrace-gcp-monitor"
+# pods of Deployment (<name>-<replica set hash>-<suffix>) can end with digits as well, they don't match the pattern
+STATEFUL_SET_POD_NAME_PATTERN = re.compile(rf"^{re.escape(STATEFUL_SET_NAME)}-(0|[1-9]\d*)$")
+
+
+class ReplicaShard:
+    """
+    Part of the workload (projects or services) handled by single replica of gcp-monitor.
+
+    Work is assigned with rendezvous (highest random weight) hashing: every replica computes the same weights
+    for the key, so replicas agree on the owner without any coordination. When replica count changes,
+    only keys owned by the added/removed replica move.
+    """
+
+    def __init__(self, replica_index: int, replica_count: int):
+        self.configure(replica_index, replica_count)
+
+    def configure(self, replica_index: int, replica_count: int):
+        self.replica_count = max(1, replica_count)
+        self.replica_index = replica_index
+
+    @property
+    def enabled(self) -> bool:
+        return self.replica_count > 1
+
+    def owner(self, key: str) -> int:
+        return max(range(self.replica_count), key=lambda replica_index: _weight(key, replica_index))
+
+    def owns(self, key: str) -> bool:
+        return not self.enabled or self.owner(key) == self.replica_index
+
+    def owned(self, keys: List[str]) -> List[str]:
+        return [key for key in keys if self.owns(key)]
+
+    def __str__(self):
+        return f"replica {self.replica_index} of {self.replica_count}"
+
+
+def _weight(key: str, replica_index: int) -> int:
+    digest = hashlib.sha256(f"{replica_index}:{key}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big")
+
+
+def replica_index_from_environment(replica_count: int) -> int:
+    """
+    SHARDING_REPLICA_INDEX if set, otherwise ordinal of StatefulSet pod taken from its hostname (e.g. gcp-monitor-2).
+    With more than one replica, the index has to be known - guessing it would make replicas handle the same shard
+    """
+    if replica_count <= 1:
+        return 0
+    replica_index = get_int_environment_value("SHARDING_REPLICA_INDEX", -1)
+    if replica_index < 0:
+        hostname = os.environ.get("HOSTNAME", "")
+        ordinal_match = STATEFUL_SET_POD_NAME_PATTERN.match(hostname)
+        if not ordinal_match:
+            raise ValueError(f"Cannot determine replica index of {replica_count} replicas: hostname '{hostname}' "
+                             f"is not a pod of StatefulSet {STATEFUL_SET_NAME} and SHARDING_REPLICA_INDEX is not set")
+        replica_index = int(ordinal_match.group(1))
+    if replica_index >= replica_count:
+        raise ValueError(f"Replica index {replica_index} is out of range of {replica_count} replicas")
+    return replica_index
+
+
+def shard_from_environment() -> ReplicaShard:
+    replica_count = max(1, get_int_environment_value("SHARDING_REPLICA_COUNT", 1))
+    return ReplicaShard(replica_index_from_environment(replica_count), replica_count)
+
+
+def configure_replica_shard_from_environment():
+    """
+    Called before the first polling, not at import, so that misconfigured replica fails pre launch check
+    instead of the import of every module using the shard. Raises ValueError if replica index cannot be determined
+    """
+    shard = shard_from_environment()
+    replica_shard.configure(shard.replica_index, shard.replica_count)
+
+
+def projects_are_sharded() -> bool:
+    """
+    Metrics scope query covers all projects at once, with it services are split between replicas instead of projects
+    """
+    scoped_query = config.scoping_project_support_enabled() and config.metrics_scope_query_enabled()
+    return replica_shard.enabled and not scoped_query
+
+
+# single replica until configure_replica_shard_from_environment is called
+replica_shard = ReplicaShard(0, 1)
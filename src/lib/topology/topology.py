@@ -1,28 +1,15 @@
 import asyncio
-from typing import List, Set, Dict, Iterable, Awaitable
+import time
+from datetime import datetime
+from typing import List, Set, Dict, Iterable, Awaitable, Tuple
 
-from lib.context import MetricsContext
+from lib.clientsession_provider import init_gcp_client_session
+from lib.context import MetricsContext, LoggingContext, get_int_environment_value
+from lib.credentials import create_token
 from lib.entities import entities_extractors
+from lib.entities.enrichment import create_entity_enrichment
 from lib.entities.model import Entity
-from lib.metrics import GCPService
-
-
-async def fetch_topology(context: MetricsContext, project_id: str, services: List[GCPService], disabled_apis: Set[str]) \
-        -> Dict[GCPService, Iterable[Entity]]:
-
-    topology_tasks_by_service: Dict[GCPService, Awaitable[Iterable[Entity]]] = {}
-
-    for service in choose_services_for_topology_fetch(context, project_id, services, disabled_apis):
-        topology_function = entities_extractors[service.name].extractor(context, project_id, service)
-        topology_task = asyncio.create_task(topology_function)
-        topology_tasks_by_service[service] = topology_task
-
-    topology_by_service: Dict[GCPService, Iterable[Entity]] = {}
-
-    for service, task in topology_tasks_by_service.items():
-        topology_by_service[service] = await task
-
-    return topology_by_service
+from lib.metrics import GCPService, EntityEnrichment
 
 
 def choose_services_for_topology_fetch(
@@ -54,14 +41,125 @@ def choose_services_for_topology_fetch(
     return services_for_topology_fetch
 
 
-def build_entity_id_map(fetch_topology_results: List[Iterable[Entity]]) -> Dict[str, Entity]:
+def build_entity_id_map(fetch_topology_results: List[Iterable[Entity]]) -> Dict[str, EntityEnrichment]:
     result = {}
     for result_set in fetch_topology_results:
-        for entity in result_set:
-            # Ensure order of entries to avoid "flipping" when choosing the first one for dimension value
-            entity.dns_names.sort()
-            entity.ip_addresses.sort()
-            entity.tags.sort()
-            entity.listen_ports.sort()
-            result[entity.id] = entity
+        add_to_entity_id_map(result, result_set)
     return result
+
+
+def add_to_entity_id_map(entity_id_map: Dict[str, EntityEnrichment], entities: Iterable[Entity]):
+    for entity in entities:
+        # Ensure order of entries to avoid "flipping" when choosing the first one for dimension value
+        entity.dns_names.sort()
+        entity.ip_addresses.sort()
+        entity.tags.sort()
+        entity.listen_ports.sort()
+        # dimensions are the same for all metrics of the entity, so they are prepared just once
+        entity_id_map[entity.id] = create_entity_enrichment(entity)
+
+
+class ProjectTopology:
+    """
+    Entities of single project per service, with entity id map updated only with changes of refreshed service
+    """
+
+    def __init__(self):
+        self.entities_by_service: Dict[GCPService, List[Entity]] = {}
+        self.fetched_at_by_service: Dict[GCPService, float] = {}
+        self.entity_id_map: Dict[str, EntityEnrichment] = {}
+        # the same entity can be returned for several services, e.g. for two feature sets of single service
+        self._services_by_entity_id: Dict[str, Set[GCPService]] = {}
+
+    def update(self, service: GCPService, entities: Iterable[Entity]):
+        entities = list(entities)
+        new_entity_ids = {entity.id for entity in entities}
+        for old_entity in self.entities_by_service.get(service, []):
+            if old_entity.id in new_entity_ids:
+                continue
+            services = self._services_by_entity_id.get(old_entity.id, set())
+            services.discard(service)
+            if not services:
+                self._services_by_entity_id.pop(old_entity.id, None)
+                self.entity_id_map.pop(old_entity.id, None)
+
+        add_to_entity_id_map(self.entity_id_map, entities)
+        for entity in entities:
+            self._services_by_entity_id.setdefault(entity.id, set()).add(service)
+        self.entities_by_service[service] = entities
+        self.fetched_at_by_service[service] = time.time()
+
+    def remove(self, service: GCPService):
+        self.update(service, [])
+        self.entities_by_service.pop(service, None)
+        self.fetched_at_by_service.pop(service, None)
+
+
+class TopologyCache:
+    """
+    Keeps entities per (project, service) between pollings. Metrics fetch starts right away with cached entities,
+    entities older than ttl_seconds are refreshed in background (stale-while-revalidate).
+    Services without cached entities, including services which had no instances, are fetched before metrics fetch,
+    so metrics of newly created instances are not skipped.
+    """
+
+    def __init__(self, ttl_seconds: int):
+        self.ttl_seconds = ttl_seconds
+        self._projects: Dict[str, ProjectTopology] = {}
+        self._refresh_tasks: Dict[Tuple[str, GCPService], asyncio.Task] = {}
+        self._logging_context = LoggingContext("TOPOLOGY")
+
+    async def fetch_topology(self, context: MetricsContext, project_id: str, services: List[GCPService],
+                             disabled_apis: Set[str]) -> Tuple[Dict[GCPService, Iterable[Entity]], Dict[str, EntityEnrichment]]:
+        project_topology = self._projects.setdefault(project_id, ProjectTopology())
+        services_for_topology_fetch = choose_services_for_topology_fetch(context, project_id, services, disabled_apis)
+
+        for cached_service in list(project_topology.entities_by_service.keys()):
+            if cached_service not in services_for_topology_fetch:
+                project_topology.remove(cached_service)
+
+        topology_tasks_by_service: Dict[GCPService, Awaitable[Iterable[Entity]]] = {}
+        now = time.time()
+        for service in services_for_topology_fetch:
+            cached_entities = project_topology.entities_by_service.get(service, None)
+            if not cached_entities or self.ttl_seconds <= 0:
+                topology_function = entities_extractors[service.name].extractor(context, project_id, service)
+                topology_tasks_by_service[service] = asyncio.create_task(topology_function)
+            elif now - project_topology.fetched_at_by_service[service] >= self.ttl_seconds:
+                self._refresh_in_background(context, project_id, service, project_topology)
+
+        for service, task in topology_tasks_by_service.items():
+            project_topology.update(service, await task)
+
+        topology_by_service: Dict[GCPService, Iterable[Entity]] = {
+            service: project_topology.entities_by_service[service] for service in services_for_topology_fetch
+        }
+        return topology_by_service, project_topology.entity_id_map
+
+    def _refresh_in_background(self, context: MetricsContext, project_id: str, service: GCPService,
+                               project_topology: ProjectTopology):
+        key = (project_id, service)
+        refresh_task = self._refresh_tasks.get(key, None)
+        # tasks are bound to event loop, refresh started by other (e.g. already finished) loop won't finish
+        if refresh_task is not None and not refresh_task.done() and refresh_task.get_loop() is asyncio.get_event_loop():
+            return
+
+        # session of the polling can be closed before background refresh finishes, so refresh uses its own
+        async def refresh():
+            try:
+                async with init_gcp_client_session() as gcp_session:
+                    token = await create_token(self._logging_context, gcp_session)
+                    refresh_context = MetricsContext(gcp_session, None, context.project_id_owner, token,
+                                                     datetime.utcnow(), 0, "", "", False, False, None)
+                    refresh_context.use_x_goog_user_project_header.update(context.use_x_goog_user_project_header)
+                    entities = await entities_extractors[service.name].extractor(refresh_context, project_id, service)
+                project_topology.update(service, entities)
+            except Exception as e:
+                context.log(project_id, f"Failed to refresh topology of {service.name}, will use previous one; {e}")
+            finally:
+                self._refresh_tasks.pop(key, None)
+
+        self._refresh_tasks[key] = asyncio.ensure_future(refresh())
+
+
+topology_cache = TopologyCache(get_int_environment_value("TOPOLOGY_CACHE_TTL_MIN", 10) * 60)
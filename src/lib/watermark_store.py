@@ -0,0 +1,122 @@
+#     Copyright 2023 Dynatrace LLC
+#
+#     Licensed under the Apache License, Version 2.0 (the "License");
+#     you may not use this file except in compliance with the License.
+#     You may obtain a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#     Unless required by applicable law or agreed to in writing, software
+#     distributed under the License is distributed on an "AS IS" BASIS,
+#     WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#     See the License for the specific language governing permissions and
+#     limitations under the License.
+import hashlib
+import os
+import struct
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+from lib.configuration import config
+from lib.context import LoggingContext, get_int_environment_value
+
+# fixed size records: 16 bytes hash of the key, end of the last fetched and pushed window in microseconds since epoch
+WATERMARK_RECORD = struct.Struct("<16sq")
+WATERMARK_RETENTION = timedelta(days=1)
+EPOCH = datetime(1970, 1, 1)
+
+
+def _key_hash(key: str) -> bytes:
+    return hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+
+
+def _to_micros(timestamp: datetime) -> int:
+    return (timestamp - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(micros: int) -> datetime:
+    return EPOCH + timedelta(microseconds=micros)
+
+
+class WatermarkStore:
+    """
+    End of the last successfully fetched and pushed time window per (project, service, metric), persisted in a file,
+    so fetch can resume from it after pod restart or polling slower than the polling interval
+    instead of leaving a gap, and doesn't fetch the same window twice.
+
+    File consists of fixed size records (see WATERMARK_RECORD), it's read at first use and rewritten
+    (atomically, through temporary file) after every polling, so it can be kept on emptyDir volume.
+    """
+
+    def __init__(self, path: str, max_catch_up: timedelta):
+        self.path = path
+        self.max_catch_up = max_catch_up
+        self._watermarks: Optional[Dict[bytes, int]] = None
+        self._changed = False
+        self._logging_context = LoggingContext("WATERMARKS")
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def window_start(self, key: str, start_time: datetime, end_time: datetime) -> Optional[datetime]:
+        """
+        Start of the window which should be fetched to get data up to end_time, None if it was already fetched.
+        Without watermark the default start_time is used, catch up is limited to max_catch_up before end_time.
+        """
+        watermark = self._load().get(_key_hash(key), None)
+        if watermark is None:
+            return start_time
+        watermark_time = _from_micros(watermark)
+        if watermark_time >= end_time:
+            return None
+        return max(watermark_time, end_time - self.max_catch_up)
+
+    def has_watermark(self, key: str) -> bool:
+        return _key_hash(key) in self._load()
+
+    def advance(self, key: str, end_time: datetime):
+        watermarks = self._load()
+        key_hash = _key_hash(key)
+        end_micros = _to_micros(end_time)
+        if watermarks.get(key_hash, -1) < end_micros:
+            watermarks[key_hash] = end_micros
+            self._changed = True
+
+    def save(self):
+        if not self.enabled or not self._changed:
+            return
+        watermarks = self._load()
+        # watermarks of metrics which are not fetched anymore are dropped
+        oldest_kept = max(watermarks.values(), default=0) - _to_micros(EPOCH + WATERMARK_RETENTION)
+        records = b"".join(WATERMARK_RECORD.pack(key_hash, watermark)
+                           for key_hash, watermark in watermarks.items() if watermark >= oldest_kept)
+        temporary_path = f"{self.path}.tmp"
+        try:
+            with open(temporary_path, "wb") as watermarks_file:
+                watermarks_file.write(records)
+            os.replace(temporary_path, self.path)
+            self._changed = False
+        except OSError as e:
+            self._logging_context.error(f"Failed to save metric watermarks to {self.path}: {e}")
+
+    def _load(self) -> Dict[bytes, int]:
+        if self._watermarks is not None:
+            return self._watermarks
+        self._watermarks = {}
+        if not self.enabled or not os.path.exists(self.path):
+            return self._watermarks
+        try:
+            with open(self.path, "rb") as watermarks_file:
+                content = watermarks_file.read()
+            complete_records_length = len(content) - len(content) % WATERMARK_RECORD.size
+            for key_hash, watermark in WATERMARK_RECORD.iter_unpack(content[:complete_records_length]):
+                self._watermarks[key_hash] = watermark
+            self._logging_context.log(f"Loaded {len(self._watermarks)} metric watermarks from {self.path}")
+        except OSError as e:
+            self._logging_context.error(f"Failed to load metric watermarks from {self.path}, starting without them: {e}")
+        return self._watermarks
+
+
+metric_watermarks = WatermarkStore(config.metric_watermark_file(),
+                                   timedelta(minutes=get_int_environment_value("METRIC_WATERMARK_MAX_CATCH_UP_MIN", 60)))
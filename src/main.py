@@ -16,22 +16,29 @@ import asyncio
 import hashlib
 import time
 from datetime import datetime
-from typing import Dict, List, Optional, Set, Iterable
+from functools import partial
+from typing import Dict, List, Optional, Set, Iterable, Tuple, AsyncIterator, Sequence, Callable
 
 
 from lib.clientsession_provider import init_dt_client_session, init_gcp_client_session
 from lib.configuration import config
 from lib.context import MetricsContext, LoggingContext, get_query_interval_minutes
-from lib.credentials import create_token, get_project_id_from_environment, fetch_dynatrace_api_key, fetch_dynatrace_url, \
-    get_all_accessible_projects
+from lib.credentials import create_token, get_project_id_from_environment, fetch_dynatrace_api_key, fetch_dynatrace_url
 from lib.entities.model import Entity
 from lib.fast_check import check_dynatrace, check_version
-from lib.gcp_apis import get_disabled_projects_and_disabled_apis_by_project_id
-from lib.metric_ingest import fetch_metric, push_ingest_lines, flatten_and_enrich_metric_results
-from lib.metrics import GCPService, Metric, IngestLine
+from lib.fetch_scheduler import extract_api_name
+from lib.metric_ingest import push_ingest_lines, flatten_and_enrich_metric_results, \
+    fetch_metric_pages, push_ingest_lines_from_queue, push_spilled_ingest_lines
+from lib.metrics import GCPService, Metric, IngestLine, EntityEnrichment
+from lib.polling_checkpoint import polling_checkpoint, PendingFetch
+from lib.polling_scheduler import polling_scheduler
+from lib.project_discovery import project_discovery_cache
+from lib.query_plan import project_partition_filters
+from lib.sharding import replica_shard
 from lib.self_monitoring import log_self_monitoring_metrics, sfm_push_metrics, sfm_create_descriptors_if_missing
 from lib.sfm.for_metrics.metrics_definitions import SfmKeys
-from lib.topology.topology import fetch_topology, build_entity_id_map
+from lib.topology.topology import topology_cache
+from lib.watermark_store import metric_watermarks
 from lib.sfm.api_call_latency import ApiCallLatency
 
 
@@ -94,34 +101,58 @@ async def query_metrics(execution_id: Optional[str], services: Optional[List[GCP
             scheduled_execution_id=context.scheduled_execution_id
         )
 
-        projects_ids = await get_all_accessible_projects(context, gcp_session, token)
-
-        disabled_projects = set()
-        disabled_apis_by_project_id = {}
-
-        # Using metrics scope feature, checking disabled apis in every project is not needed
-        if not config.scoping_project_support_enabled():
-            disabled_projects, disabled_apis_by_project_id = \
-                await get_disabled_projects_and_disabled_apis_by_project_id(context, projects_ids)
+        # projects and their disabled apis are discovered in background, polling uses last known snapshot
+        projects_discovery = await project_discovery_cache.get_snapshot(context)
+        projects_ids = projects_discovery.projects_ids
+        disabled_apis_by_project_id = projects_discovery.disabled_apis_by_project_id
 
+        disabled_projects = set(projects_discovery.disabled_projects)
         disabled_projects.update(filter(None, config.excluded_projects().split(',')))
 
         if disabled_projects:
             projects_ids = [x for x in projects_ids if x not in disabled_projects]
             context.log("Disabled projects: " + ", ".join(disabled_projects))
 
+        scoped_query = config.scoping_project_support_enabled() and config.metrics_scope_query_enabled()
+        # metrics scope query covers all projects at once, so services are split between replicas instead,
+        # otherwise projects are already split by the discovery, before their APIs are checked
+        if replica_shard.enabled and scoped_query:
+            services = [service for service in services
+                        if replica_shard.owns(f"{service.name}/{service.feature_set}")]
+            context.log(f"Sharding: {replica_shard} handles {len(services)} services")
+
         setup_time = (time.time() - setup_start_time)
         for project_id in projects_ids:
             context.sfm[SfmKeys.setup_execution_time].update(project_id, setup_time)
 
         context.start_processing_timestamp = time.time()
-
-        process_project_metrics_tasks = [
-            process_project_metrics(context, project_id, services, disabled_apis_by_project_id.get(project_id, set()))
-            for project_id
-            in projects_ids
-        ]
+        polling_checkpoint.start_polling(context.execution_time)
+
+        if scoped_query:
+            # metrics scope returns time series of all monitored projects, so every metric is queried
+            # only in the scoping project, monitored projects are split between parallel queries
+            project_filters = project_partition_filters(projects_ids, context.metrics_scope_query_partitions)
+            context.log(f"Querying metrics of {len(projects_ids)} projects through metrics scope of {project_id_owner} "
+                        f"with {len(project_filters)} queries per metric")
+            process_project_metrics_tasks = [
+                process_project_metrics(context, project_id_owner, services, set(), project_filters)
+            ] if projects_ids else []
+        else:
+            # with spreading enabled, projects don't start all at once, but at planned offsets within polling interval
+            planned_projects = polling_scheduler.plan(projects_ids, context.execution_interval.total_seconds())
+            if polling_scheduler.enabled:
+                context.log(f"Processing of {len(planned_projects)} projects is spread over "
+                            f"{max((offset for _, offset in planned_projects), default=0):.1f} s")
+            process_project_metrics_tasks = [
+                polling_scheduler.run(project_id, offset, partial(
+                    process_project_metrics, context, project_id, services,
+                    disabled_apis_by_project_id.get(project_id, set())))
+                for project_id, offset
+                in planned_projects
+            ]
+        process_project_metrics_tasks.append(push_spilled_ingest_lines(context))
         await asyncio.gather(*process_project_metrics_tasks, return_exceptions=True)
+        metric_watermarks.save()
         context.log(f"Fetched and pushed GCP data in {time.time() - context.start_processing_timestamp} s")
 
         log_self_monitoring_metrics(context)
@@ -138,29 +169,158 @@ async def query_metrics(execution_id: Optional[str], services: Optional[List[GCP
     # Noise on Windows at the end of the logs is caused by https://github.com/aio-libs/aiohttp/issues/4324
 
 
+async def push_interrupted_polling(logging_context: LoggingContext):
+    """
+    Called when polling was cancelled on timeout. Ingest lines which were fetched, but not sent yet, are pushed
+    right away with new sessions (sessions of the cancelled polling are already closed), lines which still fail
+    are spilled to next polling by the retry logic. Batches whose ingest request was in flight may have been
+    ingested, they are not pushed again. Unfinished fetches are repeated (or resumed) in next polling.
+    """
+    interrupted = polling_checkpoint.interrupt()
+    logging_context.log(f"Polling interrupted, {sum(len(lines) for _, lines in interrupted.unpushed_lines)} "
+                        f"unpushed ingest lines will be pushed, {interrupted.maybe_sent_lines_count} ingest lines "
+                        f"which were being sent are not pushed again, {interrupted.carried_fetches_count} "
+                        f"unfinished fetches will be repeated in next polling")
+
+    lines_by_project_id: Dict[str, List[IngestLine]] = {}
+    for project_id, lines in interrupted.unpushed_lines:
+        lines_by_project_id.setdefault(project_id, []).extend(lines)
+
+    pushed_projects_ids = set()
+    if lines_by_project_id:
+        try:
+            async with init_gcp_client_session() as gcp_session, init_dt_client_session() as dt_session:
+                token = await create_token(logging_context, gcp_session)
+                if not token:
+                    logging_context.error("Cannot push ingest lines of interrupted polling without authorization token")
+                    return
+                project_id_owner = get_project_id_from_environment()
+                context = MetricsContext(
+                    gcp_session=gcp_session,
+                    dt_session=dt_session,
+                    project_id_owner=project_id_owner,
+                    token=token,
+                    execution_time=datetime.utcnow(),
+                    execution_interval_seconds=60 * get_query_interval_minutes(),
+                    dynatrace_api_key=await fetch_dynatrace_api_key(gcp_session, project_id_owner, token),
+                    dynatrace_url=await fetch_dynatrace_url(gcp_session, project_id_owner, token),
+                    print_metric_ingest_input=config.print_metric_ingest_input(),
+                    self_monitoring_enabled=False,
+                    scheduled_execution_id=logging_context.scheduled_execution_id
+                )
+                projects_ids = list(lines_by_project_id)
+                push_results = await asyncio.gather(*[push_ingest_lines(context, project_id, lines)
+                                                      for project_id, lines in lines_by_project_id.items()],
+                                                    return_exceptions=True)
+                pushed_projects_ids = {project_id for project_id, pushed in zip(projects_ids, push_results)
+                                       if pushed is True}
+        except Exception as e:
+            logging_context.t_exception(f"Failed to push ingest lines of interrupted polling due to {e}")
+            return
+
+    # lines of the fetches are pushed now (or were being sent), so their windows are not fetched again
+    _advance_watermarks([fetch for fetch in interrupted.fetched
+                         if fetch.project_id in pushed_projects_ids or fetch.project_id not in lines_by_project_id])
+
+
 async def process_project_metrics(context: MetricsContext, project_id: str, services: List[GCPService],
-                                  disabled_apis: Set[str]):
+                                  disabled_apis: Set[str], project_filters: Sequence[str] = ("",)):
     try:
         context.log(project_id, f"Starting processing...")
-        ingest_lines = await fetch_ingest_lines_task(context, project_id, services, disabled_apis)
+        if config.metric_ingest_streaming_enabled():
+            await stream_project_metrics(context, project_id, services, disabled_apis, project_filters)
+            return
+        ingest_lines = await fetch_ingest_lines_task(context, project_id, services, disabled_apis, project_filters)
         fetch_data_time = time.time() - context.start_processing_timestamp
         context.sfm[SfmKeys.fetch_gcp_data_execution_time].update(project_id, fetch_data_time)
         context.log(project_id, f"Finished fetching data in {fetch_data_time}")
-        await push_ingest_lines(context, project_id, ingest_lines)
+        try:
+            pushed = await push_ingest_lines(context, project_id, ingest_lines)
+        finally:
+            fetched = polling_checkpoint.take_fetched(project_id)
+        if pushed:
+            _advance_watermarks(fetched)
     except Exception as e:
         context.t_exception(f"Failed to finish processing due to {e}")
 
 
+async def stream_project_metrics(context: MetricsContext, project_id: str, services: List[GCPService],
+                                 disabled_apis: Set[str], project_filters: Sequence[str] = ("",)):
+    """
+    Pushes ingest lines while metrics are still being fetched. Every fetched page is enriched and added to
+    pending batch right away, full batches wait in bounded queue for the push, so fetching slows down
+    (backpressure) instead of accumulating all lines of the project in memory.
+    """
+    entity_id_map, metrics_to_fetch = await prepare_metrics_to_fetch(context, project_id, services, disabled_apis)
+
+    fetches = prepare_fetches(context, project_id, metrics_to_fetch, project_filters)
+
+    batches_queue = asyncio.Queue(maxsize=context.metric_ingest_streaming_queue_size)
+    # lines are kept in polling checkpoint until they are pushed, so they are not lost on polling timeout
+    pending_lines = polling_checkpoint.pending_lines(project_id)
+    fetched = polling_checkpoint.fetched(project_id)
+
+    async def fetch_and_queue(fetch: PendingFetch):
+        async for page_lines in run_fetch_pages(context, fetch, fetched):
+            pending_lines.extend(flatten_and_enrich_metric_results(context, [page_lines], entity_id_map))
+            while len(pending_lines) >= context.metric_ingest_batch_size:
+                lines_batch = pending_lines[:context.metric_ingest_batch_size]
+                del pending_lines[:context.metric_ingest_batch_size]
+                polling_checkpoint.start_push(project_id, lines_batch)
+                await batches_queue.put(lines_batch)
+
+    push_task = asyncio.create_task(push_ingest_lines_from_queue(context, project_id, batches_queue))
+    try:
+        await asyncio.gather(*[fetch_and_queue(fetch) for fetch in fetches], return_exceptions=True)
+        fetch_data_time = time.time() - context.start_processing_timestamp
+        context.sfm[SfmKeys.fetch_gcp_data_execution_time].update(project_id, fetch_data_time)
+        context.log(project_id, f"Finished fetching data in {fetch_data_time}")
+
+        lines_batch = polling_checkpoint.take_pending_lines(project_id)
+        if lines_batch:
+            polling_checkpoint.start_push(project_id, lines_batch)
+            await batches_queue.put(lines_batch)
+    finally:
+        await batches_queue.put(None)
+        try:
+            pushed = await push_task
+        finally:
+            fetched = polling_checkpoint.take_fetched(project_id)
+    if pushed:
+        _advance_watermarks(fetched)
+
+
 async def fetch_ingest_lines_task(context: MetricsContext, project_id: str, services: List[GCPService],
-                                  disabled_apis: Set[str]) -> List[IngestLine]:
-    fetch_metric_coros = []
+                                  disabled_apis: Set[str], project_filters: Sequence[str] = ("",)) -> List[IngestLine]:
+    entity_id_map, metrics_to_fetch = await prepare_metrics_to_fetch(context, project_id, services, disabled_apis)
+
+    fetches = prepare_fetches(context, project_id, metrics_to_fetch, project_filters)
+
+    # lines of finished fetches are kept in polling checkpoint, so they are not lost on polling timeout
+    pending_lines = polling_checkpoint.pending_lines(project_id)
+    fetched = polling_checkpoint.fetched(project_id)
+
+    async def fetch_and_enrich(fetch: PendingFetch):
+        lines = await run_fetch(context, fetch, fetched)
+        pending_lines.extend(flatten_and_enrich_metric_results(context, [lines], entity_id_map))
+
+    await asyncio.gather(*[fetch_and_enrich(fetch) for fetch in fetches], return_exceptions=True)
+    return polling_checkpoint.take_pending_lines(project_id)
+
+
+async def prepare_metrics_to_fetch(context: MetricsContext, project_id: str, services: List[GCPService],
+                                   disabled_apis: Set[str]) \
+        -> Tuple[Dict[str, EntityEnrichment], List[Tuple[GCPService, Metric]]]:
+    metrics_to_fetch = []
     topology: Dict[GCPService, Iterable[Entity]] = {}
+    entity_id_map: Dict[str, EntityEnrichment] = {}
 
     # Topology fetching: retrieving additional instances info about enabled services
     # Using metrics scope feature, fetching topology is not needed,
     # because we can't fetch details from instances in other projects
     if not config.scoping_project_support_enabled():
-        topology = await fetch_topology(context, project_id, services, disabled_apis)
+        # cached entities are used right away, stale ones are refreshed in background
+        topology, entity_id_map = await topology_cache.fetch_topology(context, project_id, services, disabled_apis)
 
     # Using metrics scope feature, topology and disabled_apis will be empty, so no filtering is applied
     # and metrics from all projects are being collected
@@ -172,20 +332,13 @@ async def fetch_ingest_lines_task(context: MetricsContext, project_id: str, serv
             skipped_services_with_no_instances.append(f"{service.name}/{service.feature_set}")
             continue  # skip fetching the metrics because there are no instances
         for metric in service.metrics:
-            gcp_api_last_index = metric.google_metric.find("/")
-            api = metric.google_metric[:gcp_api_last_index]
+            api = extract_api_name(metric.google_metric)
             if api in disabled_apis:
                 skipped_disabled_apis.add(api)
                 continue  # skip fetching the metrics because service API is disabled
-            fetch_metric_coro = run_fetch_metric(
-                context=context,
-                project_id=project_id,
-                service=service,
-                metric=metric
-            )
-            fetch_metric_coros.append(fetch_metric_coro)
+            metrics_to_fetch.append((service, metric))
 
-    context.log(f"Prepared {len(fetch_metric_coros)} fetch metric tasks")
+    context.log(f"Prepared {len(metrics_to_fetch)} fetch metric tasks")
 
     if skipped_services_with_no_instances:
         skipped_services_string = ', '.join(skipped_services_with_no_instances)
@@ -194,20 +347,108 @@ async def fetch_ingest_lines_task(context: MetricsContext, project_id: str, serv
         skipped_disabled_apis_string = ", ".join(skipped_disabled_apis)
         context.log(project_id, f"Skipped fetching metrics for disabled APIs: {skipped_disabled_apis_string}")
 
-    fetch_metric_results = await asyncio.gather(*fetch_metric_coros, return_exceptions=True)
-    entity_id_map = build_entity_id_map(list(topology.values()))
-    flat_metric_results = flatten_and_enrich_metric_results(context, fetch_metric_results, entity_id_map)
-    return flat_metric_results
+    return entity_id_map, metrics_to_fetch
+
+
+def prepare_fetches(context: MetricsContext, project_id: str, metrics_to_fetch: List[Tuple[GCPService, Metric]],
+                    project_filters: Sequence[str]) -> List[PendingFetch]:
+    """
+    Fetches of current polling, preceded by fetches left unfinished by previous polling which timed out
+    """
+    fetches = polling_checkpoint.take_carried_fetches(project_id)
+    if metric_watermarks.enabled:
+        # gap left by unfinished fetch is closed by resuming from its watermark, repeating it would duplicate data,
+        # fetch with no watermark yet would leave the gap, so it is repeated
+        fetches = [fetch for fetch in fetches if not metric_watermarks.has_watermark(_watermark_key(fetch))]
+    if fetches:
+        context.log(project_id, f"Repeating {len(fetches)} fetches unfinished in previous polling")
+    partitions_count = len(project_filters)
+    for service, metric in metrics_to_fetch:
+        for partition, project_filter in enumerate(project_filters):
+            project_partition = f"{partition}/{partitions_count}" if project_filter else ""
+            fetches.append(PendingFetch(project_id, service, metric, project_filter, context.execution_time,
+                                        project_partition))
+    return fetches
+
+
+def _fetch_pages(context: MetricsContext, fetch: PendingFetch, start_time: datetime,
+                 on_page: Optional[Callable[[Optional[str]], None]] = None) -> AsyncIterator[List[IngestLine]]:
+    return fetch_metric_pages(context, fetch.project_id, fetch.service, fetch.metric,
+                              fetch.project_filter, fetch.execution_time, start_time, fetch.page_token, on_page)
+
+
+def _watermark_key(fetch: PendingFetch) -> str:
+    # keyed by the partition, not its project filter, which changes with every project added to metrics scope
+    service = fetch.service
+    return f"{fetch.project_id}|{fetch.project_partition}|" \
+           f"{service.name}/{service.feature_set}|{fetch.metric.google_metric}"
+
+
+def _fetch_end_time(fetch: PendingFetch) -> datetime:
+    return fetch.execution_time - fetch.metric.ingest_delay
+
+
+def _fetch_start_time(context: MetricsContext, fetch: PendingFetch) -> Optional[datetime]:
+    """
+    Start of the window to fetch, resumed from watermarks if they are enabled. None if the window was already fetched.
+    Fetch carried from interrupted polling keeps its window, so its next page token stays valid.
+    """
+    if fetch.start_time is not None:
+        return fetch.start_time
+    end_time = _fetch_end_time(fetch)
+    start_time = end_time - context.execution_interval
+    if not metric_watermarks.enabled:
+        return start_time
+    return metric_watermarks.window_start(_watermark_key(fetch), start_time, end_time)
 
 
-async def run_fetch_metric(
-        context: MetricsContext,
-        project_id: str,
-        service: GCPService,
-        metric: Metric
-):
+def _advance_watermarks(fetched: List[PendingFetch]):
+    """
+    Called after lines of the fetches were pushed, so window of fetch which failed to push is fetched again
+    """
+    if metric_watermarks.enabled:
+        for fetch in fetched:
+            metric_watermarks.advance(_watermark_key(fetch), _fetch_end_time(fetch))
+
+
+def _log_failed_fetch(context: MetricsContext, fetch: PendingFetch, e: Exception):
+    context.log(fetch.project_id,
+                f"Failed to finish task for [{fetch.metric.google_metric}], reason is {type(e).__name__} {e}")
+
+
+async def run_fetch(context: MetricsContext, fetch: PendingFetch, fetched: List[PendingFetch]) -> List[IngestLine]:
+    # fetch cancelled on polling timeout stays unfinished in the checkpoint and is repeated in next polling
+    start_time = _fetch_start_time(context, fetch)
+    if start_time is None:
+        return []
+    fetch_id = polling_checkpoint.start_fetch(fetch, start_time)
+    lines = []
     try:
-        return await fetch_metric(context, project_id, service, metric)
+        async for page_lines in _fetch_pages(context, fetch, start_time):
+            lines.extend(page_lines)
+        fetched.append(fetch)
     except Exception as e:
-        context.log(project_id, f"Failed to finish task for [{metric.google_metric}], reason is {type(e).__name__} {e}")
-        return []
+        _log_failed_fetch(context, fetch, e)
+        lines = []
+    polling_checkpoint.finish_fetch(fetch_id)
+    return lines
+
+
+async def run_fetch_pages(context: MetricsContext, fetch: PendingFetch,
+                          fetched: List[PendingFetch]) -> AsyncIterator[List[IngestLine]]:
+    start_time = _fetch_start_time(context, fetch)
+    if start_time is None:
+        return
+    fetch_id = polling_checkpoint.start_fetch(fetch, start_time)
+
+    def page_delivered(next_page_token: Optional[str]):
+        # page is handed over for the push right after it's yielded, without a chance to be cancelled in between
+        polling_checkpoint.fetch_delivered_page(fetch_id, next_page_token)
+
+    try:
+        async for page_lines in _fetch_pages(context, fetch, start_time, page_delivered):
+            yield page_lines
+        fetched.append(fetch)
+    except Exception as e:
+        _log_failed_fetch(context, fetch, e)
+    polling_checkpoint.finish_fetch(fetch_id)
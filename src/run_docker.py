@@ -28,12 +28,15 @@ from lib.dt_extensions.dt_extensions import extensions_fetch, prepare_services_c
 from lib.fast_check import LogsFastCheck
 from lib.instance_metadata import InstanceMetadataCheck, InstanceMetadata
 from lib.logs.log_forwarder import run_logs
+from lib.metric_ingest import query_plans
 from lib.metrics import GCPService
 from lib.self_monitoring import sfm_push_metrics
+from lib.sharding import configure_replica_shard_from_environment, replica_shard
 from lib.sfm.dashboards import import_self_monitoring_dashboard
 from lib.sfm.for_other.loop_timeout_metric import SFMMetricLoopTimeouts
+from lib.watermark_store import metric_watermarks
 from lib.webserver.webserver import run_webserver_on_asyncio_loop_forever
-from main import async_dynatrace_gcp_extension
+from main import async_dynatrace_gcp_extension, push_interrupted_polling
 from operation_mode import OperationMode
 
 OPERATION_MODE = OperationMode.from_environment_string(os.environ.get("OPERATION_MODE", None)) or OperationMode.Metrics
@@ -53,6 +56,14 @@ logging_context = LoggingContext(None)
 
 
 async def metrics_pre_launch_check() -> Optional[PreLaunchCheckResult]:
+    try:
+        configure_replica_shard_from_environment()
+    except ValueError as e:
+        logging_context.error(f'Monitoring disabled. Sharding is misconfigured: {e}')
+        return None
+    if replica_shard.enabled:
+        logging_context.log(f'Sharding enabled, running as {replica_shard}')
+
     async with init_gcp_client_session() as gcp_session, init_dt_client_session() as dt_session:
         token = await create_token(logging_context, gcp_session)
         if not token:
@@ -118,6 +129,8 @@ async def run_metrics_fetcher_forever():
             await sfm_send_loop_timeouts(True)
         except asyncio.exceptions.TimeoutError:
             logging_context.error('MAIN_LOOP', f'Single polling timed out and was stopped, timeout: {QUERY_TIMEOUT_SEC}s')
+            await push_interrupted_polling(logging_context)
+            metric_watermarks.save()
             await sfm_send_loop_timeouts(False)
 
     pre_launch_check_result = await metrics_pre_launch_check()
@@ -138,7 +151,9 @@ async def run_metrics_fetcher_forever():
 
         if config.keep_refreshing_extensions_config():
             logging_context.log('MAIN_LOOP', 'Refreshing services config')
-            services = await new_services_from_extensions_task
+            new_services = await new_services_from_extensions_task
+            query_plans.refresh(services, new_services)
+            services = new_services
 
         end_time_s = time.time()
 
@@ -0,0 +1,36 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+# Microbenchmark of data point timestamp parsing, run with: PYTHONPATH=src python tests/benchmarks/timestamp_parsing_benchmark.py
+import timeit
+
+from lib.metric_ingest import parse_timestamp_millis, _parse_timestamp_millis_strptime
+
+POINTS_COUNT = 100_000
+# points of single polling share just a few aligned end times
+TIMESTAMPS = [f"2023-01-01T10:0{i % 5}:00Z" for i in range(POINTS_COUNT)] + \
+             [f"2023-01-01T10:0{i % 5}:00.{i % 1000:06d}Z" for i in range(POINTS_COUNT)]
+UNIQUE_TIMESTAMPS = [f"2023-01-{1 + i % 28:02d}T{i % 24:02d}:{i % 60:02d}:{i % 59:02d}.{i:06d}Z" for i in range(POINTS_COUNT)]
+
+
+def run(name: str, parse, timestamps):
+    seconds = min(timeit.repeat(lambda: [parse(timestamp) for timestamp in timestamps], number=1, repeat=3))
+    print(f"{name:<40} {seconds * 1000:8.1f} ms  ({seconds / len(timestamps) * 1e9:6.0f} ns/point)")
+
+
+if __name__ == "__main__":
+    run("strptime, aligned timestamps", _parse_timestamp_millis_strptime, TIMESTAMPS)
+    run("fast path, aligned timestamps", parse_timestamp_millis, TIMESTAMPS)
+    run("strptime, unique timestamps", _parse_timestamp_millis_strptime, UNIQUE_TIMESTAMPS)
+    run("fast path, unique timestamps", parse_timestamp_millis.__wrapped__, UNIQUE_TIMESTAMPS)
@@ -60,7 +60,6 @@ def setup_test_variables(resource_path_root):
     lib.metric_ingest.GCP_MONITORING_URL = f"http://localhost:{MOCKED_API_PORT}/v3"
     lib.gcp_apis._GCP_SERVICE_USAGE_URL = f"http://localhost:{MOCKED_API_PORT}/v4"
     lib.entities.extractors.cloud_sql._SQL_ENDPOINT = f"http://localhost:{MOCKED_API_PORT}"
-    lib.entities.google_api._GCP_COMPUTE_ENDPOINT = f"http://localhost:{MOCKED_API_PORT}"
     lib.entities.extractors.gce_instance._GCP_COMPUTE_ENDPOINT = f"http://localhost:{MOCKED_API_PORT}"
     system_variables["GOOGLE_APPLICATION_CREDENTIALS"] = f"{resource_path_root}/metrics/token_for_tests.json"
 
@@ -0,0 +1,144 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import time
+from queue import Queue
+from types import SimpleNamespace
+from unittest import mock
+
+import pytest
+
+from lib.logs import log_forwarder
+from lib.logs.ack_leases import AckLeaseManager, chunk_ack_ids, ACK_IDS_CHUNK_SIZE, LEASE_MAX_DURATION_SECONDS, \
+    MAX_ACK_DEADLINE_SECONDS, LEASE_RENEWAL_MARGIN_SECONDS
+from lib.logs.logs_processor import LogProcessingJob
+from lib.logs.worker_state import WorkerState
+from lib.sfm.for_logs.log_sfm_metrics import LogSelfMonitoring
+
+
+class FakeSubscriberClient:
+    def __init__(self):
+        self.requests = []
+
+    def modify_ack_deadline(self, request):
+        self.requests.append(request)
+
+
+def leased_manager(subscriber_client: FakeSubscriberClient, ack_ids) -> AckLeaseManager:
+    lease_manager = AckLeaseManager(120, 60)
+    # background extending is tested through extend_expiring
+    with mock.patch.object(lease_manager, "_start_extending"):
+        lease_manager.lease(subscriber_client, "subscription", ack_ids)
+    return lease_manager
+
+
+def test_chunk_ack_ids():
+    assert chunk_ack_ids([]) == [[]]
+    assert chunk_ack_ids(["a", "b"]) == [["a", "b"]]
+    ack_ids = [f"ack-{i}" for i in range(ACK_IDS_CHUNK_SIZE * 2 + 1)]
+    assert [len(chunk) for chunk in chunk_ack_ids(ack_ids)] == [ACK_IDS_CHUNK_SIZE, ACK_IDS_CHUNK_SIZE, 1]
+
+
+def test_leases_are_extended_before_expiring():
+    subscriber_client = FakeSubscriberClient()
+    lease_manager = leased_manager(subscriber_client, ["ack-1", "ack-2"])
+
+    lease_manager.extend_expiring(time.monotonic())
+    assert subscriber_client.requests == []
+
+    lease_manager.extend_expiring(time.monotonic() + 50)
+    assert subscriber_client.requests == [
+        {"subscription": "subscription", "ack_ids": ["ack-1", "ack-2"], "ack_deadline_seconds": 120}
+    ]
+
+    # extended lease isn't extended again until it is about to expire
+    lease_manager.extend_expiring(time.monotonic() + 60)
+    assert len(subscriber_client.requests) == 1
+
+
+def test_released_leases_are_not_extended():
+    subscriber_client = FakeSubscriberClient()
+    lease_manager = leased_manager(subscriber_client, ["ack-1", "ack-2"])
+
+    lease_manager.release(["ack-1"])
+    lease_manager.extend_expiring(time.monotonic() + 50)
+
+    assert lease_manager.outstanding == 1
+    assert subscriber_client.requests[0]["ack_ids"] == ["ack-2"]
+
+
+def test_extension_is_chunked():
+    subscriber_client = FakeSubscriberClient()
+    lease_manager = leased_manager(subscriber_client, [f"ack-{i}" for i in range(ACK_IDS_CHUNK_SIZE + 10)])
+
+    lease_manager.extend_expiring(time.monotonic() + 50)
+
+    assert [len(request["ack_ids"]) for request in subscriber_client.requests] == [ACK_IDS_CHUNK_SIZE, 10]
+
+
+def test_too_old_leases_are_dropped():
+    subscriber_client = FakeSubscriberClient()
+    lease_manager = leased_manager(subscriber_client, ["ack-1"])
+
+    lease_manager.extend_expiring(time.monotonic() + LEASE_MAX_DURATION_SECONDS + 1)
+
+    assert lease_manager.outstanding == 0
+    assert subscriber_client.requests == []
+
+
+def test_disabled_lease_manager_does_not_track():
+    lease_manager = AckLeaseManager(0, 60)
+    lease_manager.lease(FakeSubscriberClient(), "subscription", ["ack-1"])
+
+    assert not lease_manager.enabled
+    assert lease_manager.outstanding == 0
+    assert lease_manager._thread is None
+
+
+def test_extension_is_limited_to_max_ack_deadline():
+    assert AckLeaseManager(1000, 60).extension_seconds == MAX_ACK_DEADLINE_SECONDS
+
+
+def test_extension_shorter_than_renewal_margin_is_rejected():
+    with pytest.raises(ValueError):
+        AckLeaseManager(LEASE_RENEWAL_MARGIN_SECONDS, 60)
+    assert not AckLeaseManager(0, 60).enabled
+
+
+class FakePullingSubscriberClient(FakeSubscriberClient):
+    def __init__(self, ack_ids):
+        super().__init__()
+        self.ack_ids = ack_ids
+
+    def pull(self, pull_request):
+        return SimpleNamespace(received_messages=[SimpleNamespace(ack_id=ack_id) for ack_id in self.ack_ids])
+
+
+def test_leases_are_released_when_processing_fails():
+    subscriber_client = FakePullingSubscriberClient(["ack-1", "ack-2", "ack-3"])
+    lease_manager = AckLeaseManager(120, 60)
+    worker_state = WorkerState("TEST")
+
+    def failing_processing(sfm_queue, received_messages):
+        yield LogProcessingJob('{"content": "log"}', LogSelfMonitoring())
+        raise Exception("Processing pool is broken")
+
+    with mock.patch.object(log_forwarder, "ack_lease_manager", lease_manager), \
+            mock.patch.object(lease_manager, "_start_extending"), \
+            mock.patch.object(log_forwarder, "process_received_messages", failing_processing):
+        with pytest.raises(Exception):
+            log_forwarder.perform_pull(worker_state, Queue(), subscriber_client, "subscription")
+
+    # first message waits in worker batch, its lease is released when the batch is flushed
+    assert worker_state.ack_ids == ["ack-1"]
+    assert lease_manager.outstanding == 1
@@ -0,0 +1,131 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import http.client
+import ssl
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import pytest
+
+from lib.logs.http_connection_pool import HttpConnectionPool
+
+
+class KeepAliveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.connections.add(self.client_address)
+        self.server.requests.append(self.path)
+        if self.path.endswith("/drop"):
+            # server fails after receiving the request, without response
+            self.close_connection = True
+            return
+        status = 200 if self.path == "/api/v2/logs/ingest" else 404
+        body = f"{status}".encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # server drops idle keep-alive connection without telling the client
+        self.close_connection = self.server.close_connections
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    http_server = ThreadingHTTPServer(("127.0.0.1", 0), KeepAliveHandler)
+    http_server.connections = set()
+    http_server.requests = []
+    http_server.close_connections = False
+    thread = threading.Thread(target=http_server.serve_forever, daemon=True)
+    thread.start()
+    yield http_server
+    http_server.shutdown()
+    http_server.server_close()
+
+
+def ingest_url(http_server) -> str:
+    return f"http://127.0.0.1:{http_server.server_address[1]}/api/v2/logs/ingest"
+
+
+@mock.patch.dict("os.environ", {"NO_PROXY": "127.0.0.1"})
+def test_connection_is_reused(server):
+    pool = HttpConnectionPool(2, 5, ssl.create_default_context())
+
+    responses = [pool.request("POST", ingest_url(server), b"[]", {}) for _ in range(3)]
+    pool.close()
+
+    assert [response.status for response in responses] == [200, 200, 200]
+    assert [response.reused_connection for response in responses] == [False, True, True]
+    assert len(server.connections) == 1
+
+
+@mock.patch.dict("os.environ", {"NO_PROXY": "127.0.0.1"})
+def test_error_response_is_returned(server):
+    pool = HttpConnectionPool(2, 5, ssl.create_default_context())
+
+    response = pool.request("POST", ingest_url(server).replace("ingest", "wrong"), b"[]", {})
+    pool.close()
+
+    assert response.status == 404
+    assert response.body == "404"
+
+
+@mock.patch.dict("os.environ", {"NO_PROXY": "127.0.0.1"})
+def test_connection_closed_by_server_is_replaced(server):
+    pool = HttpConnectionPool(2, 5, ssl.create_default_context())
+
+    server.close_connections = True
+    pool.request("POST", ingest_url(server), b"[]", {})
+    # let the server close the connection after response
+    time.sleep(0.1)
+    response = pool.request("POST", ingest_url(server), b"[]", {})
+    pool.close()
+
+    assert response.status == 200
+    assert not response.reused_connection
+
+
+@mock.patch.dict("os.environ", {"NO_PROXY": "127.0.0.1"})
+def test_connections_above_pool_size_are_closed(server):
+    pool = HttpConnectionPool(1, 5, ssl.create_default_context())
+
+    first = pool._connect(("http", "127.0.0.1", server.server_address[1]), None)
+    second = pool._connect(("http", "127.0.0.1", server.server_address[1]), None)
+    origin = ("http", "127.0.0.1", server.server_address[1])
+    first.connect()
+    second.connect()
+    pool._put_idle(origin, first)
+    pool._put_idle(origin, second)
+
+    assert pool._take_idle(origin) is first
+    assert pool._take_idle(origin) is None
+
+
+@mock.patch.dict("os.environ", {"NO_PROXY": "127.0.0.1"})
+def test_request_is_not_repeated_when_response_is_lost(server):
+    pool = HttpConnectionPool(2, 5, ssl.create_default_context())
+
+    pool.request("POST", ingest_url(server), b"[]", {})
+    with pytest.raises(http.client.RemoteDisconnected):
+        pool.request("POST", ingest_url(server) + "/drop", b"[]", {})
+    pool.close()
+
+    # request was sent through reused connection, it could have been processed already
+    assert server.requests == ["/api/v2/logs/ingest", "/api/v2/logs/ingest/drop"]
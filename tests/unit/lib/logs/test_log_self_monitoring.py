@@ -352,3 +352,15 @@ def test_self_monitoring_metrics():
 
     metric_data = create_self_monitoring_time_series(self_monitoring, context)
     assert metric_data == expected_metric_data
+
+
+def test_self_monitoring_connections_metrics():
+    self_monitoring = LogSelfMonitoring()
+    self_monitoring.new_connections = 1
+    self_monitoring.reused_connections = 7
+
+    time_series = create_self_monitoring_time_series(self_monitoring, context)["timeSeries"]
+    connections = {single_time_series["metric"]["labels"]["connection_type"]: single_time_series["points"][0]["value"]["int64Value"]
+                   for single_time_series in time_series
+                   if single_time_series["metric"]["type"] == "custom.googleapis.com/dynatrace/logs/connections"}
+    assert connections == {"new": 1, "reused": 7}
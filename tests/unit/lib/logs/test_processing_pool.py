@@ -0,0 +1,66 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import json
+from datetime import datetime, timezone
+from queue import Queue
+
+from lib.logs.logs_processor import process_message_in_worker_process
+from lib.logs.processing_pool import LogProcessingPool
+
+
+def log_message_data(content: str) -> bytes:
+    record = {"textPayload": content, "timestamp": datetime.now(timezone.utc).isoformat()}
+    return json.dumps(record).encode("UTF-8")
+
+
+def test_process_message_in_worker_process_returns_self_monitoring():
+    job, self_monitoring = process_message_in_worker_process("ack-id", datetime.now(timezone.utc),
+                                                             log_message_data("log content"))
+
+    assert job is not None
+    assert json.loads(json.loads(job.payload)["content"])["textPayload"] == "log content"
+    assert job.self_monitoring.processing_time > 0
+    assert self_monitoring == []
+
+
+def test_process_message_in_worker_process_invalid_message():
+    job, self_monitoring = process_message_in_worker_process("ack-id", datetime.now(timezone.utc), b"")
+
+    assert job is None
+    assert len(self_monitoring) == 1
+
+
+def test_processing_pool_keeps_messages_order():
+    pool = LogProcessingPool(2)
+    sfm_queue = Queue()
+    messages = [(f"ack-{i}", datetime.now(timezone.utc), log_message_data(f"log {i}")) for i in range(20)]
+    messages.append(("ack-empty", datetime.now(timezone.utc), b""))
+
+    try:
+        jobs = pool.process_messages(sfm_queue, messages)
+    finally:
+        pool._reset_executor()
+
+    assert [json.loads(json.loads(job.payload)["content"])["textPayload"] for job in jobs[:-1]] == [f"log {i}" for i in range(20)]
+    assert all(job.self_monitoring.processing_time > 0 for job in jobs[:-1])
+    assert jobs[-1] is None
+    # only self monitoring of failed processing is put into the queue, successful jobs carry it until sending
+    assert sfm_queue.qsize() == 1
+
+
+def test_processing_pool_disabled():
+    pool = LogProcessingPool(0)
+
+    assert not pool.enabled
+    assert pool.process_messages(Queue(), []) == []
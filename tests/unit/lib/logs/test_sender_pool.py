@@ -0,0 +1,93 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import threading
+from queue import Queue
+from unittest import mock
+
+from lib.logs import log_forwarder
+from lib.logs.logs_processor import LogProcessingJob
+from lib.logs.sender_pool import LogSenderPool
+from lib.logs.worker_state import WorkerState
+from lib.sfm.for_logs.log_sfm_metrics import LogSelfMonitoring
+
+
+class FakeSubscriberClient:
+    def __init__(self):
+        self.acked_ids = []
+
+    def acknowledge(self, request):
+        self.acked_ids.extend(request["ack_ids"])
+
+
+def worker_state_with_jobs(ack_ids) -> WorkerState:
+    worker_state = WorkerState("TEST")
+    for ack_id in ack_ids:
+        worker_state.add_job(LogProcessingJob('{"content": "log"}', LogSelfMonitoring()), ack_id)
+    return worker_state
+
+
+def test_in_flight_batches_are_bounded():
+    pool = LogSenderPool(1, 2)
+    release_sending = threading.Event()
+    submitted = []
+
+    def submit_batches():
+        for i in range(3):
+            pool.submit(release_sending.wait)
+            submitted.append(i)
+
+    submitting_thread = threading.Thread(target=submit_batches, daemon=True)
+    submitting_thread.start()
+    submitting_thread.join(0.5)
+    assert submitted == [0, 1]
+
+    release_sending.set()
+    submitting_thread.join(5)
+    assert submitted == [0, 1, 2]
+
+
+@mock.patch.dict("os.environ", {"DYNATRACE_LOG_INGEST_URL": "http://localhost:9011"})
+def test_flush_hands_batch_over_to_sender_and_acks_after_sending():
+    subscriber_client = FakeSubscriberClient()
+    worker_state = worker_state_with_jobs(["ack-1", "ack-2"])
+    sending_started = threading.Event()
+    release_sending = threading.Event()
+
+    def send_logs(context, jobs, batch):
+        sending_started.set()
+        release_sending.wait()
+
+    with mock.patch.object(log_forwarder, "log_sender_pool", LogSenderPool(1, 1)), \
+            mock.patch.object(log_forwarder, "send_logs", send_logs):
+        log_forwarder.perform_flush(worker_state, Queue(), subscriber_client, "")
+        # worker can collect next batch while previous one is being sent
+        assert worker_state.ack_ids == []
+        assert sending_started.wait(5)
+        assert subscriber_client.acked_ids == []
+
+        release_sending.set()
+        # single sender finishes handed over batch before the next one
+        log_forwarder.log_sender_pool.submit(lambda: None).result(5)
+
+    assert subscriber_client.acked_ids == ["ack-1", "ack-2"]
+
+
+@mock.patch.dict("os.environ", {"DYNATRACE_LOG_INGEST_URL": "http://localhost:9011"})
+def test_failed_batch_is_not_acked():
+    subscriber_client = FakeSubscriberClient()
+
+    with mock.patch.object(log_forwarder, "send_logs", side_effect=Exception("Dynatrace unavailable")):
+        log_forwarder.flush_batch(worker_state_with_jobs(["ack-1"]).take_batch(), Queue(), subscriber_client, "")
+
+    assert subscriber_client.acked_ids == []
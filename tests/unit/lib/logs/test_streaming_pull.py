@@ -0,0 +1,143 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import json
+import queue
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timezone
+from queue import Queue
+from unittest import mock
+
+from lib.logs.streaming_pull import process_received_messages, StreamingWorkerState, add_to_batch, \
+    perform_streaming_flush, run_processing_worker, SENDING_FAILURE_BACKOFF_SECONDS
+
+
+class FakeMessage:
+    def __init__(self, data: bytes, ack_id: str = "ack-id"):
+        self.data = data
+        self.ack_id = ack_id
+        self.publish_time = datetime.now(timezone.utc)
+        self.acked = False
+        self.nacked = False
+
+    def ack(self):
+        self.acked = True
+
+    def nack(self):
+        self.nacked = True
+
+
+def log_message(ack_id: str) -> FakeMessage:
+    record = {"textPayload": "log content", "timestamp": datetime.now(timezone.utc).isoformat()}
+    return FakeMessage(json.dumps(record).encode("UTF-8"), ack_id)
+
+
+def test_processed_message_is_queued_for_sending():
+    jobs_queue = Queue()
+    message = log_message("ack-1")
+
+    process_received_messages(Queue(), [message], jobs_queue)
+
+    message_job, queued_message = jobs_queue.get_nowait()
+    assert queued_message is message
+    assert "log content" in message_job.payload
+    assert not message.acked
+
+
+def test_empty_message_is_acked_right_away():
+    jobs_queue = Queue()
+    message = FakeMessage(b"")
+
+    process_received_messages(Queue(), [message], jobs_queue)
+
+    assert jobs_queue.empty()
+    assert message.acked
+
+
+class StopWorker(Exception):
+    pass
+
+
+class FakeReceivedQueue:
+    def __init__(self, batches):
+        self.batches = batches
+
+    def get(self):
+        if not self.batches:
+            raise StopWorker()
+        return self.batches.pop(0)
+
+    def get_nowait(self):
+        raise queue.Empty()
+
+
+def test_processing_worker_survives_broken_processing_pool():
+    jobs_queue = Queue()
+    failed_message = log_message("ack-1")
+    next_message = log_message("ack-2")
+    processing_pool = mock.Mock(enabled=True)
+    processing_pool.process_messages.side_effect = [BrokenProcessPool("worker killed"),
+                                                    [mock.Mock(bytes_size=10)]]
+
+    with mock.patch("lib.logs.streaming_pull.log_processing_pool", processing_pool):
+        try:
+            run_processing_worker(Queue(), FakeReceivedQueue([failed_message, next_message]), jobs_queue)
+        except StopWorker:
+            pass
+
+    assert failed_message.nacked and not failed_message.acked
+    assert jobs_queue.get_nowait()[1] is next_message
+
+
+def assert_not_nacked(messages):
+    assert not any(message.nacked for message in messages)
+
+
+def _batch_of_messages(sfm_queue: Queue):
+    jobs_queue = Queue()
+    messages = [log_message(f"ack-{i}") for i in range(3)]
+    for message in messages:
+        process_received_messages(sfm_queue, [message], jobs_queue)
+
+    worker_state = StreamingWorkerState("Sender-0")
+    while not jobs_queue.empty():
+        add_to_batch(worker_state, sfm_queue, *jobs_queue.get_nowait())
+    return worker_state, messages
+
+
+@mock.patch("lib.logs.streaming_pull.create_logs_context")
+@mock.patch("lib.logs.streaming_pull.send_logs")
+def test_messages_are_acked_after_sending(send_logs, create_logs_context):
+    sfm_queue = Queue()
+    worker_state, messages = _batch_of_messages(sfm_queue)
+
+    perform_streaming_flush(worker_state, sfm_queue)
+
+    assert send_logs.call_count == 1
+    assert all(message.acked and not message.nacked for message in messages)
+    assert worker_state.messages == []
+
+
+@mock.patch("lib.logs.streaming_pull.create_logs_context")
+@mock.patch("lib.logs.streaming_pull.send_logs", side_effect=Exception("Dynatrace unavailable"))
+@mock.patch("lib.logs.streaming_pull.time.sleep")
+def test_messages_are_nacked_after_backoff_when_sending_fails(sleep, send_logs, create_logs_context):
+    sfm_queue = Queue()
+    worker_state, messages = _batch_of_messages(sfm_queue)
+    sleep.side_effect = lambda _: assert_not_nacked(messages)
+
+    perform_streaming_flush(worker_state, sfm_queue)
+
+    sleep.assert_called_once_with(SENDING_FAILURE_BACKOFF_SECONDS)
+    assert all(message.nacked and not message.acked for message in messages)
+    assert worker_state.jobs == []
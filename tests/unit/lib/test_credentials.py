@@ -0,0 +1,122 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import asyncio
+from unittest import mock
+
+from lib.context import LoggingContext
+from lib.credentials import TokenProvider, SecretCache, TOKEN_REFRESH_BEFORE_EXPIRY_SECONDS
+
+context = LoggingContext(None)
+
+
+class FakeTokenEndpoint:
+    def __init__(self, *expires_in: float):
+        self.calls = 0
+        self.expires_in = list(expires_in) or [3600]
+
+    async def fetch_token(self, context, session):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        return f"token-{self.calls}", self.expires_in[min(self.calls, len(self.expires_in)) - 1]
+
+
+def test_token_is_cached_and_concurrent_callers_share_single_request():
+    endpoint = FakeTokenEndpoint()
+    provider = TokenProvider(endpoint.fetch_token)
+
+    async def run():
+        tokens = await asyncio.gather(*[provider.get_token(context, None) for _ in range(10)])
+        tokens.append(await provider.get_token(context, None))
+        return tokens
+
+    tokens = asyncio.run(run())
+
+    assert set(tokens) == {"token-1"}
+    assert endpoint.calls == 1
+
+
+def test_token_is_refreshed_in_background_before_expiry():
+    endpoint = FakeTokenEndpoint(TOKEN_REFRESH_BEFORE_EXPIRY_SECONDS - 1, 3600)
+    provider = TokenProvider(endpoint.fetch_token)
+
+    async def run():
+        first = await provider.get_token(context, None)
+        with mock.patch("lib.credentials.init_gcp_client_session", return_value=mock.MagicMock()) as session_mock:
+            session_mock.return_value.__aenter__ = mock.AsyncMock(return_value=None)
+            session_mock.return_value.__aexit__ = mock.AsyncMock(return_value=None)
+            second = await provider.get_token(context, None)
+            await asyncio.sleep(0.05)
+        third = await provider.get_token(context, None)
+        return first, second, third
+
+    assert asyncio.run(run()) == ("token-1", "token-1", "token-2")
+    assert endpoint.calls == 2
+
+
+def test_expired_token_is_requested_again():
+    endpoint = FakeTokenEndpoint(0)
+    provider = TokenProvider(endpoint.fetch_token)
+
+    async def run():
+        return [await provider.get_token(context, None) for _ in range(2)]
+
+    assert asyncio.run(run()) == ["token-1", "token-2"]
+
+
+class FakeSecretManager:
+    def __init__(self):
+        self.calls = 0
+        self.available = True
+
+    async def fetch_secret(self, session, project_id, token, secret_name):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if not self.available:
+            raise Exception("Secret Manager unavailable")
+        return f"{secret_name}-{self.calls}"
+
+
+def test_secret_is_cached_and_concurrent_callers_share_single_fetch():
+    secret_manager = FakeSecretManager()
+    cache = SecretCache(secret_manager.fetch_secret, ttl_seconds=300)
+
+    async def run():
+        return await asyncio.gather(*[cache.get(None, "project", "token", "DYNATRACE_URL") for _ in range(10)])
+
+    assert set(asyncio.run(run())) == {"DYNATRACE_URL-1"}
+    assert asyncio.run(cache.get(None, "project", "token", "DYNATRACE_URL")) == "DYNATRACE_URL-1"
+    assert secret_manager.calls == 1
+
+
+def test_secret_last_known_value_is_used_when_fetch_fails():
+    secret_manager = FakeSecretManager()
+    cache = SecretCache(secret_manager.fetch_secret, ttl_seconds=0)
+
+    first = asyncio.run(cache.get(None, "project", "token", "DYNATRACE_URL"))
+    secret_manager.available = False
+    second = asyncio.run(cache.get(None, "project", "token", "DYNATRACE_URL"))
+
+    assert first == second == "DYNATRACE_URL-1"
+    assert secret_manager.calls == 2
+
+
+def test_secret_is_fetched_again_after_invalidation():
+    secret_manager = FakeSecretManager()
+    cache = SecretCache(secret_manager.fetch_secret, ttl_seconds=300)
+
+    first = asyncio.run(cache.get(None, "project", "token", "DYNATRACE_ACCESS_KEY"))
+    cache.invalidate()
+    second = asyncio.run(cache.get(None, "project", "token", "DYNATRACE_ACCESS_KEY"))
+
+    assert (first, second) == ("DYNATRACE_ACCESS_KEY-1", "DYNATRACE_ACCESS_KEY-2")
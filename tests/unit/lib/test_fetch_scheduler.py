@@ -0,0 +1,68 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import asyncio
+from typing import Dict, List
+
+from lib.fetch_scheduler import FetchScheduler, extract_api_name
+
+
+async def _run_requests(scheduler: FetchScheduler, requests: List[tuple], max_in_flight: Dict[str, int]):
+    in_flight: Dict[str, int] = {}
+
+    async def single_request(project_id: str, api: str):
+        async with scheduler.request_slot(project_id, api):
+            for key in ["global", project_id, api]:
+                in_flight[key] = in_flight.get(key, 0) + 1
+                max_in_flight[key] = max(max_in_flight.get(key, 0), in_flight[key])
+            await asyncio.sleep(0.01)
+            for key in ["global", project_id, api]:
+                in_flight[key] -= 1
+
+    await asyncio.gather(*[single_request(project_id, api) for project_id, api in requests])
+
+
+def test_limits_are_respected():
+    scheduler = FetchScheduler(global_limit=5, project_limit=3, api_limit=2)
+    requests = [(f"project-{i % 4}", f"api-{i % 3}") for i in range(60)]
+    max_in_flight = {}
+
+    asyncio.run(_run_requests(scheduler, requests, max_in_flight))
+
+    assert max_in_flight["global"] == 5
+    assert all(max_in_flight[f"project-{i}"] <= 3 for i in range(4))
+    assert all(max_in_flight[f"api-{i}"] <= 2 for i in range(3))
+    assert scheduler.in_flight == 0
+
+
+def test_big_project_does_not_starve_others():
+    scheduler = FetchScheduler(global_limit=2, project_limit=1, api_limit=10)
+    finished = []
+
+    async def single_request(project_id: str):
+        async with scheduler.request_slot(project_id, "api"):
+            await asyncio.sleep(0.01)
+            finished.append(project_id)
+
+    async def run():
+        big_project = [single_request("big") for _ in range(10)]
+        small_project = [single_request("small")]
+        await asyncio.gather(*big_project, *small_project)
+
+    asyncio.run(run())
+
+    assert finished.index("small") < 2
+
+
+def test_extract_api_name():
+    assert extract_api_name("compute.googleapis.com/instance/cpu/usage_time") == "compute.googleapis.com"
@@ -0,0 +1,49 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+from lib.entities.extractors.gce_instance import _aggregated_list_resp_to_monitored_entities, \
+    _instances_to_monitored_entities
+from lib.metrics import GCPService
+
+service = GCPService(service="gce_instance", tech_name="Google Compute Engine",
+                     dimensions=[{"key": "instance_id", "value": "label:resource.labels.instance_id"},
+                                 {"key": "zone", "value": "label:resource.labels.zone"},
+                                 {"key": "project_id", "value": "label:resource.labels.project_id"}])
+
+instance_1 = {"id": "1", "name": "instance-1", "status": "RUNNING", "networkInterfaces": [{"networkIP": "10.0.0.1"}]}
+instance_2 = {"id": "2", "name": "instance-2", "status": "TERMINATED", "machineType": "zones/us-east1-b/machineTypes/e2-small"}
+
+
+def test_aggregated_list_page_is_mapped_per_zone_and_skips_empty_zones():
+    page = {
+        "id": "projects/my-project/aggregated/instances",
+        "items": {
+            "zones/europe-north1-a": {"instances": [instance_1]},
+            "zones/us-central1-a": {"warning": {"code": "NO_RESULTS_ON_PAGE"}},
+            "zones/us-east1-b": {"instances": [instance_2]},
+        }
+    }
+
+    entities = _aggregated_list_resp_to_monitored_entities(page, "my-project", service)
+
+    expected = _instances_to_monitored_entities([instance_1], "my-project", "europe-north1-a", service) + \
+               _instances_to_monitored_entities([instance_2], "my-project", "us-east1-b", service)
+    assert entities == expected
+    assert [entity.display_name for entity in entities] == ["instance-1", "instance-2"]
+    assert entities[0].ip_addresses == ["10.0.0.1"]
+    assert len({entity.id for entity in entities}) == 2
+
+
+def test_aggregated_list_page_without_items():
+    assert _aggregated_list_resp_to_monitored_entities({"id": "projects/my-project/aggregated/instances"},
+                                                       "my-project", service) == []
@@ -0,0 +1,119 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import asyncio
+import time
+from datetime import datetime
+from unittest import mock
+
+from lib import metric_ingest
+from lib.context import MetricsContext, DynatraceConnectivity
+from lib.ingest_retry import parse_retry_after, backoff_delay, RetryBudget, IngestSpillQueue, BACKOFF_MAX_SECONDS, \
+    RetryableIngestException
+from lib.metrics import IngestLine, IngestSeries
+from lib.sfm.for_metrics.metrics_definitions import SfmKeys
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("5") == 5
+    assert parse_retry_after("3600") == 60
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0
+    assert parse_retry_after("not a date") is None
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backoff_delay(attempt) <= BACKOFF_MAX_SECONDS for attempt in range(20))
+
+
+def test_retry_budget():
+    budget = RetryBudget(max_retries=2, deadline=time.time() + 10)
+
+    assert not budget.try_acquire(20)
+    assert budget.try_acquire(1)
+    assert budget.try_acquire(1)
+    assert not budget.try_acquire(1)
+
+
+def test_spill_queue_drops_oldest_batches():
+    spill_queue = IngestSpillQueue(max_lines=5)
+    line = IngestLine(IngestSeries("entity_id", "m1", "count", []), 1, 10000)
+
+    assert spill_queue.put("project1", [line] * 3) == []
+    assert spill_queue.put("project2", [line] * 3) == [("project1", 3)]
+
+    drained = spill_queue.drain()
+    assert [(project_id, len(batch)) for project_id, batch in drained] == [("project2", 3)]
+    assert spill_queue.drain() == []
+
+
+def _context(connectivity: DynatraceConnectivity = DynatraceConnectivity.Ok) -> MetricsContext:
+    context = MetricsContext(None, None, "", "", datetime.utcnow(), 60, "", "", False, False, None)
+    context.dynatrace_connectivity = connectivity
+    return context
+
+
+def _lines(count: int):
+    return [IngestLine(IngestSeries(f"entity_{i}", "m1", "count", []), 1, 10000) for i in range(count)]
+
+
+def test_spilled_lines_are_kept_when_connectivity_is_broken():
+    spill_queue = IngestSpillQueue(max_lines=10)
+    spill_queue.put("project", _lines(3))
+    context = _context(DynatraceConnectivity.ExpiredToken)
+
+    with mock.patch.object(metric_ingest, "_spill_queue", spill_queue):
+        asyncio.run(metric_ingest.push_spilled_ingest_lines(context))
+
+    assert [(project_id, len(lines)) for project_id, lines in spill_queue.drain()] == [("project", 3)]
+
+
+def test_skipped_batch_is_counted_as_dropped():
+    context = _context(DynatraceConnectivity.WrongToken)
+
+    async def run():
+        await context.ingest_semaphore().acquire()
+        await metric_ingest._push_single_batch_with_retries(context, "project", _lines(4))
+
+    asyncio.run(run())
+
+    assert context.sfm[SfmKeys.dynatrace_ingest_lines_dropped_count].value == {"project": 4}
+
+
+def test_ingest_slot_is_released_while_waiting_for_retry():
+    context = _context()
+    context.metric_ingest_max_concurrent_requests = 1
+    pushed = []
+
+    async def throttled_once_push(context, project_id, lines_batch):
+        if project_id == "throttled" and "throttled" not in pushed:
+            pushed.append("throttled")
+            raise RetryableIngestException(429, 0.1)
+        pushed.append(project_id)
+
+    async def run():
+        semaphore = context.ingest_semaphore()
+        await semaphore.acquire()
+        throttled = asyncio.create_task(metric_ingest._push_single_batch_with_retries(context, "throttled", _lines(1)))
+        await asyncio.sleep(0.01)
+        # only slot is free while the throttled batch waits, so other batch is pushed in the meantime
+        await asyncio.wait_for(semaphore.acquire(), 0.05)
+        await metric_ingest._push_single_batch_with_retries(context, "other", _lines(1))
+        await throttled
+        return semaphore
+
+    with mock.patch.object(metric_ingest, "_push_to_dynatrace", new=throttled_once_push):
+        semaphore = asyncio.run(run())
+
+    assert pushed == ["throttled", "other", "throttled"]
+    assert not semaphore.locked()
@@ -0,0 +1,62 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import asyncio
+
+from lib.polling_scheduler import PollingSpreadScheduler
+
+
+def test_disabled_scheduler_starts_everything_at_once():
+    scheduler = PollingSpreadScheduler(0)
+
+    assert scheduler.plan(["a", "b"], 180) == [("a", 0.0), ("b", 0.0)]
+
+
+def test_projects_are_spread_longest_first():
+    scheduler = PollingSpreadScheduler(50)
+    scheduler.plan(["a", "b", "c"], 180)
+    scheduler.record("a", 10)
+    scheduler.record("b", 30)
+    scheduler.record("c", 20)
+
+    assert scheduler.plan(["a", "b", "c"], 180) == [("b", 0.0), ("c", 30.0), ("a", 60.0)]
+
+
+def test_project_does_not_start_later_than_its_deadline_allows():
+    scheduler = PollingSpreadScheduler(100)
+    scheduler.plan(["a", "b"], 180)
+    scheduler.record("a", 150)
+    scheduler.record("b", 160)
+
+    assert scheduler.plan(["a", "b"], 180) == [("b", 0.0), ("a", 20.0)]
+
+
+def test_unfinished_projects_start_first():
+    scheduler = PollingSpreadScheduler(50)
+    scheduler.plan(["a", "b"], 180)
+    scheduler.record("a", 30)
+
+    assert scheduler.plan(["a", "b"], 180) == [("b", 0.0), ("a", 45.0)]
+
+
+def test_duration_of_run_is_recorded():
+    scheduler = PollingSpreadScheduler(50)
+    scheduler.plan(["a"], 180)
+
+    async def noop():
+        pass
+
+    asyncio.run(scheduler.run("a", 0.01, noop))
+
+    assert "a" in scheduler.durations
+    assert scheduler.plan(["a"], 180) == [("a", 0.0)]
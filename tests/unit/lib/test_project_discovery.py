@@ -0,0 +1,117 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import asyncio
+from datetime import datetime
+from typing import List
+from unittest import mock
+
+from lib.context import MetricsContext
+from lib.project_discovery import ProjectDiscoveryCache, ProjectDiscoverySnapshot, discover_new_projects, \
+    discover_projects
+from lib.sharding import ReplicaShard
+
+
+def _context() -> MetricsContext:
+    return MetricsContext(None, None, "owner", "", datetime.utcnow(), 0, "", "", False, False, None)
+
+
+class FakeGcp:
+    def __init__(self, projects_ids: List[str]):
+        self.projects_ids = projects_ids
+        self.checked_projects_ids = []
+
+    async def get_all_accessible_projects(self, context, session, token):
+        return list(self.projects_ids)
+
+    async def get_disabled_projects_and_disabled_apis_by_project_id(self, context, projects_ids):
+        self.checked_projects_ids.extend(projects_ids)
+        disabled_projects = {project_id for project_id in projects_ids if project_id.startswith("disabled")}
+        return disabled_projects, {project_id: {"pubsub.googleapis.com"} for project_id in projects_ids
+                                   if project_id not in disabled_projects}
+
+
+def _patch_gcp(fake_gcp: FakeGcp):
+    return mock.patch.multiple(
+        "lib.project_discovery",
+        get_all_accessible_projects=fake_gcp.get_all_accessible_projects,
+        get_disabled_projects_and_disabled_apis_by_project_id=fake_gcp.get_disabled_projects_and_disabled_apis_by_project_id
+    )
+
+
+def test_first_polling_waits_for_discovery_and_next_one_uses_snapshot():
+    fake_gcp = FakeGcp(["p1", "disabled-p2"])
+    cache = ProjectDiscoveryCache(refresh_interval_seconds=900)
+
+    async def run():
+        with _patch_gcp(fake_gcp), mock.patch.object(cache, "_refresh_in_background", mock.AsyncMock()) as refresh_mock:
+            first = await cache.get_snapshot(_context())
+            second = await cache.get_snapshot(_context())
+            await asyncio.sleep(0)
+            return first, second, refresh_mock
+
+    first, second, refresh_mock = asyncio.run(run())
+
+    assert first is second
+    assert first.projects_ids == ["p1", "disabled-p2"]
+    assert first.disabled_projects == {"disabled-p2"}
+    assert fake_gcp.checked_projects_ids == ["p1", "disabled-p2"]
+    refresh_mock.assert_called_once_with("owner", False)
+
+
+def test_incremental_refresh_checks_only_new_projects():
+    fake_gcp = FakeGcp(["p1", "p3", "disabled-p4"])
+    previous = ProjectDiscoverySnapshot(projects_ids=["p1", "p2"], disabled_apis_by_project_id={"p1": {"a"}, "p2": {"b"}},
+                                        refreshed_at=100)
+
+    with _patch_gcp(fake_gcp):
+        snapshot = asyncio.run(discover_new_projects(_context(), previous))
+
+    assert fake_gcp.checked_projects_ids == ["p3", "disabled-p4"]
+    assert snapshot.projects_ids == ["p1", "p3", "disabled-p4"]
+    assert snapshot.disabled_projects == {"disabled-p4"}
+    assert snapshot.disabled_apis_by_project_id == {"p1": {"a"}, "p3": {"pubsub.googleapis.com"}}
+    assert snapshot.refreshed_at == 100
+
+
+def test_apis_are_checked_only_in_projects_owned_by_replica():
+    projects_ids = [f"p{i}" for i in range(20)]
+    fake_gcp = FakeGcp(projects_ids)
+    shard = ReplicaShard(1, 3)
+
+    with _patch_gcp(fake_gcp), mock.patch("lib.project_discovery.replica_shard", shard), \
+            mock.patch("lib.sharding.replica_shard", shard):
+        snapshot = asyncio.run(discover_projects(_context()))
+
+    assert snapshot.projects_ids == shard.owned(projects_ids)
+    assert 0 < len(snapshot.projects_ids) < len(projects_ids)
+    assert fake_gcp.checked_projects_ids == snapshot.projects_ids
+
+
+def test_failed_refresh_keeps_previous_snapshot():
+    previous = ProjectDiscoverySnapshot(projects_ids=["p1"], refreshed_at=100)
+    cache = ProjectDiscoveryCache(refresh_interval_seconds=900)
+    cache.snapshot = previous
+
+    async def run(fake_gcp: FakeGcp, full_refresh: bool):
+        with _patch_gcp(fake_gcp), mock.patch("lib.project_discovery.init_gcp_client_session", mock.MagicMock()), \
+                mock.patch("lib.project_discovery.create_token", mock.AsyncMock(return_value="token")):
+            await cache._refresh_in_background("owner", full_refresh)
+
+    for full_refresh in [True, False]:
+        # listing of projects returns empty list on error
+        asyncio.run(run(FakeGcp([]), full_refresh))
+        assert cache.snapshot is previous
+
+    asyncio.run(run(FakeGcp(["p1", "p2"]), False))
+    assert cache.snapshot.projects_ids == ["p1", "p2"]
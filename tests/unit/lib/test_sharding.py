@@ -0,0 +1,80 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+from unittest import mock
+
+import pytest
+
+from lib import sharding
+from lib.sharding import ReplicaShard, replica_index_from_environment, configure_replica_shard_from_environment
+
+PROJECTS_IDS = [f"project-{i}" for i in range(500)]
+
+
+def test_every_project_is_owned_by_exactly_one_replica():
+    shards = [ReplicaShard(replica_index, 4) for replica_index in range(4)]
+
+    owned_projects = [shard.owned(PROJECTS_IDS) for shard in shards]
+
+    assert sorted(sum(owned_projects, [])) == sorted(PROJECTS_IDS)
+    assert all(len(projects) > 80 for projects in owned_projects)
+
+
+def test_only_projects_of_new_replica_are_moved_when_scaling_up():
+    before = {project_id: ReplicaShard(0, 4).owner(project_id) for project_id in PROJECTS_IDS}
+    after = {project_id: ReplicaShard(0, 5).owner(project_id) for project_id in PROJECTS_IDS}
+
+    moved = [project_id for project_id in PROJECTS_IDS if before[project_id] != after[project_id]]
+
+    assert moved
+    assert all(after[project_id] == 4 for project_id in moved)
+
+
+def test_single_replica_owns_everything():
+    assert ReplicaShard(0, 1).owned(PROJECTS_IDS) == PROJECTS_IDS
+
+
+def test_replica_index_is_taken_from_stateful_set_ordinal():
+    with mock.patch.dict("os.environ", {"HOSTNAME": "dynatrace-gcp-monitor-2"}):
+        assert replica_index_from_environment(3) == 2
+        assert replica_index_from_environment(1) == 0
+        with pytest.raises(ValueError):
+            replica_index_from_environment(2)
+
+    with mock.patch.dict("os.environ", {"HOSTNAME": "dynatrace-gcp-monitor-2", "SHARDING_REPLICA_INDEX": "1"}):
+        assert replica_index_from_environment(3) == 1
+
+
+def test_replica_index_is_required_with_more_replicas():
+    # pod of Deployment, its random suffix happens to be all digits
+    with mock.patch.dict("os.environ", {"HOSTNAME": "dynatrace-gcp-monitor-7d9f8c6b5-12345"}):
+        assert replica_index_from_environment(1) == 0
+        with pytest.raises(ValueError):
+            replica_index_from_environment(3)
+
+    with mock.patch.dict("os.environ", {"HOSTNAME": "other-monitor-2"}):
+        with pytest.raises(ValueError):
+            replica_index_from_environment(3)
+
+
+def test_misconfigured_replica_is_reported_when_shard_is_configured():
+    shard = ReplicaShard(0, 1)
+    with mock.patch.object(sharding, "replica_shard", shard):
+        with mock.patch.dict("os.environ", {"HOSTNAME": "other-monitor-2", "SHARDING_REPLICA_COUNT": "3"}):
+            with pytest.raises(ValueError):
+                configure_replica_shard_from_environment()
+        assert not shard.enabled
+
+        with mock.patch.dict("os.environ", {"HOSTNAME": "dynatrace-gcp-monitor-2", "SHARDING_REPLICA_COUNT": "3"}):
+            configure_replica_shard_from_environment()
+        assert (shard.replica_index, shard.replica_count) == (2, 3)
@@ -0,0 +1,63 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+from datetime import datetime, timedelta
+
+from lib.watermark_store import WatermarkStore, WATERMARK_RECORD
+
+END_TIME = datetime(2023, 1, 1, 10, 0, 0, 123456)
+INTERVAL = timedelta(minutes=3)
+
+
+def test_window_without_watermark_is_default(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.bin"), timedelta(minutes=60))
+
+    assert store.window_start("metric", END_TIME - INTERVAL, END_TIME) == END_TIME - INTERVAL
+
+
+def test_window_is_resumed_from_watermark_after_restart(tmp_path):
+    path = str(tmp_path / "watermarks.bin")
+    store = WatermarkStore(path, timedelta(minutes=60))
+    store.advance("metric", END_TIME)
+    store.save()
+
+    restarted_store = WatermarkStore(path, timedelta(minutes=60))
+    next_end_time = END_TIME + timedelta(minutes=10)
+
+    assert restarted_store.window_start("metric", next_end_time - INTERVAL, next_end_time) == END_TIME
+    assert (tmp_path / "watermarks.bin").stat().st_size == WATERMARK_RECORD.size
+
+
+def test_catch_up_is_limited(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.bin"), timedelta(minutes=60))
+    store.advance("metric", END_TIME)
+    next_end_time = END_TIME + timedelta(hours=5)
+
+    assert store.window_start("metric", next_end_time - INTERVAL, next_end_time) == next_end_time - timedelta(minutes=60)
+
+
+def test_already_fetched_window_is_skipped(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.bin"), timedelta(minutes=60))
+    store.advance("metric", END_TIME)
+
+    assert store.window_start("metric", END_TIME - INTERVAL - timedelta(seconds=5), END_TIME - timedelta(seconds=5)) is None
+    assert store.window_start("other-metric", END_TIME - INTERVAL, END_TIME) == END_TIME - INTERVAL
+
+
+def test_watermark_never_moves_back(tmp_path):
+    store = WatermarkStore(str(tmp_path / "watermarks.bin"), timedelta(minutes=60))
+    store.advance("metric", END_TIME)
+    store.advance("metric", END_TIME - INTERVAL)
+    next_end_time = END_TIME + INTERVAL
+
+    assert store.window_start("metric", END_TIME, next_end_time) == END_TIME
@@ -1,12 +1,12 @@
 import asyncio
 import unittest
 from datetime import datetime
-from typing import Dict, Iterable
+from typing import Dict, Iterable, List
 from unittest.mock import MagicMock
 
 from lib.context import MetricsContext
 from lib.entities.model import EntitiesExtractorData, Entity
-from lib.metrics import GCPService
+from lib.metrics import GCPService, DimensionValue
 from lib.topology import topology
 
 
@@ -35,20 +35,105 @@ entities_extractors: Dict[str, EntitiesExtractorData] = {
 }
 
 
+def _entity(entity_id: str, ip_address: str = "") -> Entity:
+    return Entity(entity_id, "", "", ip_addresses=[ip_address] if ip_address else [], listen_ports=[], favicon_url="",
+                  dtype="", properties=[], tags=[], dns_names=[])
+
+
+class FakeExtractor:
+    def __init__(self, *results: List[Entity]):
+        self.results = list(results)
+        self.calls = 0
+        self.sessions = []
+
+    async def extract(self, ctx: MetricsContext, project_id: str, svc_def: GCPService) -> Iterable[Entity]:
+        self.calls += 1
+        self.sessions.append(ctx.gcp_session)
+        return self.results[min(self.calls, len(self.results)) - 1]
+
+
 @unittest.mock.patch("lib.topology.topology.entities_extractors", new=entities_extractors)
-def test_fetch_topology():
+def test_topology_cache_fetches_services_with_extractor_and_enabled_api():
     context = MetricsContext(None, None, "", "", datetime.utcnow(), 0, "", "", False, False, None)
+    cache = topology.TopologyCache(ttl_seconds=600)
 
-    topology_coro = topology.fetch_topology(context, "my_project_id", services, set(disabled_apis))
-
-    topology_result = asyncio.run(topology_coro)
+    topology_result, _ = asyncio.run(cache.fetch_topology(context, "my_project_id", services, set(disabled_apis)))
 
     assert service1_ok in topology_result
     assert service2_no_extractor not in topology_result
     assert service3_disabled_api not in topology_result
     assert service4_also_ok in topology_result
 
-    assert topology_result[service1_ok] is fake_entities_1
-    assert topology_result[service4_also_ok] is fake_entities_2
+    assert topology_result[service1_ok] == fake_entities_1
+    assert topology_result[service4_also_ok] == fake_entities_2
+
+
+class FakeGcpSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+def test_topology_cache_uses_cached_entities_and_refreshes_stale_ones_in_background():
+    context = MetricsContext(None, None, "", "", datetime.utcnow(), 0, "", "", False, False, None)
+    extractor = FakeExtractor([_entity("e1", "1.1.1.1"), _entity("e2")], [_entity("e1", "2.2.2.2"), _entity("e3")])
+    cache = topology.TopologyCache(ttl_seconds=600)
+
+    refresh_session = FakeGcpSession()
+
+    async def run():
+        with unittest.mock.patch("lib.topology.topology.entities_extractors",
+                                 new={"service1": EntitiesExtractorData(extractor.extract, "ok_api")}), \
+                unittest.mock.patch("lib.topology.topology.init_gcp_client_session", return_value=refresh_session), \
+                unittest.mock.patch("lib.topology.topology.create_token", unittest.mock.AsyncMock(return_value="token")):
+            _, first_map = await cache.fetch_topology(context, "project", [service1_ok], set())
+            first_ids = set(first_map.keys())
+            _, second_map = await cache.fetch_topology(context, "project", [service1_ok], set())
+            assert extractor.calls == 1
+
+            cache._projects["project"].fetched_at_by_service[service1_ok] -= 600
+            topology_result, stale_map = await cache.fetch_topology(context, "project", [service1_ok], set())
+            stale_ids = set(stale_map.keys())
+            await asyncio.sleep(0.01)
+            return first_ids, second_map, stale_ids, topology_result
+
+    first_ids, entity_id_map, stale_ids, topology_result = asyncio.run(run())
+
+    assert first_ids == stale_ids == {"e1", "e2"}
+    assert [entity.id for entity in topology_result[service1_ok]] == ["e1", "e2"]
+    assert extractor.calls == 2
+    # session of the polling may be closed already, refresh uses its own
+    assert extractor.sessions == [None, refresh_session]
+    assert set(entity_id_map.keys()) == {"e1", "e3"}
+    assert entity_id_map["e1"].dimension_values == (DimensionValue("entity.ip_address", "2.2.2.2"),)
+
+
+def test_topology_cache_fetches_services_without_entities_before_metrics():
+    context = MetricsContext(None, None, "", "", datetime.utcnow(), 0, "", "", False, False, None)
+    extractor = FakeExtractor([], [_entity("e1")])
+    cache = topology.TopologyCache(ttl_seconds=600)
+
+    async def run():
+        with unittest.mock.patch("lib.topology.topology.entities_extractors",
+                                 new={"service1": EntitiesExtractorData(extractor.extract, "ok_api")}):
+            first, _ = await cache.fetch_topology(context, "project", [service1_ok], set())
+            second, entity_id_map = await cache.fetch_topology(context, "project", [service1_ok], set())
+            return first, second, entity_id_map
+
+    first, second, entity_id_map = asyncio.run(run())
+
+    assert first[service1_ok] == []
+    assert [entity.id for entity in second[service1_ok]] == ["e1"]
+    assert set(entity_id_map.keys()) == {"e1"}
+
+
+def test_project_topology_keeps_entity_returned_by_other_service():
+    project_topology = topology.ProjectTopology()
+    project_topology.update(service1_ok, [_entity("e1"), _entity("e2")])
+    project_topology.update(service4_also_ok, [_entity("e1")])
+
+    project_topology.update(service1_ok, [])
 
-    print(topology_result)
+    assert set(project_topology.entity_id_map.keys()) == {"e1"}
@@ -12,8 +12,17 @@
 #   See the License for the specific language governing permissions and
 #   limitations under the License.
 
-from lib.entities.model import CdProperty
+import asyncio
+import gzip
+from unittest import mock
+
+import pytest
+
+from lib.entities.enrichment import create_dimension, MAX_DIMENSION_NAME_LENGTH, MAX_DIMENSION_VALUE_LENGTH
+from lib.entities.model import CdProperty, Entity
 from lib.metric_ingest import *
+from lib.metric_ingest import _parse_timestamp_millis_strptime
+from lib.query_plan import project_partition_filters, MAX_PROJECTS_PER_PARTITION
 from lib.topology.topology import build_entity_id_map
 
 
@@ -39,7 +48,7 @@ def test_create_dimension_too_long_dimension():
 
 def test_flatten_and_enrich_metric_results_all_additional_dimensions():
     context_mock = MetricsContext(None, None, "", "", datetime.utcnow(), 0, "", "", False, False, None)
-    metric_results = [[IngestLine("entity_id", "m1", "count", 1, 10000, [])]]
+    metric_results = [[IngestLine(IngestSeries("entity_id", "m1", "count", []), 1, 10000)]]
     entity_id_map = build_entity_id_map([[Entity("entity_id", "", "", ip_addresses=["1.1.1.1", "0.0.0.0"], listen_ports=[],
                                          favicon_url="", dtype="", properties=[CdProperty("Example property", "example_value")],
                                          tags=[], dns_names=["other.dns.name", "dns.name"])]])
@@ -52,4 +61,295 @@ def test_flatten_and_enrich_metric_results_all_additional_dimensions():
                            DimensionValue(name="entity.dns_name", value="dns.name"),
                            DimensionValue(name="entity.example_property", value="example_value")]
     assert set(expected_dimensions) == set(ingest_line.dimension_values)
+    assert entity_id_map["entity_id"].dimensions_string == \
+           ',entity.dns_name="dns.name",entity.ip_address="0.0.0.0",entity.example_property="example_value"'
+
+
+
+def test_lines_of_single_series_share_rendered_dimensions():
+    context_mock = MetricsContext(None, None, "", "", datetime.utcnow(), 0, "", "", False, False, None)
+    series = IngestSeries("entity_id", "m1", "gauge", [DimensionValue("dim", "value")])
+    metric_results = [[IngestLine(series, 1, 10000), IngestLine(series, 2, 20000)]]
+    entity_id_map = build_entity_id_map([[Entity("entity_id", "", "", ip_addresses=["1.1.1.1"], listen_ports=[],
+                                         favicon_url="", dtype="", properties=[], tags=[], dns_names=[])]])
+
+    lines = flatten_and_enrich_metric_results(context=context_mock, fetch_metric_results=metric_results, entity_id_map=entity_id_map)
+
+    assert len(series.dimension_values) == 1
+    assert len(series.all_dimension_values()) == 2
+    assert [line.to_string() for line in lines] == [
+        'm1,dim="value",entity.ip_address="1.1.1.1" gauge,1 10000',
+        'm1,dim="value",entity.ip_address="1.1.1.1" gauge,2 20000'
+    ]
+
+
+class FakeIngestResponse:
+    def __init__(self, lines_count: int, invalid_line: int):
+        self.status = 400 if invalid_line else 202
+        self.lines_count = lines_count
+        self.invalid_line = invalid_line
+
+    async def json(self):
+        if not self.invalid_line:
+            return {"linesOk": self.lines_count, "linesInvalid": 0}
+        return {"linesOk": self.lines_count - 1, "linesInvalid": 1,
+                "error": {"invalidLines": [{"line": self.invalid_line, "error": "invalid"}]}}
+
+
+class FakeDtSession:
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def post(self, url, headers, data, verify_ssl):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+        lines = data.split("\n")
+        invalid_line = next((index + 1 for index, line in enumerate(lines) if line.startswith("invalid")), 0)
+        return FakeIngestResponse(len(lines), invalid_line)
+
+
+def test_push_ingest_lines_concurrently_with_exact_accounting():
+    dt_session = FakeDtSession()
+    context = MetricsContext(None, dt_session, "", "", datetime.utcnow(), 0, "", "http://dt", False, False, None)
+    context.metric_ingest_batch_size = 10
+    context.metric_ingest_max_concurrent_requests = 2
+    lines = [IngestLine(IngestSeries("entity_id", "invalid" if i == 37 else "m1", "count", []), 1, 10000) for i in range(95)]
+    logged = []
+    context.log = lambda *args: logged.append(args[-1])
+
+    asyncio.run(push_ingest_lines(context, "project", lines))
+
+    assert dt_session.max_in_flight == 2
+    assert context.sfm[SfmKeys.dynatrace_ingest_lines_ok_count].value == {"project": 94}
+    assert context.sfm[SfmKeys.dynatrace_ingest_lines_invalid_count].value == {"project": 1}
+    assert context.sfm[SfmKeys.dynatrace_request_count].value == {202: 9, 400: 1}
+    assert any(message.startswith("INVALID LINE: 'invalid") for message in logged)
+
+
+def test_push_ingest_lines_gzip_compressed():
+    sent_requests = []
+
+    class GzipDtSession:
+        async def post(self, url, headers, data, verify_ssl):
+            sent_requests.append((headers, data))
+            return FakeIngestResponse(len(gzip.decompress(data).decode("UTF-8").split("\n")), 0)
+
+    context = MetricsContext(None, GzipDtSession(), "", "", datetime.utcnow(), 0, "", "http://dt", False, False, None)
+    context.metric_ingest_gzip_enabled = True
+    lines = [IngestLine(IngestSeries("entity_id", "m1", "count", [DimensionValue("dim", "value")]), 1, 10000) for _ in range(100)]
+
+    asyncio.run(push_ingest_lines(context, "project", lines))
+
+    headers, data = sent_requests[0]
+    assert headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(data).decode("UTF-8") == "\n".join(line.to_string() for line in lines)
+    assert context.sfm[SfmKeys.dynatrace_ingest_lines_ok_count].value == {"project": 100}
+    assert context.sfm[SfmKeys.dynatrace_ingest_compression_ratio].value > 10
+
+
+class ThrottlingDtSession:
+    def __init__(self, throttled_requests: int):
+        self.throttled_requests = throttled_requests
+        self.requests = 0
+
+    async def post(self, url, headers, data, verify_ssl):
+        self.requests += 1
+        if self.requests <= self.throttled_requests:
+            response = FakeIngestResponse(0, 0)
+            response.status = 429
+            response.headers = {"Retry-After": "0"}
+            return response
+        return FakeIngestResponse(len(data.split("\n")), 0)
+
+
+def test_push_ingest_lines_retried_after_throttling():
+    dt_session = ThrottlingDtSession(throttled_requests=2)
+    context = MetricsContext(None, dt_session, "", "", datetime.utcnow(), 60, "", "http://dt", False, False, None)
+    lines = [IngestLine(IngestSeries("entity_id", "m1", "count", []), 1, 10000)]
+
+    asyncio.run(push_ingest_lines(context, "project", lines))
+
+    assert dt_session.requests == 3
+    assert context.sfm[SfmKeys.dynatrace_ingest_lines_ok_count].value == {"project": 1}
+    assert context.sfm[SfmKeys.dynatrace_request_count].value == {429: 2, 202: 1}
+
+
+def test_push_ingest_lines_spilled_to_next_polling_after_retries_exhausted():
+    dt_session = ThrottlingDtSession(throttled_requests=4)
+    context = MetricsContext(None, dt_session, "", "", datetime.utcnow(), 60, "", "http://dt", False, False, None)
+    lines = [IngestLine(IngestSeries("entity_id", "m1", "count", []), 1, 10000)]
+
+    asyncio.run(push_ingest_lines(context, "project", lines))
+    assert context.sfm[SfmKeys.dynatrace_ingest_lines_ok_count].value == {}
+
+    next_context = MetricsContext(None, dt_session, "", "", datetime.utcnow(), 60, "", "http://dt", False, False, None)
+    asyncio.run(push_spilled_ingest_lines(next_context))
+    assert next_context.sfm[SfmKeys.dynatrace_ingest_lines_ok_count].value == {"project": 1}
+    assert context.sfm[SfmKeys.dynatrace_ingest_lines_dropped_count].value == {}
+
+
+def test_parse_timestamp_millis_matches_strptime():
+    for timestamp_iso in ["2023-01-01T10:00:00Z", "2020-02-29T23:59:59.5Z", "2023-06-15T08:30:01.123456Z",
+                          "1999-12-31T00:00:00.000Z", "2023-06-15T08:30:01.999999Z"]:
+        assert parse_timestamp_millis(timestamp_iso) == _parse_timestamp_millis_strptime(timestamp_iso)
+
+
+def test_parse_timestamp_millis_rejects_invalid_format():
+    try:
+        parse_timestamp_millis("2023-01-01 10:00:00")
+        assert False, "ValueError expected"
+    except ValueError:
+        pass
+
+
+def test_parse_timestamp_millis_rejects_out_of_range_fields():
+    for timestamp_iso in ["2023-02-30T10:00:00Z", "2023-13-01T10:00:00Z", "2023-01-01T24:00:00Z",
+                          "2023-01-01T10:60:00Z", "2023-01-01T10:00:60.5Z"]:
+        try:
+            parse_timestamp_millis(timestamp_iso)
+            assert False, f"ValueError expected for {timestamp_iso}"
+        except ValueError:
+            pass
+
+
+def test_query_plan_is_reused_until_invalidated():
+    service = GCPService(service="gce_instance", featureSet="default", gcpMonitoringFilter="resource.labels.zone = x",
+                         dimensions=[{"key": "instance_id", "value": "label:resource.labels.instance_id"}],
+                         metrics=[{"key": "cloud.gcp.m1", "value": "metric:compute.googleapis.com/instance/cpu/usage_time",
+                                   "type": "count", "gcpOptions": {"metricKind": "CUMULATIVE", "valueType": "DOUBLE"},
+                                   "dimensions": [{"key": "state"}]}])
+    metric = service.metrics[0]
+    cache = QueryPlanCache()
+
+    plan = cache.get(service, metric)
+
+    assert cache.get(service, metric) is plan
+    assert plan.api == "compute.googleapis.com"
+    assert plan.entity_id_label_keys == ("instance_id",)
+    assert plan.params(datetime(2023, 1, 1, 10), datetime(2023, 1, 1, 10, 1)) == [
+        ('filter', 'metric.type = "compute.googleapis.com/instance/cpu/usage_time" resource.labels.zone = x'),
+        ('interval.startTime', '2023-01-01T10:00:00Z'),
+        ('interval.endTime', '2023-01-01T10:01:00Z'),
+        ('aggregation.alignmentPeriod', '60.0s'),
+        ('aggregation.perSeriesAligner', 'ALIGN_DELTA'),
+        ('aggregation.crossSeriesReducer', 'REDUCE_SUM'),
+        ('aggregation.groupByFields', 'resource.labels.instance_id'),
+        ('aggregation.groupByFields', 'metric.labels.state'),
+    ]
+    assert plan.dt_dimensions_mapping.get_dt_dimensions("metric.labels.state", "state") == ("state",)
+    assert plan.dt_dimensions_mapping.get_dt_dimensions("metric.labels.other", "other") == ("other",)
+
+    cache.invalidate()
+
+    assert len(cache) == 0
+    assert cache.get(service, metric) is not plan
+
+
+def _api_service() -> GCPService:
+    metric_options = {"metricKind": "GAUGE", "valueType": "INT64"}
+    return GCPService(service="api", featureSet="default",
+                      dimensions=[{"key": "service", "value": "label:resource.labels.service"}],
+                      metrics=[
+                          {"key": "cloud.gcp.m1", "value": "metric:serviceruntime.googleapis.com/api/m1", "type": "gauge", "gcpOptions": metric_options},
+                          {"key": "cloud.gcp.m2", "value": "metric:serviceruntime.googleapis.com/api/m2", "type": "gauge", "gcpOptions": metric_options},
+                          {"key": "cloud.gcp.m3", "value": "metric:serviceruntime.googleapis.com/api/m3", "type": "gauge",
+                           "gcpOptions": {**metric_options, "metricKind": "CUMULATIVE"}},
+                          {"key": "cloud.gcp.m4", "value": "metric:serviceruntime.googleapis.com/api/m4", "type": "gauge", "gcpOptions": metric_options},
+                      ])
+
+
+class FakeTimeSeriesResponse:
+    def __init__(self, page, status=200):
+        self.page = page
+        self.status = status
+
+    async def json(self):
+        return self.page
+
+
+class FakeGcpSession:
+    def __init__(self, page, status=200):
+        self.page = page
+        self.status = status
+        self.requests = []
+
+    async def request(self, method, url, params, headers):
+        self.requests.append(params)
+        return FakeTimeSeriesResponse(self.page, self.status)
+
+
+def test_monitored_projects_are_split_into_partition_filters():
+    project_filters = project_partition_filters(["project-c", "project-a", "project-b"], 2)
+
+    assert project_filters == ['resource.labels.project_id = one_of("project-a","project-c")',
+                               'resource.labels.project_id = one_of("project-b")']
+    assert project_partition_filters(["project-a"], 4) == ['resource.labels.project_id = one_of("project-a")']
+
+
+def test_single_partition_has_no_project_filter():
+    assert project_partition_filters(["project-a", "project-b"], 1) == [""]
+
+
+def test_partitions_are_added_for_large_list_of_projects():
+    projects_ids = [f"project-{i:04d}" for i in range(1050)]
+
+    project_filters = project_partition_filters(projects_ids, 4)
+
+    assert len(project_filters) == 11
+    filtered_projects_ids = [project_filter[len('resource.labels.project_id = one_of('):-1].split(",")
+                             for project_filter in project_filters]
+    assert max(len(partition) for partition in filtered_projects_ids) <= MAX_PROJECTS_PER_PARTITION
+    assert sorted(project_id.strip('"') for partition in filtered_projects_ids for project_id in partition) == projects_ids
+
+
+def test_project_filter_is_appended_to_metric_filter():
+    service = _api_service()
+    gcp_session = FakeGcpSession({})
+    context = MetricsContext(gcp_session, None, "", "", datetime.utcnow(), 60, "", "", False, False, None)
+
+    asyncio.run(fetch_metric(context, "scoping-project", service, service.metrics[0],
+                             'resource.labels.project_id = one_of("project-a")'))
+
+    assert gcp_session.requests[0][0] == ('filter', 'metric.type = "serviceruntime.googleapis.com/api/m1" '
+                                                    'resource.labels.project_id = one_of("project-a")')
+
+
+def test_query_plans_are_reused_after_unchanged_configuration_is_reparsed():
+    cache = QueryPlanCache()
+    services = [_api_service()]
+    first_polling_plans = [cache.get(services[0], metric) for metric in services[0].metrics]
+
+    # configuration refresh re-parses the same extensions into new objects
+    new_services = [_api_service()]
+    cache.refresh(services, new_services)
+
+    assert new_services[0] is not services[0]
+    assert [cache.get(new_services[0], metric) for metric in new_services[0].metrics] == first_polling_plans
+    assert len(cache) == len(first_polling_plans)
+
+
+def test_query_plans_are_dropped_after_configuration_changes():
+    cache = QueryPlanCache()
+    services = [_api_service()]
+    plan = cache.get(services[0], services[0].metrics[0])
+
+    changed_service = GCPService(service="api", featureSet="default", metrics=[])
+    cache.refresh(services, [changed_service])
+
+    assert len(cache) == 0
+    assert cache.get(services[0], services[0].metrics[0]) is not plan
+
+
+def test_access_token_is_invalidated_when_rejected():
+    service = _api_service()
+    gcp_session = FakeGcpSession({"error": {"code": 401, "status": "UNAUTHENTICATED"}}, status=401)
+    context = MetricsContext(gcp_session, None, "", "", datetime.utcnow(), 60, "", "", False, False, None)
+
+    with mock.patch("lib.metric_ingest.invalidate_gcp_token") as invalidate_mock:
+        with pytest.raises(Exception):
+            asyncio.run(fetch_metric(context, "project", service, service.metrics[0]))
 
+    invalidate_mock.assert_called_once()
@@ -0,0 +1,241 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import asyncio
+from datetime import datetime, timedelta
+from unittest import mock
+
+import main
+from lib.context import MetricsContext, LoggingContext
+from lib.metrics import GCPService, IngestLine, IngestSeries
+from lib.polling_checkpoint import PollingCheckpoint, PendingFetch
+from lib.watermark_store import WatermarkStore
+
+service = GCPService(service="service", metrics=[{"value": "metric:api.googleapis.com/m1"},
+                                                 {"value": "metric:api.googleapis.com/m2"}])
+execution_time = datetime(2023, 1, 1, 10, 0)
+requested_execution_times = []
+requested_page_tokens = []
+
+
+async def fake_pages(context, project_id, svc, metric, project_filter="", execution_time=None, start_time=None,
+                     page_token=None, on_page=None):
+    requested_execution_times.append(execution_time)
+    requested_page_tokens.append(page_token)
+    if metric.google_metric.endswith("m2"):
+        await asyncio.Event().wait()
+    if on_page is not None:
+        on_page(None)
+    yield [IngestLine(IngestSeries(f"{metric.google_metric}-{i}", "m", "gauge", []), 1, 1) for i in range(7)]
+
+
+async def fake_two_pages_with_second_hanging(context, project_id, svc, metric, project_filter="", execution_time=None,
+                                             start_time=None, page_token=None, on_page=None):
+    requested_page_tokens.append(page_token)
+    on_page("page-2")
+    yield [IngestLine(IngestSeries(f"{metric.google_metric}-{i}", "m", "gauge", []), 1, 1) for i in range(7)]
+    await asyncio.Event().wait()
+
+
+def create_line(entity_id: str = "e") -> IngestLine:
+    return IngestLine(IngestSeries(entity_id, "m", "gauge", []), 1, 1)
+
+
+def test_interrupted_polling_keeps_fetched_lines_and_unfinished_fetches():
+    checkpoint = PollingCheckpoint()
+    context = MetricsContext(None, None, "", "", execution_time, 0, "", "", False, False, None)
+    requested_execution_times.clear()
+
+    with mock.patch("main.polling_checkpoint", new=checkpoint), \
+            mock.patch("main.fetch_metric_pages", new=fake_pages), \
+            mock.patch("main.topology_cache.fetch_topology", return_value=({}, {})):
+        checkpoint.start_polling(execution_time)
+        try:
+            asyncio.run(asyncio.wait_for(main.fetch_ingest_lines_task(context, "project", [service], set()), 0.1))
+        except asyncio.TimeoutError:
+            pass
+
+        interrupted = checkpoint.interrupt()
+
+        assert [(project_id, len(lines)) for project_id, lines in interrupted.unpushed_lines] == [("project", 7)]
+        assert [fetch.metric.google_metric for fetch in interrupted.fetched] == ["api.googleapis.com/m1"]
+        assert interrupted.carried_fetches_count == 1
+        assert [fetch.metric.google_metric for fetch in checkpoint.carried_fetches] == ["api.googleapis.com/m2"]
+
+        next_context = MetricsContext(None, None, "", "", execution_time + timedelta(minutes=3), 0, "", "", False, False, None)
+        checkpoint.start_polling(next_context.execution_time)
+        fetches = main.prepare_fetches(next_context, "project", [(service, service.metrics[0])], [""])
+
+    assert [(fetch.metric.google_metric, fetch.execution_time) for fetch in fetches] == [
+        ("api.googleapis.com/m2", execution_time),
+        ("api.googleapis.com/m1", execution_time + timedelta(minutes=3)),
+    ]
+    assert checkpoint.carried_fetches == []
+
+
+def test_carried_fetches_are_repeated_only_without_watermark(tmp_path):
+    checkpoint = PollingCheckpoint()
+    watermarks = WatermarkStore(str(tmp_path / "watermarks.bin"), timedelta(minutes=60))
+    context = MetricsContext(None, None, "", "", execution_time, 0, "", "", False, False, None)
+    fetched = PendingFetch("project", service, service.metrics[0], "", execution_time)
+    never_fetched = PendingFetch("project", service, service.metrics[1], "", execution_time)
+    watermarks.advance(main._watermark_key(fetched), execution_time - timedelta(minutes=5))
+    checkpoint.carried_fetches = [fetched, never_fetched]
+
+    with mock.patch("main.polling_checkpoint", new=checkpoint), mock.patch("main.metric_watermarks", new=watermarks):
+        fetches = main.prepare_fetches(context, "project", [], [""])
+
+    # gap of the fetch with watermark is closed by resuming from it, the other one has to be repeated
+    assert fetches == [never_fetched]
+
+
+def test_watermark_key_does_not_change_with_projects_of_partition():
+    context = MetricsContext(None, None, "", "", execution_time, 0, "", "", False, False, None)
+    metrics_to_fetch = [(service, service.metrics[0])]
+
+    project_filters = main.project_partition_filters(["project-a", "project-b", "project-c"], 2)
+    project_filters_with_added_project = main.project_partition_filters(
+        ["project-a", "project-b", "project-c", "project-d"], 2)
+
+    with mock.patch("main.polling_checkpoint", new=PollingCheckpoint()):
+        fetches = main.prepare_fetches(context, "scoping", metrics_to_fetch, project_filters)
+        fetches_with_added_project = main.prepare_fetches(context, "scoping", metrics_to_fetch,
+                                                          project_filters_with_added_project)
+
+    assert [main._watermark_key(fetch) for fetch in fetches] == \
+           [main._watermark_key(fetch) for fetch in fetches_with_added_project]
+    assert len({main._watermark_key(fetch) for fetch in fetches}) == 2
+
+
+def test_partially_delivered_fetch_is_resumed_from_next_page():
+    checkpoint = PollingCheckpoint()
+    context = MetricsContext(None, None, "", "", execution_time, 60, "", "", False, False, None)
+    context.metric_ingest_batch_size = 100
+    requested_page_tokens.clear()
+
+    with mock.patch("main.polling_checkpoint", new=checkpoint), \
+            mock.patch("lib.metric_ingest.polling_checkpoint", new=checkpoint), \
+            mock.patch("main.fetch_metric_pages", new=fake_two_pages_with_second_hanging), \
+            mock.patch("main.topology_cache.fetch_topology", return_value=({}, {})):
+        checkpoint.start_polling(execution_time)
+        try:
+            asyncio.run(asyncio.wait_for(main.stream_project_metrics(context, "project", [service], set()), 0.1))
+        except asyncio.TimeoutError:
+            pass
+
+        interrupted = checkpoint.interrupt()
+
+        # first pages of both fetches are pending for the push, the rest of them is fetched in next polling
+        assert [(project_id, len(lines)) for project_id, lines in interrupted.unpushed_lines] == [("project", 14)]
+        assert interrupted.carried_fetches_count == 2
+        window_start = execution_time - service.metrics[0].ingest_delay - timedelta(minutes=1)
+        assert [(fetch.page_token, fetch.start_time) for fetch in checkpoint.carried_fetches] == \
+               [("page-2", window_start), ("page-2", window_start)]
+
+        checkpoint.start_polling(execution_time + timedelta(minutes=1))
+        resumed_fetch = checkpoint.take_carried_fetches("project")[0]
+        requested_page_tokens.clear()
+        asyncio.run(main.run_fetch_pages(context, resumed_fetch, []).__anext__())
+
+    assert requested_page_tokens == ["page-2"]
+    assert main._fetch_start_time(context, resumed_fetch) == window_start
+
+
+def test_batches_being_sent_are_maybe_sent_and_not_pushed_again():
+    checkpoint = PollingCheckpoint()
+    queued_batch = [create_line("queued")]
+    sending_batch = [create_line("sending"), create_line("sending")]
+
+    checkpoint.start_push("project", queued_batch)
+    checkpoint.start_push("project", sending_batch)
+    checkpoint.start_sending(sending_batch)
+    interrupted = checkpoint.interrupt()
+
+    assert interrupted.unpushed_lines == [("project", queued_batch)]
+    assert interrupted.maybe_sent_lines_count == 2
+
+
+def test_batch_is_not_maybe_sent_after_rejected_request():
+    checkpoint = PollingCheckpoint()
+    lines_batch = [create_line()]
+
+    checkpoint.start_push("project", lines_batch)
+    checkpoint.start_sending(lines_batch)
+    # e.g. throttled, the batch waits for retry
+    checkpoint.finish_sending(lines_batch)
+
+    assert checkpoint.interrupt().unpushed_lines == [("project", lines_batch)]
+
+
+def test_pushed_batches_are_not_kept():
+    checkpoint = PollingCheckpoint()
+    lines_batch = [create_line()]
+
+    checkpoint.start_push("project", lines_batch)
+    checkpoint.start_sending(lines_batch)
+    checkpoint.finish_push(lines_batch)
+    interrupted = checkpoint.interrupt()
+
+    assert (interrupted.unpushed_lines, interrupted.maybe_sent_lines_count) == ([], 0)
+
+
+def test_too_old_carried_fetches_are_dropped():
+    checkpoint = PollingCheckpoint()
+    checkpoint.start_fetch(PendingFetch("project", service, service.metrics[0], "", execution_time), execution_time)
+    checkpoint.interrupt()
+
+    checkpoint.start_polling(execution_time + timedelta(hours=2))
+
+    assert checkpoint.take_carried_fetches("project") == []
+
+
+class FakeSession:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+def test_unpushed_lines_of_interrupted_polling_are_pushed_at_timeout(tmp_path):
+    checkpoint = PollingCheckpoint()
+    watermarks = WatermarkStore(str(tmp_path / "watermarks.bin"), timedelta(minutes=60))
+    unpushed_batch = [create_line("unpushed")]
+    sending_batch = [create_line("sending")]
+    fetch = PendingFetch("project", service, service.metrics[0], "", execution_time)
+    end_time = execution_time - service.metrics[0].ingest_delay
+    pushed_batches = []
+
+    async def fake_push(context, project_id, lines_batch):
+        pushed_batches.append((project_id, [line.entity_id for line in lines_batch]))
+
+    checkpoint.start_push("project", unpushed_batch)
+    checkpoint.start_push("project", sending_batch)
+    checkpoint.start_sending(sending_batch)
+    checkpoint.fetched("project").append(fetch)
+
+    with mock.patch("main.polling_checkpoint", new=checkpoint), \
+            mock.patch("lib.metric_ingest.polling_checkpoint", new=checkpoint), \
+            mock.patch("main.metric_watermarks", new=watermarks), \
+            mock.patch("main.init_gcp_client_session", new=FakeSession), \
+            mock.patch("main.init_dt_client_session", new=FakeSession), \
+            mock.patch("main.create_token", new=mock.AsyncMock(return_value="token")), \
+            mock.patch("main.get_project_id_from_environment", return_value="owner"), \
+            mock.patch("main.fetch_dynatrace_api_key", new=mock.AsyncMock(return_value="key")), \
+            mock.patch("main.fetch_dynatrace_url", new=mock.AsyncMock(return_value="https://dynatrace")), \
+            mock.patch("lib.metric_ingest._push_to_dynatrace", new=fake_push):
+        asyncio.run(main.push_interrupted_polling(LoggingContext(None)))
+
+    assert pushed_batches == [("project", ["unpushed"])]
+    # window of the fetch is not fetched again, its lines were pushed
+    assert watermarks.window_start(main._watermark_key(fetch), end_time - timedelta(minutes=1), end_time) is None
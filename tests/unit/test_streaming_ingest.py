@@ -0,0 +1,97 @@
+#   Copyright 2023 Dynatrace LLC
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+import asyncio
+from datetime import datetime, timedelta
+from typing import List
+from unittest import mock
+
+import main
+from lib.context import MetricsContext
+from lib.metrics import GCPService, IngestLine, IngestSeries
+from lib.watermark_store import WatermarkStore
+
+service = GCPService(service="service", metrics=[{"value": "metric:api.googleapis.com/m1"},
+                                                 {"value": "metric:api.googleapis.com/m2"}])
+
+
+def create_context() -> MetricsContext:
+    context = MetricsContext(None, None, "", "", datetime.utcnow(), 0, "", "", False, False, None)
+    context.metric_ingest_batch_size = 10
+    context.metric_ingest_streaming_queue_size = 1
+    return context
+
+
+async def fake_pages(context, project_id, svc, metric, project_filter="", execution_time=None, start_time=None,
+                     page_token=None, on_page=None):
+    for page in range(3):
+        await asyncio.sleep(0)
+        if on_page is not None:
+            on_page(f"page-{page + 1}" if page < 2 else None)
+        yield [IngestLine(IngestSeries(f"{metric.google_metric}-{page}-{i}", "m", "gauge", []), 1, 1) for i in range(7)]
+
+
+@mock.patch("main.topology_cache.fetch_topology")
+@mock.patch("main.fetch_metric_pages", new=fake_pages)
+def test_stream_project_metrics_pushes_full_batches(mock_fetch_topology):
+    mock_fetch_topology.return_value = {}, {}
+    pushed_batches: List[List[IngestLine]] = []
+
+    async def fake_push(context, project_id, lines_batch):
+        pushed_batches.append(lines_batch)
+
+    with mock.patch("lib.metric_ingest._push_to_dynatrace", new=fake_push):
+        asyncio.run(main.stream_project_metrics(create_context(), "project", [service], set()))
+
+    assert [len(batch) for batch in pushed_batches] == [10, 10, 10, 10, 2]
+    pushed_ids = {line.entity_id for batch in pushed_batches for line in batch}
+    assert len(pushed_ids) == 2 * 3 * 7
+
+
+@mock.patch("main.topology_cache.fetch_topology")
+@mock.patch("main.fetch_metric_pages", new=fake_pages)
+def test_stream_project_metrics_failed_push_does_not_block_fetching(mock_fetch_topology):
+    mock_fetch_topology.return_value = {}, {}
+
+    async def failing_push(context, project_id, lines_batch):
+        raise Exception("Push failed")
+
+    with mock.patch("lib.metric_ingest._push_to_dynatrace", new=failing_push):
+        asyncio.run(asyncio.wait_for(main.stream_project_metrics(create_context(), "project", [service], set()), 5))
+
+
+@mock.patch("main.topology_cache.fetch_topology")
+@mock.patch("main.fetch_metric_pages", new=fake_pages)
+def test_watermarks_are_advanced_only_after_successful_push(mock_fetch_topology, tmp_path):
+    mock_fetch_topology.return_value = {}, {}
+    watermarks = WatermarkStore(str(tmp_path / "watermarks.bin"), timedelta(minutes=60))
+    context = create_context()
+    end_time = context.execution_time - service.metrics[0].ingest_delay
+    start_time = end_time - timedelta(minutes=1)
+
+    async def failing_push(context, project_id, lines_batch):
+        raise Exception("Push failed")
+
+    async def successful_push(context, project_id, lines_batch):
+        pass
+
+    with mock.patch("main.metric_watermarks", new=watermarks):
+        with mock.patch("lib.metric_ingest._push_to_dynatrace", new=failing_push):
+            asyncio.run(main.stream_project_metrics(context, "project", [service], set()))
+        # window of the lines which were not pushed is fetched again
+        fetches = main.prepare_fetches(context, "project", [(service, service.metrics[0])], [""])
+        assert watermarks.window_start(main._watermark_key(fetches[0]), start_time, end_time) == start_time
+
+        with mock.patch("lib.metric_ingest._push_to_dynatrace", new=successful_push):
+            asyncio.run(main.stream_project_metrics(context, "project", [service], set()))
+        assert watermarks.window_start(main._watermark_key(fetches[0]), start_time, end_time) is None